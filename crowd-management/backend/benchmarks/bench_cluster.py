@@ -0,0 +1,57 @@
+"""
+Throughput benchmark for the sharded deployment (cluster.py)
+
+Start a cluster, then drive it from the backend directory:
+
+    python cluster.py --shards 1 --port 8000 &
+    python -m benchmarks.bench_cluster http://127.0.0.1:8000 [seconds] [concurrency]
+
+Creates a few events with joined participants, then sends heartbeats (and
+an occasional SOS) from many concurrent clients and prints requests per
+second. Rerun against --shards 2, 4, ... to see how it scales with cores.
+"""
+import asyncio
+import random
+import sys
+import time
+
+import httpx
+
+EVENTS = 16
+USERS_PER_EVENT = 50
+
+async def _setup(client: httpx.AsyncClient):
+    users = []
+    for i in range(EVENTS):
+        event = (await client.post("/api/admin/events", json={"name": f"Bench {i}"})).json()
+        for j in range(USERS_PER_EVENT):
+            joined = (await client.post(f"/api/events/{event['id']}/join", json={"name": f"User {i}-{j}"})).json()
+            users.append((event["id"], joined["user_id"]))
+    return users
+
+async def _drive(client: httpx.AsyncClient, users, deadline: float, counts):
+    while time.perf_counter() < deadline:
+        event_id, user_id = random.choice(users)
+        lat, lng = 10.0 + random.random() * 1e-3, 76.0 + random.random() * 1e-3
+        if random.random() < 0.01:
+            response = await client.post("/api/sos/trigger", json={"event_id": event_id, "user_id": user_id,
+                                                                   "user_name": user_id, "lat": lat, "lng": lng})
+        else:
+            response = await client.post(f"/api/events/{event_id}/heartbeat", json={"user_id": user_id, "lat": lat, "lng": lng})
+        counts["ok" if response.status_code == 200 else "failed"] += 1
+
+async def main():
+    base_url = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8000"
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        users = await _setup(client)
+        counts = {"ok": 0, "failed": 0}
+        start = time.perf_counter()
+        await asyncio.gather(*(_drive(client, users, start + seconds, counts) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    print(f"{counts['ok'] / elapsed:,.0f} req/s over {elapsed:.1f}s ({counts['ok']} ok, {counts['failed']} failed, {concurrency} clients)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark: scalar utils.geo helpers vs their NumPy array versions
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_geo [n_points]
+
+Checks that both paths agree on random inputs, then prints per-call timings.
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from utils import geo
+
+def _timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def _polygon(lat: float, lng: float, radius: float, vertices: int):
+    points = []
+    for k in range(vertices):
+        angle = 2 * np.pi * k / vertices
+        r = radius * random.uniform(0.6, 1.0)
+        points.append({"lat": lat + r * np.sin(angle), "lng": lng + r * np.cos(angle)})
+    return points
+
+def main(n: int = 100_000):
+    random.seed(0)
+    rng = np.random.default_rng(0)
+    lat1 = 10 + rng.uniform(-0.05, 0.05, n)
+    lng1 = 20 + rng.uniform(-0.05, 0.05, n)
+    lat2 = 10 + rng.uniform(-0.05, 0.05, n)
+    lng2 = 20 + rng.uniform(-0.05, 0.05, n)
+    distance = rng.uniform(0, 5000, n)
+    bearing = rng.uniform(0, 360, n)
+    polygons = [_polygon(10 + random.uniform(-0.04, 0.04), 20 + random.uniform(-0.04, 0.04), 0.01, 12)
+                for _ in range(20)]
+    polygon = polygons[0]
+
+    l1, g1, l2, g2 = lat1.tolist(), lng1.tolist(), lat2.tolist(), lng2.tolist()
+    cases = [
+        ("haversine",
+         lambda: [geo.haversine(a, b, c, d) for a, b, c, d in zip(l1, g1, l2, g2)],
+         lambda: geo.haversine_array(lat1, lng1, lat2, lng2)),
+        ("calculate_bearing",
+         lambda: [geo.calculate_bearing(a, b, c, d) for a, b, c, d in zip(l1, g1, l2, g2)],
+         lambda: geo.calculate_bearing_array(lat1, lng1, lat2, lng2)),
+        ("get_destination_point",
+         lambda: [geo.get_destination_point(a, b, c, d) for a, b, c, d in zip(l1, g1, distance.tolist(), bearing.tolist())],
+         lambda: geo.get_destination_point_array(lat1, lng1, distance, bearing)),
+        ("is_within_bounds",
+         lambda: [geo.is_within_bounds(a, b, 10, 20, 3000) for a, b in zip(l1, g1)],
+         lambda: geo.is_within_bounds_array(lat1, lng1, 10, 20, 3000)),
+        ("calculate_bounding_box",
+         lambda: [geo.calculate_bounding_box(a, b, 500) for a, b in zip(l1, g1)],
+         lambda: geo.calculate_bounding_box_array(lat1, lng1, 500)),
+        ("is_point_in_polygon",
+         lambda: [geo.is_point_in_polygon(a, b, polygon) for a, b in zip(l1, g1)],
+         lambda: geo.points_in_polygon(lat1, lng1, polygon)),
+        ("is_point_in_polygon x20",
+         lambda: [[geo.is_point_in_polygon(a, b, p) for p in polygons] for a, b in zip(l1, g1)],
+         lambda: geo.points_in_polygons(lat1, lng1, polygons)),
+    ]
+
+    print(f"{'function':<26}{'scalar ms':>12}{'array ms':>12}{'speedup':>10}  match")
+    for name, scalar, array in cases:
+        expected = scalar()
+        got = array()
+        if isinstance(got, tuple):
+            got = np.stack(got, axis=-1)
+        elif isinstance(got, dict):
+            got = np.stack([got[k] for k in expected[0]], axis=-1)
+            expected = [[box[k] for k in box] for box in expected]
+        match = np.array_equal(np.asarray(expected), got) or np.allclose(np.asarray(expected), got, rtol=1e-12, atol=0)
+        scalar_s = _timed(scalar, 1)
+        array_s = _timed(array)
+        print(f"{name:<26}{scalar_s * 1000:>12.1f}{array_s * 1000:>12.2f}{scalar_s / array_s:>9.0f}x  {'ok' if match else 'MISMATCH'}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
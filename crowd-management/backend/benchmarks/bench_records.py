@@ -0,0 +1,55 @@
+"""
+Memory benchmark: plain dicts vs the slotted record types in records.py
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_records [n_records]
+
+Builds n participants, locations and alerts both ways (same field values)
+and prints the bytes allocated per record as measured by tracemalloc.
+"""
+import sys
+import tracemalloc
+from datetime import datetime
+
+from records import Alert, Location, User
+
+def _user(i: int, now: datetime):
+    return dict(id=f"{i:08x}", name=f"Participant {i}", phone=f"+9198{i:08d}", email=None, event_id="ev000001",
+                status="active", check_in_time=now, check_out_time=None, lat=None, lng=None, last_seen=None)
+
+def _alert(i: int, now: datetime):
+    return dict(id=f"{i:08x}", event_id="ev000001", user_id=f"{i:08x}", user_name=f"Participant {i}",
+                lat=10.0 + i * 1e-6, lng=76.0, description="Emergency SOS alert", alert_type="sos",
+                status="active", created_at=now, resolved_at=None, incident_id=f"{i:08x}",
+                repeat_count=1, last_seen_at=now)
+
+def _measure(build, n: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(i) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / n
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    now = datetime.now()
+    # Field values are shared between the two variants so only the container differs
+    users = [_user(i, now) for i in range(n)]
+    alerts = [_alert(i, now) for i in range(n)]
+
+    rows = [
+        ("participant", lambda i: dict(users[i]), lambda i: User(**users[i])),
+        ("location", lambda i: {"lat": 10.0, "lng": 76.0, "timestamp": now}, lambda i: Location(10.0, 76.0, now)),
+        ("alert", lambda i: dict(alerts[i]), lambda i: Alert(**alerts[i])),
+    ]
+    print(f"{n} records each, bytes per record (container only)")
+    for name, as_dict, as_record in rows:
+        dict_bytes = _measure(as_dict, n)
+        record_bytes = _measure(as_record, n)
+        print(f"  {name:12s} dict {dict_bytes:7.1f}   record {record_bytes:7.1f}   saved {1 - record_bytes / dict_bytes:5.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Run the API as several event-sharded processes behind the routing gateway
+
+    python cluster.py --shards 4 --gateway-workers 2 --port 8000
+
+Each shard is its own uvicorn process running main:app on a unix socket,
+with its own storage under <data-dir>/shard-N/ and owning the events whose
+id hashes to it (utils/sharding.py). The gateway (gateway:app) listens on
+the public port and forwards each request to the owning shard, so clients
+see a single API. Everything runs on one box.
+
+Ownership depends on the shard count: restart with the same --shards to
+find the persisted events again.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+def _shard_env(index: int, count: int, data_dir: str) -> Dict[str, str]:
+    shard_dir = os.path.join(data_dir, f"shard-{index}")
+    env = dict(os.environ)
+    env.update(
+        SHARD_INDEX=str(index),
+        SHARD_COUNT=str(count),
+        STORAGE_DB_PATH=os.path.join(shard_dir, "crowd.db"),
+        STORAGE_JOURNAL_DIR=os.path.join(shard_dir, "journal"),
+        ALERT_ARCHIVE_DIR=os.path.join(shard_dir, "alert_archive"),
+        EVENT_ARCHIVE_DIR=os.path.join(shard_dir, "event_archive")
+    )
+    if not env.get("GAZETTEER_PATH"):
+        env["GAZETTEER_PATH"] = os.path.join(shard_dir, "gazetteer.csv")
+    if env.get("GEOCODE_CACHE_PATH"):
+        env["GEOCODE_CACHE_PATH"] = os.path.join(shard_dir, "geocode_cache.json")
+    return env
+
+def _uvicorn(app: str, *options: str, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", app, "--no-access-log", *options], env=env)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run event-sharded API processes behind a routing gateway")
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1, help="shard processes (default: one per core)")
+    parser.add_argument("--gateway-workers", type=int, default=1, help="gateway worker processes")
+    parser.add_argument("--host", default=os.getenv("BACKEND_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("BACKEND_PORT", "8000")))
+    parser.add_argument("--data-dir", default="data", help="parent of the per-shard storage directories")
+    parser.add_argument("--socket-dir", default=tempfile.gettempdir(), help="where the shard sockets are created")
+    args = parser.parse_args()
+
+    sockets = [os.path.join(args.socket_dir, f"crowd-shard-{index}.sock") for index in range(args.shards)]
+    processes: List[subprocess.Popen] = []
+    # Stop the children on SIGTERM as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for index, socket_path in enumerate(sockets):
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            processes.append(_uvicorn("main:app", "--uds", socket_path,
+                                      env=_shard_env(index, args.shards, args.data_dir)))
+        gateway_env = dict(os.environ, SHARD_COUNT=str(args.shards),
+                           SHARD_URLS=",".join(f"unix:{socket_path}" for socket_path in sockets))
+        processes.append(_uvicorn("gateway:app", "--host", args.host, "--port", str(args.port),
+                                  "--workers", str(args.gateway_workers), env=gateway_env))
+        print(f"Gateway on {args.host}:{args.port} -> {args.shards} shards")
+        # A shard without its events is an outage, so one exiting stops the cluster
+        while all(process.poll() is None for process in processes):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Routing gateway for running the API as several event-sharded processes
+
+Stateless: each request is forwarded to the shard process that owns the
+event (or alert) it names, and the few cross-event reads are fanned out to
+every shard and merged. Started by cluster.py, which sets SHARD_URLS;
+being stateless it can itself run with several uvicorn workers.
+"""
+import asyncio
+import itertools
+import json
+import os
+import re
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from utils.sharding import shard_of
+
+# Comma-separated shard addresses, in shard order: "unix:/path/to.sock" or "http://host:port"
+SHARD_URLS = [url.strip() for url in os.getenv("SHARD_URLS", "").split(",") if url.strip()]
+SHARD_TIMEOUT_SECONDS = float(os.getenv("SHARD_TIMEOUT_SECONDS", "30"))
+# Pooled keep-alive connections per shard
+SHARD_MAX_CONNECTIONS = int(os.getenv("SHARD_MAX_CONNECTIONS", "200"))
+
+# Per-connection headers, never forwarded
+HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host"
+}
+
+# State keyed by an id in the path (stats before the generic alert route)
+EVENT_PATH = re.compile(r"^/api/(?:admin/)?events/([^/]+)")
+ALERT_STATS_PATH = re.compile(r"^/api/admin/alerts/stats/([^/]+)")
+ALERT_PATH = re.compile(r"^/api/admin/alerts/([^/]+)")
+# Requests that name their event in the JSON body
+BODY_EVENT_PATHS = {"/api/sos/trigger", "/api/users/join"}
+# Any shard can serve these: event creation (the shard mints an id it owns) and stateless helpers
+ANY_SHARD_PATHS = {("POST", "/api/admin/events")}
+ANY_SHARD_PREFIXES = ("/api/admin/location/",)
+
+def _concat(bodies: List[Any]) -> List[Any]:
+    return [item for body in bodies for item in body]
+
+def _merge_sos(bodies: List[Dict[str, Any]]) -> Dict[str, Any]:
+    alerts = [alert for body in bodies for alert in body["sos_alerts"]]
+    # ISO timestamps sort chronologically as strings
+    alerts.sort(key=lambda alert: alert["created_at"], reverse=True)
+    return {"sos_alerts": alerts}
+
+def _first(bodies: List[Any]) -> Any:
+    return bodies[0]
+
+def _newest_login(bodies: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Each shard answers with its own most recent match; the newest of those wins, as on one process
+    matches = [body for body in bodies if body.get("event_id")]
+    if not matches:
+        return bodies[0]
+    # ISO timestamps sort chronologically as strings
+    return max(matches, key=lambda body: body.get("registered_at") or "")
+
+# Requests answered by every shard (cross-event reads, per-shard copies), with how to merge the answers
+FAN_OUT: Dict[Tuple[str, str], Callable[[List[Any]], Any]] = {
+    ("GET", "/api/events"): _concat,
+    ("GET", "/api/admin/events"): _concat,
+    ("GET", "/api/admin/events/archived"): _concat,
+    ("GET", "/api/sos/active"): _merge_sos,
+    ("POST", "/api/users/login"): _newest_login,
+    # Every shard keeps its own copy of the gazetteer
+    ("POST", "/api/admin/location/gazetteer"): _first
+}
+
+_clients: List[httpx.AsyncClient] = []
+_round_robin = itertools.count()
+
+def _client(url: str) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=SHARD_MAX_CONNECTIONS, max_keepalive_connections=SHARD_MAX_CONNECTIONS)
+    if url.startswith("unix:"):
+        transport = httpx.AsyncHTTPTransport(uds=url[len("unix:"):], limits=limits)
+        url = "http://shard"
+    else:
+        transport = httpx.AsyncHTTPTransport(limits=limits)
+    return httpx.AsyncClient(transport=transport, base_url=url, timeout=SHARD_TIMEOUT_SECONDS)
+
+def route(method: str, path: str, body: Optional[bytes] = None) -> Optional[int]:
+    """Index of the shard that must serve a request, or None if any shard can"""
+    count = len(_clients)
+    match = ALERT_STATS_PATH.match(path) or EVENT_PATH.match(path) or ALERT_PATH.match(path)
+    if match:
+        return shard_of(match.group(1), count)
+    if path in BODY_EVENT_PATHS:
+        try:
+            event_id = json.loads(body or b"{}").get("event_id")
+        except (ValueError, AttributeError):
+            event_id = None
+        # Without an event the request is rejected or stateless, so any shard will do
+        return shard_of(str(event_id), count) if event_id else None
+    if (method, path) in ANY_SHARD_PATHS or path.startswith(ANY_SHARD_PREFIXES):
+        return None
+    # The legacy single-venue state (exits, active users, chat) lives on the first shard
+    return 0
+
+def _request_headers(request: Request) -> List[Tuple[bytes, bytes]]:
+    return [(name, value) for name, value in request.headers.raw if name.decode("latin-1") not in HOP_HEADERS]
+
+def _response_headers(headers: httpx.Headers) -> List[Tuple[bytes, bytes]]:
+    return [(name, value) for name, value in headers.raw if name.decode("latin-1").lower() not in HOP_HEADERS]
+
+def _target(request: Request) -> str:
+    query = request.url.query
+    return f"{request.url.path}?{query}" if query else request.url.path
+
+async def _forward(shard: int, request: Request, body: Optional[bytes]) -> Response:
+    """Proxy a request to one shard, streaming both bodies"""
+    client = _clients[shard]
+    upstream_request = client.build_request(
+        request.method, _target(request),
+        headers=_request_headers(request),
+        content=body if body is not None else request.stream()
+    )
+    try:
+        upstream = await client.send(upstream_request, stream=True)
+    except httpx.TransportError as e:
+        return JSONResponse({"detail": f"Shard {shard} unavailable: {e}"}, status_code=502)
+    response = StreamingResponse(upstream.aiter_raw(), status_code=upstream.status_code,
+                                 background=BackgroundTask(upstream.aclose))
+    response.raw_headers = _response_headers(upstream.headers)
+    return response
+
+async def _fan_out(request: Request, body: bytes, merge: Callable[[List[Any]], Any]) -> Response:
+    """Send a request to every shard and merge the JSON answers"""
+    headers = _request_headers(request)
+    try:
+        answers = await asyncio.gather(*(
+            client.request(request.method, _target(request), headers=headers, content=body)
+            for client in _clients
+        ))
+    except httpx.TransportError as e:
+        return JSONResponse({"detail": f"Shard unavailable: {e}"}, status_code=502)
+    for answer in answers:
+        if answer.status_code >= 400:
+            return Response(answer.content, status_code=answer.status_code,
+                            media_type=answer.headers.get("content-type"))
+    response = JSONResponse(merge([answer.json() for answer in answers]))
+    # Keep the shards' CORS headers (they are the same on every shard)
+    for name, value in answers[0].headers.items():
+        if name.startswith("access-control-") or name == "vary":
+            response.headers[name] = value
+    return response
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open a pooled client per shard"""
+    if not _clients:
+        if not SHARD_URLS:
+            raise RuntimeError("SHARD_URLS is not set (start the cluster with cluster.py)")
+        _clients.extend(_client(url) for url in SHARD_URLS)
+    yield
+    for client in _clients:
+        await client.aclose()
+    _clients.clear()
+
+app = FastAPI(title="Crowd Management Gateway", lifespan=lifespan, openapi_url=None)
+
+@app.get("/health")
+async def health_check():
+    """Healthy once every shard answers its own health check"""
+    async def probe(client: httpx.AsyncClient) -> bool:
+        try:
+            return (await client.get("/health")).status_code == 200
+        except httpx.TransportError:
+            return False
+    shards = await asyncio.gather(*(probe(client) for client in _clients))
+    healthy = all(shards)
+    return JSONResponse({"status": "healthy" if healthy else "degraded", "shards": shards},
+                        status_code=200 if healthy else 503)
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"])
+async def proxy(request: Request):
+    """Forward to the owning shard (or fan out, for cross-event reads)"""
+    method, path = request.method, request.url.path
+    merge = FAN_OUT.get((method, path))
+    if merge is not None and len(_clients) > 1:
+        return await _fan_out(request, await request.body(), merge)
+    # Routing on the body needs it buffered; everything else streams through
+    body = await request.body() if path in BODY_EVENT_PATHS else None
+    shard = route(method, path, body)
+    if shard is None:
+        shard = next(_round_robin) % len(_clients)
+    return await _forward(shard, request, body)
@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -14,13 +15,50 @@ from routes.sos import router as sos_router
 from routes.chat import router as chat_router
 from routes.events import router as events_router
 import storage
+from utils.archive import sweep_resolved_alerts
+from utils import lifecycle, zones
+from utils.gazetteer import gazetteer
+from utils.geocoder import geocoder
+
+# How often background maintenance (alert retention, event archival) runs
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "60"))
+
+async def maintenance_loop():
+    """Periodically archive old resolved alerts and ended events, and count silent attendees out of zones"""
+    # Each sweep runs in a worker thread: they write to disk and wait on event locks
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            archived = await asyncio.to_thread(sweep_resolved_alerts)
+            if archived:
+                print(f"Archived {archived} resolved alerts")
+        except Exception as e:
+            print(f"Alert retention error: {e}")
+        try:
+            await asyncio.to_thread(zones.expire_stale)
+        except Exception as e:
+            print(f"Zone presence error: {e}")
+        try:
+            archived = await asyncio.to_thread(lifecycle.sweep)
+            if archived:
+                print(f"Archived {archived} ended events")
+        except Exception as e:
+            print(f"Event archival error: {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize in-memory storage on startup"""
+    """Initialize storage (restoring from the configured backend) on startup"""
     storage.storage.init_storage()
+    geocoder.start()
+    gazetteer.load()
+    maintenance = asyncio.create_task(maintenance_loop())
     yield
-    # Cleanup on shutdown (if needed)
+    # Cleanup on shutdown
+    maintenance.cancel()
+    # Flush the write-behind queue so no heartbeat positions are lost
+    storage.storage.close()
+    # Close the geocoding connection pool (and save its cache, if configured)
+    await geocoder.close()
 
 app = FastAPI(title="Crowd Management API", lifespan=lifespan)
 
@@ -33,6 +71,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Archived events are loaded back when a request names them
+app.add_middleware(lifecycle.RehydrateMiddleware)
+
 # Include routers
 app.include_router(admin_router, prefix="/api")
 app.include_router(user_router, prefix="/api")
@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Dict, List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 # Pydantic models for data validation
 class EventCreate(BaseModel):
@@ -64,6 +64,7 @@ class POICreate(BaseModel):
     lng: float
     color: Optional[str] = None
     icon: Optional[str] = None
+    capacity: Optional[float] = None  # exits: people per minute
 
 class POI(BaseModel):
     id: str
@@ -90,6 +91,44 @@ POI_TYPES = {
     "first_aid": {"color": "#ff3333", "icon": "⛑️"}
 }
 
+# Venue Graph Models
+class GraphNode(BaseModel):
+    id: str
+    lat: float
+    lng: float
+
+class GraphEdge(BaseModel):
+    # "from" is a Python keyword, so the field is aliased
+    from_node: str = Field(alias="from")
+    to: str
+    length: Optional[float] = None  # metres; straight-line distance when omitted
+    blocked: bool = False
+
+class VenueGraphCreate(BaseModel):
+    nodes: List[GraphNode]
+    edges: List[GraphEdge]
+
+class EdgeClosure(BaseModel):
+    from_node: str = Field(alias="from")
+    to: str
+    blocked: bool = True
+
+# Bulk participant updates
+class BulkStatusUpdate(BaseModel):
+    user_ids: List[str]
+    status: str  # checked_in or checked_out
+
+# Zone Models
+class LatLng(BaseModel):
+    lat: float
+    lng: float
+
+class ZoneCreate(BaseModel):
+    name: str
+    kind: str = "general"  # pit, vip, stage_front, restricted, general
+    polygon: List[LatLng]
+    capacity: Optional[int] = None
+
 # Alert Models
 class SOSAlert(BaseModel):
     id: str
@@ -130,6 +169,7 @@ class UserLoginResponse(BaseModel):
     user_name: str
     event_id: str
     event_name: str
+    registered_at: Optional[datetime] = None  # check-in time of the matched registration
 
 # Heatmap Data
 class HeatmapPoint(BaseModel):
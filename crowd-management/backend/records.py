@@ -0,0 +1,129 @@
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+# Compact record types for the high-volume entities in storage (participants,
+# live locations and alerts). Events and POIs are few and stay plain dicts.
+
+class Record:
+    """
+    Fixed-field record that still reads like the dict it replaces
+
+    Fields live in __slots__, so a record has no per-instance dict and an
+    assignment to an unknown field raises KeyError instead of quietly adding
+    a key. Item access, get/setdefault, `in` and dict(record) behave as they
+    did for dicts; a field that was never set reads as missing, just like an
+    absent key. to_dict() is the serialisation form (JSON, API).
+    Pickling uses the default slot state, which the unpickler sets directly,
+    without the per-field check of __setitem__ (snapshots are trusted input).
+    """
+
+    __slots__ = ()
+    _fields: frozenset = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = frozenset(cls.__slots__)
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            self[name] = value
+
+    def __getitem__(self, name: str) -> Any:
+        if name in self._fields:
+            try:
+                return getattr(self, name)
+            except AttributeError:
+                pass
+        raise KeyError(name)
+
+    def __setitem__(self, name: str, value: Any):
+        if name not in self._fields:
+            raise KeyError(f"{type(self).__name__} has no field {name!r}")
+        setattr(self, name, value)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._fields and hasattr(self, name)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return getattr(self, name, default) if name in self._fields else default
+
+    def setdefault(self, name: str, default: Any = None) -> Any:
+        if name not in self:
+            self[name] = default
+        return self[name]
+
+    def keys(self) -> List[str]:
+        return [name for name in self.__slots__ if hasattr(self, name)]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
+
+    def copy(self):
+        """Shallow copy of the set fields, like dict.copy() (no per-field check: they came from a record)"""
+        clone = type(self).__new__(type(self))
+        for name in self.__slots__:
+            try:
+                object.__setattr__(clone, name, getattr(self, name))
+            except AttributeError:
+                pass
+        return clone
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        record = cls.__new__(cls)
+        for name, value in data.items():
+            record[name] = value
+        return record
+
+    @classmethod
+    def coerce(cls, data):
+        """The record itself, or one built from a dict (e.g. loaded from JSON)"""
+        return data if isinstance(data, cls) else cls.from_dict(data)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Record):
+            return type(self) is type(other) and self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class User(Record):
+    """A participant of an event (storage.event_users[event_id][user_id])"""
+
+    __slots__ = ("id", "name", "phone", "email", "event_id", "status",
+                 "check_in_time", "check_out_time", "lat", "lng", "last_seen")
+
+class Location(Record):
+    """Latest heartbeat position of a participant (storage.event_locations[event_id][user_id])"""
+
+    __slots__ = ("lat", "lng", "timestamp")
+
+    def __init__(self, lat: float, lng: float, timestamp: Optional[datetime] = None):
+        # Positional and explicit: one is built per heartbeat
+        self.lat = lat
+        self.lng = lng
+        self.timestamp = timestamp
+
+class Alert(Record):
+    """An SOS or other alert (storage.event_alerts[event_id])"""
+
+    __slots__ = ("id", "event_id", "user_id", "user_name", "lat", "lng", "description", "alert_type",
+                 "status", "created_at", "resolved_at", "response",
+                 # Set by SOS de-duplication (utils/incidents.py)
+                 "incident_id", "repeat_count", "last_seen_at",
+                 # Set on assignment
+                 "assigned_to", "assigned_name", "assigned_at", "responder")
+
+# Record type per persistence kind (see Storage._restore)
+RECORD_TYPES = {"user": User, "location": Location, "alert": Alert}
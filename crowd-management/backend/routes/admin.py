@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, UploadFile, File
 import storage
 import uuid
 from pydantic import BaseModel
 from typing import Optional, List
 import utils.geo as geo
+from utils import event_locks, poi_index
+from utils.gazetteer import gazetteer
 
 router = APIRouter()
 
@@ -14,11 +16,24 @@ class POIRequest(BaseModel):
     lng: float
     name: Optional[str] = None
     description: Optional[str] = None
+    capacity: Optional[float] = None  # exits: people per minute
 
 class POIUpdateRequest(BaseModel):
     type: Optional[str] = None
     name: Optional[str] = None
     description: Optional[str] = None
+    capacity: Optional[float] = None
+
+class ReverseGeocodePoint(BaseModel):
+    lat: float
+    lng: float
+    id: Optional[str] = None  # echoed back, e.g. an alert id
+
+class ReverseGeocodeBatchRequest(BaseModel):
+    points: List[ReverseGeocodePoint]
+    precision_m: Optional[float] = None  # grid cell size; default REVERSE_GEOCODE_PRECISION_METERS
+
+MAX_REVERSE_GEOCODE_POINTS = 5000
 
 # POI type configuration
 POI_TYPES = {
@@ -28,6 +43,11 @@ POI_TYPES = {
     "parking": {"color": "blue", "icon": "🅿️", "label": "Parking Area"}
 }
 
+def _check_capacity(capacity: Optional[float]):
+    """Exit throughput feeds evacuation planning, so it must be a positive number"""
+    if capacity is not None and (not math.isfinite(capacity) or capacity <= 0):
+        raise HTTPException(status_code=400, detail="capacity must be a positive number (people per minute)")
+
 # Existing endpoints
 @router.post("/admin/location")
 def set_location(data: dict):
@@ -45,6 +65,7 @@ def add_exit(data: dict):
     exit_id = str(uuid.uuid4())[:8]
     new_exit = {"id": exit_id, "lat": data["lat"], "lng": data["lng"]}
     storage.storage.exit_points.append(new_exit)
+    poi_index.exit_point_index.invalidate()
     return {"status": "ok", "exit": new_exit}
 
 @router.post("/admin/exits/bulk")
@@ -58,6 +79,7 @@ def set_exits_bulk(data: dict):
             "lat": exit_data["lat"],
             "lng": exit_data["lng"]
         })
+    poi_index.exit_point_index.invalidate()
     return {"status": "ok", "exits": storage.storage.exit_points}
 
 @router.get("/locations")
@@ -74,10 +96,11 @@ def get_event_pois(eventId: str):
     
     Returns list of POIs with their types, locations, and details
     """
-    if eventId not in storage.storage.event_pois:
+    event_pois = storage.storage.event_pois.get(eventId)
+    if event_pois is None:
         return {"event_id": eventId, "pois": []}
     
-    pois = list(storage.storage.event_pois[eventId].values())
+    pois = list(event_pois.values())
     return {
         "event_id": eventId,
         "count": len(pois),
@@ -105,24 +128,29 @@ def add_event_poi(eventId: str, data: POIRequest):
     is_valid, error_msg = geo.validate_coordinates(data.lat, data.lng)
     if not is_valid:
         raise HTTPException(status_code=400, detail=error_msg)
+    _check_capacity(data.capacity)
     
-    # Initialize event POIs if needed
-    if eventId not in storage.storage.event_pois:
-        storage.storage.event_pois[eventId] = {}
-    
-    # Create POI
-    poi_id = str(uuid.uuid4())[:8]
-    poi = {
-        "id": poi_id,
-        "type": data.type,
-        "lat": data.lat,
-        "lng": data.lng,
-        "name": data.name or f"{POI_TYPES[data.type]['label']} {len(storage.storage.event_pois[eventId]) + 1}",
-        "description": data.description or "",
-        "created_at": str(datetime.now())
-    }
-    
-    storage.storage.event_pois[eventId][poi_id] = poi
+    with event_locks.lock_for(eventId):
+        # Initialize event POIs if needed
+        if eventId not in storage.storage.event_pois:
+            storage.storage.event_pois[eventId] = {}
+        
+        # Create POI
+        poi_id = str(uuid.uuid4())[:8]
+        poi = {
+            "id": poi_id,
+            "type": data.type,
+            "lat": data.lat,
+            "lng": data.lng,
+            "name": data.name or f"{POI_TYPES[data.type]['label']} {len(storage.storage.event_pois[eventId]) + 1}",
+            "description": data.description or "",
+            "capacity": data.capacity,
+            "created_at": str(datetime.now())
+        }
+        
+        storage.storage.event_pois[eventId][poi_id] = poi
+        storage.storage.persist("poi", eventId, poi_id, poi)
+        poi_index.pois_changed(eventId, poi["type"])
     
     return {
         "status": "ok",
@@ -138,27 +166,35 @@ def update_event_poi(eventId: str, poiId: str, data: POIUpdateRequest):
     - Can update type, name, and/or description
     - Cannot update coordinates (delete and recreate instead)
     """
-    if eventId not in storage.storage.event_pois or poiId not in storage.storage.event_pois[eventId]:
-        raise HTTPException(status_code=404, detail="POI not found")
-    
-    poi = storage.storage.event_pois[eventId][poiId]
-    
-    # Update fields if provided
-    if data.type is not None:
-        if data.type not in POI_TYPES:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid POI type. Must be one of: {', '.join(POI_TYPES.keys())}"
-            )
-        poi["type"] = data.type
-    
-    if data.name is not None:
-        poi["name"] = data.name
-    
-    if data.description is not None:
-        poi["description"] = data.description
-    
-    poi["updated_at"] = str(datetime.now())
+    with event_locks.lock_for(eventId):
+        if eventId not in storage.storage.event_pois or poiId not in storage.storage.event_pois[eventId]:
+            raise HTTPException(status_code=404, detail="POI not found")
+        
+        poi = storage.storage.event_pois[eventId][poiId]
+        previous_type = poi["type"]
+        
+        # Update fields if provided
+        if data.type is not None:
+            if data.type not in POI_TYPES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid POI type. Must be one of: {', '.join(POI_TYPES.keys())}"
+                )
+            poi["type"] = data.type
+        
+        if data.name is not None:
+            poi["name"] = data.name
+        
+        if data.description is not None:
+            poi["description"] = data.description
+        
+        if data.capacity is not None:
+            _check_capacity(data.capacity)
+            poi["capacity"] = data.capacity
+        
+        poi["updated_at"] = str(datetime.now())
+        storage.storage.persist("poi", eventId, poiId, poi)
+        poi_index.pois_changed(eventId, previous_type, poi["type"])
     
     return {
         "status": "ok",
@@ -171,14 +207,17 @@ def delete_event_poi(eventId: str, poiId: str):
     """
     Delete a POI from an event
     """
-    if eventId not in storage.storage.event_pois or poiId not in storage.storage.event_pois[eventId]:
-        raise HTTPException(status_code=404, detail="POI not found")
-    
-    deleted_poi = storage.storage.event_pois[eventId].pop(poiId)
-    
-    # Clean up empty event
-    if not storage.storage.event_pois[eventId]:
-        del storage.storage.event_pois[eventId]
+    with event_locks.lock_for(eventId):
+        if eventId not in storage.storage.event_pois or poiId not in storage.storage.event_pois[eventId]:
+            raise HTTPException(status_code=404, detail="POI not found")
+        
+        deleted_poi = storage.storage.event_pois[eventId].pop(poiId)
+        storage.storage.forget("poi", eventId, poiId)
+        
+        # Clean up empty event
+        if not storage.storage.event_pois[eventId]:
+            del storage.storage.event_pois[eventId]
+        poi_index.pois_changed(eventId, deleted_poi["type"])
     
     return {
         "status": "ok",
@@ -190,11 +229,14 @@ def delete_all_event_pois(eventId: str):
     """
     Delete all POIs from an event
     """
-    if eventId in storage.storage.event_pois:
-        count = len(storage.storage.event_pois[eventId])
-        del storage.storage.event_pois[eventId]
-    else:
-        count = 0
+    with event_locks.lock_for(eventId):
+        if eventId in storage.storage.event_pois:
+            count = len(storage.storage.event_pois[eventId])
+            storage.storage.forget_many("poi", eventId, list(storage.storage.event_pois[eventId]))
+            del storage.storage.event_pois[eventId]
+            poi_index.pois_changed(eventId)
+        else:
+            count = 0
     
     return {
         "status": "ok",
@@ -227,6 +269,24 @@ async def search_locations(request: dict):
         "results": results
     }
 
+@router.post("/admin/location/gazetteer")
+def import_gazetteer(file: UploadFile = File(...)):
+    """
+    Replace the offline gazetteer with a CSV of places (columns: name, lat, lng,
+    optional id, importance or population, type, class, display_name, alt_names)
+    
+    Location search answers from it before asking Nominatim.
+    """
+    try:
+        return {"status": "ok", **gazetteer.import_places(file.file)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/admin/location/gazetteer")
+def get_gazetteer_stats():
+    """Size of the offline gazetteer"""
+    return gazetteer.stats()
+
 @router.post("/admin/location/geocode")
 async def geocode_address(request: dict):
     """Convert an address to latitude/longitude coordinates"""
@@ -251,6 +311,42 @@ async def geocode_address(request: dict):
     else:
         raise HTTPException(status_code=404, detail="Could not geocode address")
 
+@router.post("/admin/location/reverse-geocode/batch")
+async def reverse_geocode_batch(data: ReverseGeocodeBatchRequest):
+    """
+    Label many points (e.g. alert locations) with addresses
+    
+    Points are grouped into grid cells precision_m wide and each cell is
+    looked up once, so a crowd of nearby points costs a handful of lookups.
+    """
+    if len(data.points) > MAX_REVERSE_GEOCODE_POINTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_REVERSE_GEOCODE_POINTS} points per request")
+    if data.precision_m is not None and data.precision_m < 0:
+        raise HTTPException(status_code=400, detail="precision_m must not be negative")
+    for index, point in enumerate(data.points):
+        is_valid, error_msg = geo.validate_coordinates(point.lat, point.lng)
+        if not is_valid:
+            raise HTTPException(status_code=400, detail=f"Point {index}: {error_msg}")
+    
+    results, cells = await geo.reverse_geocode_many([(point.lat, point.lng) for point in data.points], data.precision_m)
+    
+    return {
+        "count": len(data.points),
+        "cells": cells,
+        "precision_m": data.precision_m if data.precision_m is not None else geo.REVERSE_GEOCODE_PRECISION_METERS,
+        "results": [
+            {
+                "id": point.id,
+                "lat": point.lat,
+                "lng": point.lng,
+                "found": result is not None,
+                "display_name": result["display_name"] if result else None,
+                "address_details": result["address"] if result else {}
+            }
+            for point, result in zip(data.points, results)
+        ]
+    }
+
 @router.post("/admin/location/validate")
 def validate_location(request: dict):
     """Validate latitude and longitude coordinates"""
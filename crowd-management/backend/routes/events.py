@@ -1,23 +1,37 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, UploadFile, File
 import storage
 import uuid
+import math
 from datetime import datetime, timedelta
+from typing import Dict, Optional
+from pydantic import BaseModel
 from models import (
     EventCreate, EventUpdate, Event, EventUser, UserLocation,
     POICreate, POI, POI_TYPES,
     SOSAlert, AlertUpdate,
     UserJoinRequest, UserJoinResponse, UserLoginRequest, UserLoginResponse,
-    HeatmapData, HeatmapPoint
+    HeatmapData, HeatmapPoint,
+    VenueGraphCreate, EdgeClosure, ZoneCreate, BulkStatusUpdate
 )
+from records import User, Location, Alert
+from utils.alert_stats import stats_for
+from utils import incidents, dispatch, poi_index, poi_raster, evacuation, evacuation_plan, venue_graph, zones, login_index, participants, event_counters, event_locks, sharding, lifecycle
+from utils.bulk_import import import_participants
+from utils.alert_query import page_alerts
+from utils.archive import forget_global_alerts, note_resolved
 
 router = APIRouter()
 
+# Upper bound on k for nearest-POI queries
+MAX_NEAREST_POIS = 20
+MAX_BULK_STATUS_IDS = 10000
+
 # ============= EVENT CRUD =============
 
 @router.post("/admin/events")
 def create_event(data: EventCreate):
     """Create a new event"""
-    event_id = str(uuid.uuid4())[:8]
+    event_id = sharding.new_id()
     now = datetime.now()
     new_event = {
         "id": event_id,
@@ -32,11 +46,13 @@ def create_event(data: EventCreate):
         "created_at": now,
         "active_users": 0
     }
-    storage.storage.events[event_id] = new_event
     storage.storage.event_users[event_id] = {}
     storage.storage.event_locations[event_id] = {}
     storage.storage.event_pois[event_id] = {}
     storage.storage.event_alerts[event_id] = []
+    storage.storage.persist("event", event_id, event_id, new_event)
+    # Published last, so a handler that finds the event also finds its containers
+    storage.storage.events[event_id] = new_event
     return new_event
 
 @router.get("/admin/events")
@@ -44,60 +60,69 @@ def get_events():
     """Get all events"""
     events = list(storage.storage.events.values())
     for event in events:
-        event_id = event["id"]
-        event["active_users"] = len(storage.storage.event_users.get(event_id, {}))
+        counts = event_counters.counters_for(event["id"]).snapshot()
+        event["active_users"] = counts["registered"]
+        event["checked_in"] = counts["checked_in"]
+        event["on_site"] = counts["on_site"]
+        event["lifecycle"] = lifecycle.state_of(event)
     return events
 
+@router.get("/admin/events/archived")
+def get_archived_events():
+    """Summaries of archived events (not resident; opening one rehydrates it)"""
+    return lifecycle.event_archive.summaries()
+
 @router.get("/admin/events/{event_id}")
 def get_event(event_id: str):
     """Get event details"""
     if event_id not in storage.storage.events:
         raise HTTPException(status_code=404, detail="Event not found")
     event = storage.storage.events[event_id]
-    event["active_users"] = len(storage.storage.event_users.get(event_id, {}))
+    counts = event_counters.counters_for(event_id).snapshot()
+    event["active_users"] = counts["registered"]
+    event["checked_in"] = counts["checked_in"]
+    event["on_site"] = counts["on_site"]
     return event
 
 @router.put("/admin/events/{event_id}")
 def update_event(event_id: str, data: EventUpdate):
     """Update event"""
-    if event_id not in storage.storage.events:
-        raise HTTPException(status_code=404, detail="Event not found")
-    
-    event = storage.storage.events[event_id]
-    if data.name is not None:
-        event["name"] = data.name
-    if data.description is not None:
-        event["description"] = data.description
-    if data.city is not None:
-        event["city"] = data.city
-    if data.start_date is not None:
-        event["start_date"] = data.start_date
-    if data.end_date is not None:
-        event["end_date"] = data.end_date
-    if data.max_capacity is not None:
-        event["max_capacity"] = data.max_capacity
-    if data.lat is not None:
-        event["lat"] = data.lat
-    if data.lng is not None:
-        event["lng"] = data.lng
+    with event_locks.lock_for(event_id):
+        if event_id not in storage.storage.events:
+            raise HTTPException(status_code=404, detail="Event not found")
+        
+        event = storage.storage.events[event_id]
+        if data.name is not None:
+            event["name"] = data.name
+        if data.description is not None:
+            event["description"] = data.description
+        if data.city is not None:
+            event["city"] = data.city
+        if data.start_date is not None:
+            event["start_date"] = data.start_date
+        if data.end_date is not None:
+            event["end_date"] = data.end_date
+        if data.max_capacity is not None:
+            event["max_capacity"] = data.max_capacity
+        if data.lat is not None:
+            event["lat"] = data.lat
+        if data.lng is not None:
+            event["lng"] = data.lng
+        storage.storage.persist("event", event_id, event_id, event)
     
     return event
 
 @router.delete("/admin/events/{event_id}")
 def delete_event(event_id: str):
     """Delete an event and all its data"""
-    if event_id not in storage.storage.events:
-        raise HTTPException(status_code=404, detail="Event not found")
-    
-    del storage.storage.events[event_id]
-    if event_id in storage.storage.event_users:
-        del storage.storage.event_users[event_id]
-    if event_id in storage.storage.event_locations:
-        del storage.storage.event_locations[event_id]
-    if event_id in storage.storage.event_pois:
-        del storage.storage.event_pois[event_id]
-    if event_id in storage.storage.event_alerts:
-        del storage.storage.event_alerts[event_id]
+    with event_locks.lock_for(event_id):
+        if event_id not in storage.storage.events:
+            raise HTTPException(status_code=404, detail="Event not found")
+        
+        lifecycle.evict(event_id)
+        storage.storage.forget_event(event_id)
+        lifecycle.event_archive.remove(event_id)
+    event_locks.drop(event_id)
     
     return {"status": "ok", "message": "Event deleted"}
 
@@ -133,95 +158,328 @@ def create_poi(event_id: str, data: POICreate):
         "lng": data.lng,
         "color": data.color or type_info["color"],
         "icon": data.icon or type_info["icon"],
+        "capacity": data.capacity,
         "created_at": now
     }
     
-    if event_id not in storage.storage.event_pois:
-        storage.storage.event_pois[event_id] = {}
-    storage.storage.event_pois[event_id][poi_id] = new_poi
+    with event_locks.lock_for(event_id):
+        if event_id not in storage.storage.events:
+            raise HTTPException(status_code=404, detail="Event not found")
+        storage.storage.event_pois.setdefault(event_id, {})[poi_id] = new_poi
+        storage.storage.persist("poi", event_id, poi_id, new_poi)
+        poi_index.pois_changed(event_id, new_poi["type"])
     
     return new_poi
 
 @router.put("/admin/events/{event_id}/poi/{poi_id}")
 def update_poi(event_id: str, poi_id: str, data: POICreate):
     """Update a POI"""
-    if event_id not in storage.storage.events:
-        raise HTTPException(status_code=404, detail="Event not found")
-    if poi_id not in storage.storage.event_pois.get(event_id, {}):
-        raise HTTPException(status_code=404, detail="POI not found")
-    
-    poi = storage.storage.event_pois[event_id][poi_id]
-    poi["name"] = data.name
-    poi["type"] = data.type
-    poi["lat"] = data.lat
-    poi["lng"] = data.lng
-    
-    type_info = POI_TYPES.get(data.type, {"color": "#888888", "icon": "📍"})
-    poi["color"] = data.color or type_info["color"]
-    poi["icon"] = data.icon or type_info["icon"]
+    with event_locks.lock_for(event_id):
+        if event_id not in storage.storage.events:
+            raise HTTPException(status_code=404, detail="Event not found")
+        if poi_id not in storage.storage.event_pois.get(event_id, {}):
+            raise HTTPException(status_code=404, detail="POI not found")
+        
+        poi = storage.storage.event_pois[event_id][poi_id]
+        previous_type = poi["type"]
+        poi["name"] = data.name
+        poi["type"] = data.type
+        poi["lat"] = data.lat
+        poi["lng"] = data.lng
+        
+        type_info = POI_TYPES.get(data.type, {"color": "#888888", "icon": "📍"})
+        poi["color"] = data.color or type_info["color"]
+        poi["icon"] = data.icon or type_info["icon"]
+        poi["capacity"] = data.capacity
+        storage.storage.persist("poi", event_id, poi_id, poi)
+        poi_index.pois_changed(event_id, previous_type, poi["type"])
     
     return poi
 
 @router.delete("/admin/events/{event_id}/poi/{poi_id}")
 def delete_poi(event_id: str, poi_id: str):
     """Delete a POI"""
+    with event_locks.lock_for(event_id):
+        if event_id not in storage.storage.events:
+            raise HTTPException(status_code=404, detail="Event not found")
+        if poi_id not in storage.storage.event_pois.get(event_id, {}):
+            raise HTTPException(status_code=404, detail="POI not found")
+        
+        deleted_poi = storage.storage.event_pois[event_id].pop(poi_id)
+        storage.storage.forget("poi", event_id, poi_id)
+        poi_index.pois_changed(event_id, deleted_poi["type"])
+    return {"status": "ok", "message": "POI deleted"}
+
+@router.get("/events/{event_id}/poi/nearest")
+def get_nearest_pois(event_id: str, lat: float, lng: float, type: Optional[str] = None, k: int = 1):
+    """Get the k nearest POIs to a location, optionally of one type (e.g. toilet, exit, medical)"""
     if event_id not in storage.storage.events:
         raise HTTPException(status_code=404, detail="Event not found")
-    if poi_id not in storage.storage.event_pois.get(event_id, {}):
-        raise HTTPException(status_code=404, detail="POI not found")
     
-    del storage.storage.event_pois[event_id][poi_id]
-    return {"status": "ok", "message": "POI deleted"}
+    k = max(1, min(k, MAX_NEAREST_POIS))
+    if k == 1:
+        # Single nearest: answered from the precomputed raster when it is fresh
+        matches = poi_raster.nearest(event_id, lat, lng, type)
+    else:
+        matches = poi_index.index_for(event_id).nearest(lat, lng, [type] if type else None, k)
+    return {
+        "event_id": event_id,
+        "type": type,
+        "results": [{**match["poi"], "distance": match["distance"]} for match in matches]
+    }
+
+# ============= VENUE GRAPH =============
+
+def _get_graph(event_id: str) -> venue_graph.VenueGraph:
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    graph = venue_graph.graph_for(event_id)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="No venue graph for this event")
+    return graph
+
+@router.put("/admin/events/{event_id}/graph")
+def upload_venue_graph(event_id: str, data: VenueGraphCreate):
+    """Upload (replace) the walkway graph and precompute distance fields for every POI type"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    try:
+        graph = venue_graph.load_graph(
+            event_id,
+            [node.model_dump() for node in data.nodes],
+            [{"from": e.from_node, "to": e.to, "length": e.length, "blocked": e.blocked} for e in data.edges]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    graph.precompute()
+    return {"status": "ok", **graph.summary()}
+
+@router.get("/admin/events/{event_id}/graph")
+def get_venue_graph(event_id: str):
+    """Get a summary of the walkway graph, including closed segments"""
+    return _get_graph(event_id).summary()
+
+@router.delete("/admin/events/{event_id}/graph")
+def delete_venue_graph(event_id: str):
+    """Remove the walkway graph (routing falls back to straight-line distances)"""
+    _get_graph(event_id)
+    storage.storage.venue_graphs.pop(event_id, None)
+    return {"status": "ok", "message": "Venue graph deleted"}
+
+@router.post("/admin/events/{event_id}/graph/closures")
+def set_edge_closure(event_id: str, data: EdgeClosure):
+    """Close (or reopen with blocked=false) a walkway; distance fields update incrementally"""
+    graph = _get_graph(event_id)
+    try:
+        changed = graph.set_blocked(data.from_node, data.to, data.blocked)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Edge not found")
+    return {"status": "ok", "changed": changed, "blocked": [list(key) for key in sorted(graph.blocked)]}
+
+@router.get("/events/{event_id}/route")
+def get_route(event_id: str, lat: float, lng: float, type: Optional[str] = None,
+              to_lat: Optional[float] = None, to_lng: Optional[float] = None):
+    """
+    Walking route over the venue graph
+    
+    - type: route to the nearest POI of that type (e.g. exit) via its precomputed distance field
+    - to_lat/to_lng: ad-hoc route to a point, found with A*
+    """
+    graph = _get_graph(event_id)
+    if type:
+        route = graph.route_to_nearest(lat, lng, type)
+    elif to_lat is not None and to_lng is not None:
+        route = graph.astar(lat, lng, to_lat, to_lng)
+    else:
+        raise HTTPException(status_code=400, detail="Provide either type or to_lat/to_lng")
+    
+    if route is None:
+        raise HTTPException(status_code=404, detail="No open route")
+    return {"event_id": event_id, **route}
+
+# ============= ZONES =============
+
+@router.post("/admin/events/{event_id}/zones")
+def create_zone(event_id: str, data: ZoneCreate):
+    """Define a polygon geofence zone (pit, vip, stage_front, restricted, general)"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    try:
+        zone = zones.create_zone(event_id, data.name, data.kind, [p.model_dump() for p in data.polygon], data.capacity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", "zone": zone, "occupancy": zones.index_for(event_id).counts.get(zone["id"], 0)}
+
+@router.get("/admin/events/{event_id}/zones")
+def get_zones(event_id: str):
+    """Get an event's zones with their live occupancy"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    index = zones.index_for(event_id)
+    occupancy = index.occupancy()
+    return {"zones": [{**zone, **occupancy.get(zone_id, {})} for zone_id, zone in list(index.zones.items())]}
+
+@router.delete("/admin/events/{event_id}/zones/{zone_id}")
+def delete_zone(event_id: str, zone_id: str):
+    """Delete a zone"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    if zones.index_for(event_id).remove_zone(zone_id) is None:
+        raise HTTPException(status_code=404, detail="Zone not found")
+    return {"status": "ok", "message": "Zone deleted"}
+
+@router.get("/admin/events/{event_id}/zones/occupancy")
+def get_zone_occupancy(event_id: str):
+    """Live head count per zone, with capacity flags"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    return {"event_id": event_id, "zones": zones.index_for(event_id).occupancy()}
+
+@router.get("/admin/events/{event_id}/zones/transitions")
+def get_zone_transitions(event_id: str, limit: int = 100, zone_id: Optional[str] = None):
+    """Recent enter/exit transitions, newest first"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    limit = max(1, min(limit, zones.TRANSITIONS_MAX))
+    return {"transitions": zones.index_for(event_id).recent_transitions(limit, zone_id)}
 
 # ============= PARTICIPANTS MANAGEMENT =============
 
 @router.get("/admin/events/{event_id}/participants")
-def get_participants(event_id: str):
-    """Get all participants for an event"""
+def get_participants(event_id: str, cursor: Optional[str] = None, limit: Optional[int] = None,
+                     status: Optional[str] = None, q: Optional[str] = None, field: Optional[str] = None):
+    """
+    Get participants for an event, one page at a time
+    
+    - status: active, checked_in or checked_out
+    - q: prefix search on name, phone or email (pick one with field, otherwise guessed from q)
+    - Pass next_cursor back as cursor for the following page
+    """
     if event_id not in storage.storage.events:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    users = list(storage.storage.event_users.get(event_id, {}).values())
-    return users
+    index = participants.index_for(event_id)
+    return {
+        **index.page(cursor, limit, status, q, field),
+        "counts": index.counts(),
+        "capacity": event_counters.snapshot(event_id)
+    }
 
 @router.put("/admin/events/{event_id}/participants/{user_id}/checkin")
 def checkin_participant(event_id: str, user_id: str):
     """Check in a participant"""
-    if event_id not in storage.storage.events:
-        raise HTTPException(status_code=404, detail="Event not found")
-    
-    user = storage.storage.event_users.get(event_id, {}).get(user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user["status"] = "checked_in"
-    user["check_in_time"] = datetime.now()
+    with event_locks.lock_for(event_id):
+        lifecycle.require_open(event_id)
+        
+        user = storage.storage.event_users.get(event_id, {}).get(user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        if not event_counters.set_status(event_id, user, "checked_in"):
+            raise HTTPException(status_code=409, detail="Event is at full capacity")
+        user["check_in_time"] = datetime.now()
+        storage.storage.persist("user", event_id, user_id, user)
+        participants.status_changed(event_id, user)
     return user
 
 @router.put("/admin/events/{event_id}/participants/{user_id}/checkout")
 def checkout_participant(event_id: str, user_id: str):
     """Check out a participant"""
-    if event_id not in storage.storage.events:
-        raise HTTPException(status_code=404, detail="Event not found")
-    
-    user = storage.storage.event_users.get(event_id, {}).get(user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user["status"] = "checked_out"
-    user["check_out_time"] = datetime.now()
+    with event_locks.lock_for(event_id):
+        lifecycle.require_open(event_id)
+        
+        user = storage.storage.event_users.get(event_id, {}).get(user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        event_counters.set_status(event_id, user, "checked_out")
+        user["check_out_time"] = datetime.now()
+        storage.storage.persist("user", event_id, user_id, user)
+        participants.status_changed(event_id, user)
+        zones.user_left(event_id, user_id)
     return user
 
+@router.post("/admin/events/{event_id}/participants/import")
+def import_participants_csv(event_id: str, file: UploadFile = File(...)):
+    """
+    Bulk-register participants from a CSV (columns: name, optional phone and email)
+    
+    The upload is parsed row by row and applied in batches; the response has
+    totals plus one result code per row (see "codes").
+    """
+    lifecycle.require_open(event_id)
+    
+    try:
+        return {"status": "ok", **import_participants(event_id, file.file)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/admin/events/{event_id}/participants/bulk-status")
+def bulk_update_participant_status(event_id: str, data: BulkStatusUpdate):
+    """Check in or check out many participants at once (e.g. from a gate scanner batch)"""
+    if data.status not in ("checked_in", "checked_out"):
+        raise HTTPException(status_code=400, detail="status must be checked_in or checked_out")
+    if len(data.user_ids) > MAX_BULK_STATUS_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_STATUS_IDS} ids per request")
+    
+    with event_locks.lock_for(event_id):
+        lifecycle.require_open(event_id)
+        event_users = storage.storage.event_users.get(event_id, {})
+        found, not_found = [], []
+        for user_id in dict.fromkeys(data.user_ids):
+            user = event_users.get(user_id)
+            if user is None:
+                not_found.append(user_id)
+            else:
+                found.append(user)
+        
+        outcomes = event_counters.set_status_many(event_id, found, data.status)
+        now = datetime.now()
+        full = []
+        for user, outcome in zip(found, outcomes):
+            if outcome == "updated":
+                user["check_in_time" if data.status == "checked_in" else "check_out_time"] = now
+                participants.status_changed(event_id, user)
+                if data.status == "checked_out":
+                    zones.user_left(event_id, user["id"])
+            elif outcome == "full":
+                full.append(user["id"])
+        storage.storage.persist_many("user", event_id, [user for user, outcome in zip(found, outcomes) if outcome == "updated"])
+    
+    return {
+        "status": "ok",
+        "updated": outcomes.count("updated"),
+        "unchanged": outcomes.count("unchanged"),
+        "rejected_full": full,
+        "not_found": not_found,
+        "capacity": event_counters.snapshot(event_id)
+    }
+
 # ============= ALERTS MANAGEMENT =============
 
 @router.get("/admin/events/{event_id}/alerts")
-def get_alerts(event_id: str):
-    """Get all alerts for an event"""
+def get_alerts(
+    event_id: str,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    status: Optional[str] = None,
+    alert_type: Optional[str] = None,
+    assignee: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    """Get one page of alerts for an event, newest first"""
     if event_id not in storage.storage.events:
         raise HTTPException(status_code=404, detail="Event not found")
     
     alerts = storage.storage.event_alerts.get(event_id, [])
-    return alerts
+    return page_alerts(alerts, cursor, limit, status, alert_type, assignee, since, until)
 
 @router.get("/admin/events/{event_id}/alerts/active")
 def get_active_alerts(event_id: str):
@@ -235,25 +493,45 @@ def get_active_alerts(event_id: str):
 @router.put("/admin/alerts/{alert_id}/resolve")
 def resolve_alert(alert_id: str, data: AlertUpdate = None):
     """Resolve an alert"""
-    for event_id, alerts in storage.storage.event_alerts.items():
-        for alert in alerts:
-            if alert["id"] == alert_id:
-                alert["status"] = data.status if data and data.status else "resolved"
-                alert["resolved_at"] = datetime.now()
-                return alert
-    
-    raise HTTPException(status_code=404, detail="Alert not found")
+    event_id, alert = event_locks.find_alert(alert_id)
+    if alert is None:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    
+    with event_locks.lock_for(event_id):
+        # Re-check: it may have been deleted since the lock-free lookup
+        event_id, alert = event_locks.find_alert(alert_id, event_id)
+        if alert is None:
+            raise HTTPException(status_code=404, detail="Alert not found")
+        previous_status = alert["status"]
+        alert["status"] = data.status if data and data.status else "resolved"
+        alert["resolved_at"] = datetime.now()
+        stats_for(event_id).record_status(alert, previous_status)
+        note_resolved(event_id, alert)
+        if previous_status == "active" and alert["status"] != "active":
+            incidents.release_alert(event_id, alert)
+            dispatch.release_staff(event_id, alert_id)
+        storage.storage.persist("alert", event_id, alert_id, alert)
+    return alert
 
 @router.delete("/admin/alerts/{alert_id}")
 def delete_alert(alert_id: str):
     """Delete an alert"""
-    for event_id, alerts in storage.storage.event_alerts.items():
-        for i, alert in enumerate(alerts):
-            if alert["id"] == alert_id:
-                del alerts[i]
-                return {"status": "ok", "message": "Alert deleted"}
-    
-    raise HTTPException(status_code=404, detail="Alert not found")
+    event_id, alert = event_locks.find_alert(alert_id)
+    if alert is None:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    
+    with event_locks.lock_for(event_id):
+        removed = event_locks.remove_alerts(event_id, {alert_id})
+        if not removed:
+            raise HTTPException(status_code=404, detail="Alert not found")
+        alert = removed[0]
+        stats_for(event_id).record_delete(alert)
+        if alert["status"] == "active":
+            incidents.release_alert(event_id, alert)
+        dispatch.release_staff(event_id, alert_id)
+        forget_global_alerts({alert_id})
+        storage.storage.forget("alert", event_id, alert_id)
+    return {"status": "ok", "message": "Alert deleted"}
 
 # ============= USER JOIN =============
 
@@ -280,29 +558,32 @@ def user_login(data: UserLoginRequest):
     # Simple lookup - in real app would verify credentials
     event_id = ""
     event_name = ""
+    user_id = None
+    registered_at = None
     
-    # Find user by phone and name
-    for eid, users in storage.storage.event_users.items():
-        for uid, user in users.items():
-            if user.get("phone") == data.phone and user.get("name") == data.name:
-                event_id = eid
-                event_name = storage.storage.events.get(eid, {}).get("name", "")
-                break
+    # Most recent registration with this phone and name (constant time, see utils/login_index.py)
+    match = login_index.lookup(data.phone, data.name)
+    if match is not None:
+        event_id, user_id = match
+        event_name = storage.storage.events.get(event_id, {}).get("name", "")
+        user = storage.storage.event_users.get(event_id, {}).get(user_id)
+        registered_at = user.get("check_in_time") if user is not None else None
     
-    user_id = str(uuid.uuid4())[:8]
+    if user_id is None:
+        user_id = str(uuid.uuid4())[:8]
     
     return UserLoginResponse(
         user_id=user_id,
         user_name=data.name,
         event_id=event_id,
-        event_name=event_name
+        event_name=event_name,
+        registered_at=registered_at
     )
 
 @router.post("/events/{event_id}/join", response_model=UserJoinResponse)
 def join_event_with_id(event_id: str, data: dict):
     """User joins a specific event"""
-    if event_id not in storage.storage.events:
-        raise HTTPException(status_code=404, detail="Event not found")
+    lifecycle.require_open(event_id)
     
     # Support both 'name' and 'user_name' fields
     user_name = data.get("name") or data.get("user_name", "Anonymous")
@@ -310,21 +591,30 @@ def join_event_with_id(event_id: str, data: dict):
     user_id = str(uuid.uuid4())[:8]
     now = datetime.now()
     
-    new_user = {
-        "id": user_id,
-        "name": user_name,
-        "phone": data.get("phone"),
-        "email": data.get("email"),
-        "event_id": event_id,
-        "status": "active",
-        "check_in_time": now,
-        "check_out_time": None,
-        "lat": None,
-        "lng": None,
-        "last_seen": None
-    }
+    new_user = User(
+        id=user_id,
+        name=user_name,
+        phone=data.get("phone"),
+        email=data.get("email"),
+        event_id=event_id,
+        status="active",
+        check_in_time=now,
+        check_out_time=None,
+        lat=None,
+        lng=None,
+        last_seen=None
+    )
     
-    storage.storage.event_users[event_id][user_id] = new_user
+    with event_locks.lock_for(event_id):
+        # Re-check: the event may have been deleted while we built the record
+        event = storage.storage.events.get(event_id)
+        if event is None:
+            raise HTTPException(status_code=404, detail="Event not found")
+        if not event_counters.admit(event_id, new_user):
+            raise HTTPException(status_code=409, detail="Event is at full capacity")
+        storage.storage.persist("user", event_id, user_id, new_user)
+        login_index.register(event_id, new_user)
+        participants.joined(event_id, new_user)
     
     return UserJoinResponse(
         user_id=user_id,
@@ -332,14 +622,13 @@ def join_event_with_id(event_id: str, data: dict):
         phone=data.get("phone"),
         email=data.get("email"),
         event_id=event_id,
-        event_name=storage.storage.events[event_id]["name"]
+        event_name=event["name"]
     )
 
 @router.post("/events/{event_id}/sos")
 def trigger_sos(event_id: str, data: dict):
     """Trigger SOS alert"""
-    if event_id not in storage.storage.events:
-        raise HTTPException(status_code=404, detail="Event not found")
+    lifecycle.require_open(event_id)
     
     user_id = data.get("user_id")
     user_name = data.get("user_name", "Unknown")
@@ -349,48 +638,72 @@ def trigger_sos(event_id: str, data: dict):
     if not lat or not lng:
         raise HTTPException(status_code=400, detail="Location required")
     
-    alert_id = str(uuid.uuid4())[:8]
-    now = datetime.now()
-    
-    sos_alert = {
-        "id": alert_id,
-        "event_id": event_id,
-        "user_id": user_id,
-        "user_name": user_name,
-        "alert_type": "sos",
-        "description": data.get("description", "Emergency SOS alert"),
-        "lat": lat,
-        "lng": lng,
-        "status": "active",
-        "created_at": now,
-        "resolved_at": None
-    }
+    alert_id = sharding.new_id()
     
-    storage.storage.event_alerts[event_id].append(sos_alert)
+    sos_alert = Alert(
+        id=alert_id,
+        event_id=event_id,
+        user_id=user_id,
+        user_name=user_name,
+        alert_type="sos",
+        description=data.get("description", "Emergency SOS alert"),
+        lat=lat,
+        lng=lng,
+        status="active",
+        resolved_at=None
+    )
     
-    return {"status": "ok", "alert_id": alert_id, "message": "SOS alert triggered"}
+    with event_locks.lock_for(event_id):
+        # Timestamp taken under the lock: append order must match created_at (alert paging bisects on it)
+        sos_alert["created_at"] = datetime.now()
+        # Fold retries and repeats from the same user/area into the existing alert
+        sos_alert, merged = incidents.register_sos(event_id, sos_alert)
+        if merged:
+            storage.storage.persist("alert", event_id, sos_alert["id"], sos_alert)
+            return {
+                "status": "ok",
+                "alert_id": sos_alert["id"],
+                "incident_id": sos_alert.get("incident_id"),
+                "deduplicated": True,
+                "repeat_count": sos_alert["repeat_count"],
+                "message": "SOS alert already active"
+            }
+        
+        # SOS alerts are committed before we acknowledge them
+        storage.storage.persist_now("alert", event_id, alert_id, sos_alert)
+        event_locks.append_alert(event_id, sos_alert)
+        stats_for(event_id).record_trigger(sos_alert)
+    
+    return {
+        "status": "ok",
+        "alert_id": alert_id,
+        "incident_id": sos_alert["incident_id"],
+        "deduplicated": False,
+        "message": "SOS alert triggered"
+    }
 
 # ============= LOCATION & HEATMAP =============
 
 @router.post("/events/{event_id}/heartbeat")
 def event_heartbeat(event_id: str, data: dict):
     """Store user location for an event"""
-    if event_id not in storage.storage.events:
-        raise HTTPException(status_code=404, detail="Event not found")
+    lifecycle.require_open(event_id)
     
     user_id = data.get("user_id")
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id required")
     
-    if event_id not in storage.storage.event_locations:
-        storage.storage.event_locations[event_id] = {}
+    # Created with the event; a missing dict means it was deleted meanwhile
+    locations = storage.storage.event_locations.get(event_id)
+    if locations is None:
+        raise HTTPException(status_code=404, detail="Event not found")
     
     now = datetime.now()
-    storage.storage.event_locations[event_id][user_id] = {
-        "lat": data["lat"],
-        "lng": data["lng"],
-        "timestamp": now
-    }
+    location = Location(data["lat"], data["lng"], now)
+    locations[user_id] = location
+    # Write-behind: the heartbeat never waits on disk, and repeats coalesce until the next flush
+    storage.storage.persist_later("location", event_id, user_id, location)
+    storage.storage.location_versions[event_id] = storage.storage.location_versions.get(event_id, 0) + 1
     
     # Update user's last known location
     if event_id in storage.storage.event_users and user_id in storage.storage.event_users[event_id]:
@@ -398,7 +711,17 @@ def event_heartbeat(event_id: str, data: dict):
         storage.storage.event_users[event_id][user_id]["lng"] = data["lng"]
         storage.storage.event_users[event_id][user_id]["last_seen"] = now
     
-    return {"status": "ok"}
+    response = {"status": "ok"}
+    zone_ids = zones.heartbeat(event_id, user_id, data["lat"], data["lng"], now)
+    if zone_ids is not None:
+        response["zones"] = zone_ids
+    
+    # During an evacuation, hand back the batch-computed nearest exit
+    if event_id in storage.storage.evacuations:
+        response["nearest_exit"] = evacuation.assignment_for(event_id, user_id)
+        response["evacuation_exit"] = evacuation_plan.assignment_for(event_id, user_id)
+    
+    return response
 
 @router.get("/events/{event_id}/locations", response_model=HeatmapData)
 def get_event_locations(event_id: str):
@@ -413,7 +736,7 @@ def get_event_locations(event_id: str):
     locations = []
     event_locs = storage.storage.event_locations.get(event_id, {})
     
-    for user_id, loc_data in event_locs.items():
+    for user_id, loc_data in list(event_locs.items()):
         if loc_data.get("timestamp", datetime.min) > cutoff:
             locations.append({
                 "user_id": user_id,
@@ -445,25 +768,105 @@ def get_event_locations(event_id: str):
         last_updated=now
     )
 
+# ============= EVACUATION =============
+
+@router.post("/admin/events/{event_id}/evacuation")
+def start_evacuation(event_id: str):
+    """Start evacuation mode: assign every live attendee to their nearest exit in one batch"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    storage.storage.evacuations.setdefault(event_id, datetime.now())
+    result = evacuation.compute(event_id, force=True)
+    return {"status": "ok", "started_at": storage.storage.evacuations[event_id], **evacuation.summary(result)}
+
+@router.get("/admin/events/{event_id}/evacuation")
+def get_evacuation(event_id: str):
+    """Get the current nearest-exit assignment summary (recomputed only if positions changed)"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    result = evacuation.compute(event_id)
+    return {
+        "active": event_id in storage.storage.evacuations,
+        "started_at": storage.storage.evacuations.get(event_id),
+        **evacuation.summary(result)
+    }
+
+@router.delete("/admin/events/{event_id}/evacuation")
+def stop_evacuation(event_id: str):
+    """End evacuation mode"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    storage.storage.evacuations.pop(event_id, None)
+    storage.storage.exit_assignments.pop(event_id, None)
+    storage.storage.evacuation_plans.pop(event_id, None)
+    return {"status": "ok", "message": "Evacuation ended"}
+
+class EvacuationPlanRequest(BaseModel):
+    objective: str = "makespan"  # makespan (worst-case egress) or total (sum of egress times)
+    capacities: Optional[Dict[str, float]] = None  # exit POI id -> people per minute
+    walking_speed: float = evacuation_plan.DEFAULT_WALKING_SPEED_MPS
+
+@router.post("/admin/events/{event_id}/evacuation/plan")
+def create_evacuation_plan(event_id: str, data: EvacuationPlanRequest):
+    """Plan exits for every live attendee, spreading load by each exit's throughput"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if data.walking_speed <= 0:
+        raise HTTPException(status_code=400, detail="walking_speed must be positive")
+    # A non-positive throughput would make an exit unusable (or, at 0, silently fall back to the default)
+    for poi_id, capacity in (data.capacities or {}).items():
+        if not math.isfinite(capacity) or capacity <= 0:
+            raise HTTPException(status_code=400, detail=f"Capacity of exit {poi_id} must be a positive number")
+    
+    try:
+        result = evacuation_plan.plan(event_id, data.objective, data.capacities, data.walking_speed, warm_start=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", **evacuation_plan.summary(result)}
+
+@router.get("/admin/events/{event_id}/evacuation/plan")
+def get_evacuation_plan(event_id: str):
+    """Get the latest evacuation plan summary (re-planned in the background as people move)"""
+    if event_id not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    result = storage.storage.evacuation_plans.get(event_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No evacuation plan")
+    return {
+        "stale": result["version"] != storage.storage.location_versions.get(event_id, 0),
+        **evacuation_plan.summary(result)
+    }
+
 @router.get("/events")
 def get_events_public():
     """Get all events (public endpoint)"""
     events = []
-    for event in storage.storage.events.values():
+    for event in list(storage.storage.events.values()):
         events.append({
             "id": event["id"],
             "name": event["name"],
             "city": event.get("city"),
             "date": event.get("start_date") or event.get("date"),
-            "active_users": len(storage.storage.event_users.get(event["id"], {}))
+            "active_users": event_counters.counters_for(event["id"]).registered
         })
     return events
 
 @router.get("/events/{event_id}/users")
-def get_event_users(event_id: str):
-    """Get all users in an event"""
+def get_event_users(event_id: str, cursor: Optional[str] = None, limit: Optional[int] = None,
+                    status: Optional[str] = None, q: Optional[str] = None, field: Optional[str] = None):
+    """Get users in an event, paginated and searchable like the admin participant list"""
     if event_id not in storage.storage.events:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    users = list(storage.storage.event_users.get(event_id, {}).values())
-    return users
+    index = participants.index_for(event_id)
+    page = index.page(cursor, limit, status, q, field)
+    return {
+        "users": page["participants"],
+        "next_cursor": page["next_cursor"],
+        "limit": page["limit"],
+        "total": index.counts()["total"]
+    }
@@ -1,12 +1,20 @@
 from fastapi import APIRouter, HTTPException
 import storage
-import uuid
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
+from records import Alert
+from utils.alert_stats import AlertStats, stats_for
+from utils import incidents, dispatch, event_locks, sharding, lifecycle
+from utils.alert_query import page_alerts
+from utils.pagination import clamp_limit
+from utils.archive import archive, forget_global_alerts, note_resolved
 
 router = APIRouter()
 
+# Upper bound on responders returned per dispatch query
+RESPONDER_LIMIT = 20
+
 # Pydantic models
 class SOSRequest(BaseModel):
     event_id: str
@@ -34,37 +42,64 @@ class AlertResolveRequest(BaseModel):
     status: str = "resolved"
     response: Optional[str] = None
 
+class StaffUpdateRequest(BaseModel):
+    name: Optional[str] = None
+    role: Optional[str] = None  # security, medical, first_aid
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    available: Optional[bool] = None
+
 @router.post("/sos/trigger")
-async def trigger_sos(data: SOSRequest):
+def trigger_sos(data: SOSRequest):
     """Trigger an SOS alert from a user"""
-    alert_id = str(uuid.uuid4())[:8]
-    
-    alert = {
-        "id": alert_id,
-        "event_id": data.event_id,
-        "user_id": data.user_id,
-        "user_name": data.user_name,
-        "lat": data.lat,
-        "lng": data.lng,
-        "description": data.description or "",
-        "alert_type": data.alert_type,
-        "status": "active",
-        "created_at": datetime.now(),
-        "resolved_at": None,
-        "response": None
-    }
+    # Sync so it runs in the threadpool: it takes the event lock and waits for a durable commit
+    # The event is named in the body, so RehydrateMiddleware has not brought an archived one back
+    lifecycle.ensure_resident(data.event_id)
+    lifecycle.require_open(data.event_id)
+    alert_id = sharding.new_id()
     
-    # Store in event alerts
-    if data.event_id not in storage.storage.event_alerts:
-        storage.storage.event_alerts[data.event_id] = []
-    storage.storage.event_alerts[data.event_id].insert(0, alert)
+    alert = Alert(
+        id=alert_id,
+        event_id=data.event_id,
+        user_id=data.user_id,
+        user_name=data.user_name,
+        lat=data.lat,
+        lng=data.lng,
+        description=data.description or "",
+        alert_type=data.alert_type,
+        status="active",
+        resolved_at=None,
+        response=None
+    )
     
-    # Also store in global SOS alerts for dashboard
-    storage.storage.sos_alerts.insert(0, alert)
+    with event_locks.lock_for(data.event_id):
+        # Stamped under the lock so each event's alert list stays in created_at order
+        alert["created_at"] = datetime.now()
+        # Fold retries and repeats from the same user/area into the existing alert
+        alert, merged = incidents.register_sos(data.event_id, alert)
+        if merged:
+            storage.storage.persist("alert", data.event_id, alert["id"], alert)
+            return {
+                "status": "ok",
+                "alert_id": alert["id"],
+                "incident_id": alert.get("incident_id"),
+                "deduplicated": True,
+                "repeat_count": alert["repeat_count"],
+                "message": "SOS alert already active"
+            }
+        
+        # Commit before acknowledging
+        storage.storage.persist_now("alert", data.event_id, alert_id, alert)
+        
+        # Store in event alerts, and in the global SOS feed for the dashboard
+        event_locks.append_alert(data.event_id, alert, feed=True)
+        stats_for(data.event_id).record_trigger(alert)
     
     return {
         "status": "ok",
         "alert_id": alert_id,
+        "incident_id": alert["incident_id"],
+        "deduplicated": False,
         "message": "SOS alert triggered successfully"
     }
 
@@ -72,7 +107,7 @@ async def trigger_sos(data: SOSRequest):
 async def get_active_sos():
     """Get all active SOS alerts across all events"""
     active_sos = []
-    for event_id, alerts in storage.storage.event_alerts.items():
+    for event_id, alerts in list(storage.storage.event_alerts.items()):
         for alert in alerts:
             if alert["status"] == "active":
                 active_sos.append(alert)
@@ -83,14 +118,41 @@ async def get_active_sos():
     return {"sos_alerts": active_sos}
 
 @router.get("/admin/events/{eventId}/alerts")
-def get_event_alerts(eventId: str):
-    """Get all alerts for an event"""
-    alerts = storage.storage.event_alerts.get(eventId, [])
+def get_event_alerts(
+    eventId: str,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    status: Optional[str] = None,
+    alert_type: Optional[str] = None,
+    assignee: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    """
+    Get one page of alerts for an event, newest first
     
-    # Sort by creation time (newest first)
-    alerts.sort(key=lambda x: x.get("created_at", datetime.now()), reverse=True)
-    
-    return alerts
+    - cursor: next_cursor from the previous page
+    - limit: page size (capped server-side)
+    - status/alert_type/assignee: exact-match filters
+    - since/until: ISO 8601 bounds on created_at
+    """
+    alerts = storage.storage.event_alerts.get(eventId, [])
+    return page_alerts(alerts, cursor, limit, status, alert_type, assignee, since, until)
+
+@router.get("/admin/events/{eventId}/alerts/archive")
+def get_archived_alerts(
+    eventId: str,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    status: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    """Get resolved alerts that have been moved out of memory into the on-disk archive"""
+    try:
+        return archive.query(eventId, since, until, status, clamp_limit(limit), cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/admin/events/{eventId}/alerts/active")
 def get_active_alerts(eventId: str):
@@ -106,22 +168,26 @@ def get_active_alerts(eventId: str):
 @router.put("/admin/alerts/{alertId}/resolve")
 def resolve_alert(alertId: str, data: AlertResolveRequest):
     """Resolve an alert"""
-    # Find alert in any event
-    found = False
-    for event_id, alerts in storage.storage.event_alerts.items():
-        for alert in alerts:
-            if alert["id"] == alertId:
-                alert["status"] = data.status
-                alert["resolved_at"] = datetime.now()
-                alert["response"] = data.response
-                found = True
-                break
-        if found:
-            break
-    
-    if not found:
+    # Find alert in any event, then re-check it under that event's lock
+    event_id, alert = event_locks.find_alert(alertId)
+    if alert is None:
         raise HTTPException(status_code=404, detail="Alert not found")
     
+    with event_locks.lock_for(event_id):
+        _, alert = event_locks.find_alert(alertId, event_id)
+        if alert is None:
+            raise HTTPException(status_code=404, detail="Alert not found")
+        previous_status = alert["status"]
+        alert["status"] = data.status
+        alert["resolved_at"] = datetime.now()
+        alert["response"] = data.response
+        stats_for(event_id).record_status(alert, previous_status)
+        note_resolved(event_id, alert)
+        if previous_status == "active" and data.status != "active":
+            incidents.release_alert(event_id, alert)
+            dispatch.release_staff(event_id, alertId)
+        storage.storage.persist("alert", event_id, alertId, alert)
+    
     return {
         "status": "ok",
         "message": f"Alert {alertId} marked as {data.status}"
@@ -130,69 +196,189 @@ def resolve_alert(alertId: str, data: AlertResolveRequest):
 @router.delete("/admin/alerts/{alertId}")
 def delete_alert(alertId: str):
     """Delete an alert"""
-    found = False
-    for event_id, alerts in storage.storage.event_alerts.items():
-        for i, alert in enumerate(alerts):
-            if alert["id"] == alertId:
-                alerts.pop(i)
-                found = True
-                break
-        if found:
-            break
-    
-    if not found:
+    event_id, _ = event_locks.find_alert(alertId)
+    if event_id is None:
         raise HTTPException(status_code=404, detail="Alert not found")
     
+    with event_locks.lock_for(event_id):
+        removed = event_locks.remove_alerts(event_id, {alertId})
+        if not removed:
+            raise HTTPException(status_code=404, detail="Alert not found")
+        alert = removed[0]
+        stats_for(event_id).record_delete(alert)
+        if alert["status"] == "active":
+            incidents.release_alert(event_id, alert)
+        dispatch.release_staff(event_id, alertId)
+        forget_global_alerts({alertId})
+        storage.storage.forget("alert", event_id, alertId)
+    
     return {
         "status": "ok",
         "message": f"Alert {alertId} deleted"
     }
 
+@router.get("/admin/events/{eventId}/incidents")
+def get_event_incidents(eventId: str, include_resolved: bool = False):
+    """Get SOS incidents (clusters of alerts from the same area) for an event"""
+    return {"event_id": eventId, "incidents": incidents.list_incidents(eventId, include_resolved)}
+
 @router.get("/admin/alerts/stats/{eventId}")
 def get_alert_stats(eventId: str):
-    """Get alert statistics for an event"""
-    alerts = storage.storage.event_alerts.get(eventId, [])
-    
-    total = len(alerts)
-    active = len([a for a in alerts if a["status"] == "active"])
-    resolved = total - active
-    
-    # Count by type
-    by_type = {}
-    for alert in alerts:
-        alert_type = alert.get("alert_type", "unknown")
-        by_type[alert_type] = by_type.get(alert_type, 0) + 1
-    
-    return {
-        "event_id": eventId,
-        "total_alerts": total,
-        "active_alerts": active,
-        "resolved_alerts": resolved,
-        "by_type": by_type
-    }
+    """Get alert statistics for an event (served from running counters)"""
+    # Archived events are brought back as for other per-event requests; unknown ids get no tracker
+    if not lifecycle.ensure_resident(eventId):
+        raise HTTPException(status_code=404, detail="Event not found")
+    stats = storage.storage.alert_stats.get(eventId)
+    return {"event_id": eventId, **(stats or AlertStats()).snapshot()}
 
 @router.post("/admin/alerts/{alertId}/assign")
 def assign_alert(alertId: str, data: dict):
-    """Assign an alert to an admin for handling"""
+    """
+    Assign an alert to an admin or responder for handling
+    
+    - admin_id/admin_name: assign to a named admin (original behaviour)
+    - responder_id: assign to a specific staff member or responder POI
+    - auto: assign to the nearest available responder (optionally limited to `types`)
+    """
+    event_id, alert = event_locks.find_alert(alertId)
+    if alert is None:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    
     admin_id = data.get("admin_id")
     admin_name = data.get("admin_name")
+    responder = None
     
-    found = False
-    for event_id, alerts in storage.storage.event_alerts.items():
-        for alert in alerts:
-            if alert["id"] == alertId:
-                alert["assigned_to"] = admin_id
-                alert["assigned_name"] = admin_name
-                alert["assigned_at"] = datetime.now()
-                found = True
-                break
-        if found:
-            break
-    
-    if not found:
-        raise HTTPException(status_code=404, detail="Alert not found")
+    if data.get("responder_id"):
+        responder = dispatch.find_responder(event_id, data["responder_id"], alert["lat"], alert["lng"])
+        if responder is None:
+            raise HTTPException(status_code=404, detail="Responder not found")
+    elif data.get("auto"):
+        candidates = dispatch.index_for(event_id).nearest(alert["lat"], alert["lng"], k=1, types=data.get("types"))
+        if not candidates:
+            raise HTTPException(status_code=409, detail="No available responder found")
+        responder = candidates[0]
+    
+    with event_locks.lock_for(event_id):
+        _, alert = event_locks.find_alert(alertId, event_id)
+        if alert is None:
+            raise HTTPException(status_code=404, detail="Alert not found")
+        # The responder was picked without the lock; another assignment may have taken them since
+        if responder is not None and not _staff_free(event_id, responder, alertId):
+            if not data.get("auto"):
+                raise HTTPException(status_code=409, detail="Responder is busy with another alert")
+            candidates = dispatch.index_for(event_id).nearest(alert["lat"], alert["lng"], k=1, types=data.get("types"))
+            if not candidates:
+                raise HTTPException(status_code=409, detail="No available responder found")
+            responder = candidates[0]
+        if responder is not None:
+            admin_id = admin_id or responder["id"]
+            admin_name = admin_name or responder["name"]
+        stats_for(event_id).record_assign(alert.get("assigned_to"), admin_id)
+        alert["assigned_to"] = admin_id
+        alert["assigned_name"] = admin_name
+        alert["assigned_at"] = datetime.now()
+        
+        # Free whoever was previously dispatched to this alert
+        dispatch.release_staff(event_id, alertId)
+        if responder is not None:
+            alert["responder"] = responder
+            staff = storage.storage.event_staff.get(event_id, {}).get(responder["id"])
+            if responder["kind"] == "staff" and staff is not None:
+                staff["available"] = False
+                staff["current_alert"] = alertId
+        storage.storage.persist("alert", event_id, alertId, alert)
     
     return {
         "status": "ok",
-        "message": f"Alert {alertId} assigned to {admin_name}"
+        "message": f"Alert {alertId} assigned to {admin_name}",
+        "responder": responder
     }
+
+def _staff_free(event_id: str, responder: dict, alert_id: str) -> bool:
+    """Whether a responder can take this alert (call with the event lock held)"""
+    if responder["kind"] != "staff":
+        return True
+    staff = storage.storage.event_staff.get(event_id, {}).get(responder["id"])
+    if staff is None:
+        return False
+    # Staff already on this alert may be assigned to it again
+    return staff.get("available", True) or staff.get("current_alert") == alert_id
+
+@router.get("/admin/alerts/{alertId}/responders")
+def get_alert_responders(alertId: str, k: int = 5, types: Optional[str] = None, include_busy: bool = False):
+    """Get the k nearest available responders (security/medical/first_aid POIs and staff) for an alert"""
+    event_id, alert = event_locks.find_alert(alertId)
+    if alert is None:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    
+    responders = dispatch.index_for(event_id).nearest(
+        alert["lat"], alert["lng"],
+        k=max(1, min(k, RESPONDER_LIMIT)),
+        types=types.split(",") if types else None,
+        include_busy=include_busy
+    )
+    return {"alert_id": alertId, "event_id": event_id, "responders": responders}
+
+# ============= STAFF POSITIONS =============
+
+@router.get("/admin/events/{eventId}/staff")
+def get_event_staff(eventId: str):
+    """Get all staff positions for an event"""
+    if eventId not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    return list(storage.storage.event_staff.get(eventId, {}).values())
+
+@router.post("/admin/events/{eventId}/staff/{staffId}")
+def update_staff(eventId: str, staffId: str, data: StaffUpdateRequest):
+    """Create or update a staff member's position, role and availability"""
+    if eventId not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    with event_locks.lock_for(eventId):
+        # Re-checked under the lock: a concurrent delete would leave an orphaned staff registry
+        if eventId not in storage.storage.events:
+            raise HTTPException(status_code=404, detail="Event not found")
+        staff_members = storage.storage.event_staff.setdefault(eventId, {})
+        staff = staff_members.get(staffId)
+        if staff is None:
+            staff = {
+                "id": staffId,
+                "name": data.name or staffId,
+                "role": data.role or "security",
+                "lat": None,
+                "lng": None,
+                "available": True,
+                "current_alert": None,
+                "updated_at": None
+            }
+            staff_members[staffId] = staff
+        
+        if data.name is not None:
+            staff["name"] = data.name
+        if data.role is not None:
+            staff["role"] = data.role
+        if data.lat is not None and data.lng is not None:
+            staff["lat"] = data.lat
+            staff["lng"] = data.lng
+        if data.available is not None:
+            staff["available"] = data.available
+            if data.available:
+                staff["current_alert"] = None
+        staff["updated_at"] = datetime.now()
+        
+        dispatch.staff_changed(eventId)
+    return staff
+
+@router.delete("/admin/events/{eventId}/staff/{staffId}")
+def delete_staff(eventId: str, staffId: str):
+    """Remove a staff member"""
+    if eventId not in storage.storage.events:
+        raise HTTPException(status_code=404, detail="Event not found")
+    
+    with event_locks.lock_for(eventId):
+        if staffId not in storage.storage.event_staff.get(eventId, {}):
+            raise HTTPException(status_code=404, detail="Staff member not found")
+        del storage.storage.event_staff[eventId][staffId]
+        dispatch.staff_changed(eventId, removed=True)
+    return {"status": "ok", "message": f"Staff {staffId} removed"}
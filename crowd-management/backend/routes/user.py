@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 import storage
-from utils.geo import haversine
+from utils.poi_index import exit_point_index
 from utils.cleanup import cleanup_stale_users
 from datetime import datetime
 import uuid
@@ -33,6 +33,7 @@ def test_add_exit(data: dict):
     exit_id = str(uuid.uuid4())[:8]
     new_exit = {"id": exit_id, "lat": data["lat"], "lng": data["lng"]}
     storage.storage.exit_points.append(new_exit)
+    exit_point_index.invalidate()
     return {"status": "ok", "exit": new_exit, "all_exits": storage.storage.exit_points}
 
 @router.post("/nearest-exit")
@@ -41,19 +42,11 @@ def nearest_exit(data: dict):
     if len(storage.storage.exit_points) == 0:
         return {"nearest_exit": None, "distance": None}
     
-    user_lat = data["lat"]
-    user_lng = data["lng"]
-    
-    nearest = None
-    min_dist = float('inf')
-    
-    for exit_point in storage.storage.exit_points:
-        dist = haversine(user_lat, user_lng, exit_point["lat"], exit_point["lng"])
-        if dist < min_dist:
-            min_dist = dist
-            nearest = exit_point
+    match = exit_point_index.nearest(data["lat"], data["lng"])
+    if match is None:
+        return {"nearest_exit": None, "distance": None}
     
     return {
-        "nearest_exit": nearest,
-        "distance": round(min_dist, 2)
+        "nearest_exit": match["poi"],
+        "distance": match["distance"]
     }
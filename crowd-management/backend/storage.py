@@ -1,37 +1,181 @@
+import gc
+import os
 import uuid
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Any, Dict, Iterable, List, Tuple
+
+from records import Alert, Location, User
+from utils.persistence import StorageBackend, open_backend
+
+# Cap on the global (cross-event) SOS list; older entries fall off the end
+SOS_ALERTS_MAX = int(os.getenv("SOS_ALERTS_MAX", "1000"))
 
 # In-memory storage for hackathon - event-aware structure
+# Reads are always served from memory; events, participants, locations, POIs and
+# alerts are also written to a backend (see utils/persistence.py) and restored on start
 class Storage:
     def __init__(self):
+        self.backend = StorageBackend()  # no durability until init_storage opens the configured one
+        
         # Original structure (for backward compatibility)
         self.admin_location = None
         self.exit_points = []
         self.active_users = {}
-        self.sos_alerts = []
+        self.sos_alerts = deque(maxlen=SOS_ALERTS_MAX)  # newest first
         self.chat_messages = []
         
         # New event-aware structure
         self.events = {}  # event_id -> Event dict
-        self.event_users = {}  # event_id -> {user_id -> User dict}
-        self.event_locations = {}  # event_id -> {user_id -> {lat, lng, timestamp}}
+        self.event_locks = {}  # event_id -> write lock (see utils/event_locks.py)
+        self.event_users = {}  # event_id -> {user_id -> User} (see records.py)
+        self.login_index = {}  # (phone, name) normalized -> {(event_id, user_id): None} (see utils/login_index.py)
+        self.participant_indexes = {}  # event_id -> ParticipantIndex (see utils/participants.py)
+        self.event_counters = {}  # event_id -> EventCounters (see utils/event_counters.py)
+        self.event_locations = {}  # event_id -> {user_id -> Location}
         self.event_pois = {}  # event_id -> {poi_id -> POI dict}
-        self.event_alerts = {}  # event_id -> [Alert dict]
+        self.event_alerts = {}  # event_id -> [Alert]
+        self.alert_stats = {}  # event_id -> AlertStats (see utils/alert_stats.py)
+        self.resolved_alerts = {}  # event_id -> heap of (resolved_at, alert_id) awaiting archival (see utils/archive.py)
+        self.event_incidents = {}  # event_id -> {incident_id -> Incident dict}
+        self.incident_cells = {}  # event_id -> {grid cell -> incident_id}
+        self.sos_dedup = OrderedDict()  # (event_id, user_id, cell) -> dedup entry, oldest first
+        self.event_staff = {}  # event_id -> {staff_id -> {lat, lng, role, available, ...}}
+        self.responder_indexes = {}  # event_id -> ResponderIndex (see utils/dispatch.py)
+        self.poi_indexes = {}  # event_id -> POIIndex (see utils/poi_index.py)
+        self.poi_rasters = {}  # event_id -> POIRaster (see utils/poi_raster.py)
+        self.location_versions = {}  # event_id -> counter bumped on every heartbeat
+        self.evacuations = {}  # event_id -> evacuation start time (while active)
+        self.exit_assignments = {}  # event_id -> cached batch nearest-exit result
+        self.evacuation_plans = {}  # event_id -> capacity-aware plan (see utils/evacuation_plan.py)
+        self.venue_graphs = {}  # event_id -> VenueGraph (see utils/venue_graph.py)
+        self.zone_indexes = {}  # event_id -> ZoneIndex (see utils/zones.py)
+        self.event_access = {}  # event_id -> monotonic time of the last request naming it (see utils/lifecycle.py)
 
     def init_storage(self):
         """Initialize storage with default values"""
         self.admin_location = None
         self.exit_points = []
         self.active_users = {}
-        self.sos_alerts = []
+        self.sos_alerts = deque(maxlen=SOS_ALERTS_MAX)
         self.chat_messages = []
         self.events = {}
+        self.event_locks = {}
         self.event_users = {}
+        self.login_index = {}
+        self.participant_indexes = {}
+        self.event_counters = {}
         self.event_locations = {}
         self.event_pois = {}
         self.event_alerts = {}
-        print("Storage initialized")
+        self.alert_stats = {}
+        self.resolved_alerts = {}
+        self.event_incidents = {}
+        self.incident_cells = {}
+        self.sos_dedup = OrderedDict()
+        self.event_staff = {}
+        self.responder_indexes = {}
+        self.poi_indexes = {}
+        self.poi_rasters = {}
+        self.location_versions = {}
+        self.evacuations = {}
+        self.exit_assignments = {}
+        self.evacuation_plans = {}
+        self.venue_graphs = {}
+        self.zone_indexes = {}
+        self.event_access = {}
+        
+        self.backend.close()
+        self.backend = open_backend()
+        # Records are tracked by the cyclic GC (dicts of plain values are not), so a bulk
+        # load would otherwise set off full collections over everything loaded so far
+        gc.disable()
+        try:
+            restored = self._restore(self.backend.load())
+        finally:
+            gc.enable()
+        print(f"Storage initialized ({self.backend.name} backend, {restored} records restored)")
+    
+    def rehydrate(self, loaded: Dict[str, List[Tuple[str, str, Dict[str, Any]]]]) -> int:
+        """Bring archived events back into memory (see utils/lifecycle.py); old alerts skip the SOS feed"""
+        return self._restore(loaded, feed=False)
+    
+    def _restore(self, loaded: Dict[str, List[Tuple[str, str, Dict[str, Any]]]], feed: bool = True) -> int:
+        """Rebuild the in-memory state (and the indexes derived eagerly from it) from the backend"""
+        # Local imports: these modules import storage themselves
+        from utils import login_index
+        from utils.alert_stats import stats_for
+        from utils.archive import note_resolved
+        
+        events = {}
+        for event_id, _, event in loaded.get("event", []):
+            events[event_id] = event
+            self.event_users[event_id] = {}
+            self.event_locations[event_id] = {}
+            self.event_pois[event_id] = {}
+            self.event_alerts[event_id] = []
+        # Backends may hand back plain dicts (JSON) or the records themselves (pickle)
+        restored_users = {}
+        for event_id, user_id, user in loaded.get("user", []):
+            user = User.coerce(user)
+            self.event_users.setdefault(event_id, {})[user_id] = user
+            restored_users.setdefault(event_id, []).append(user)
+        for event_id, users in restored_users.items():
+            login_index.register_many(event_id, users)
+        for event_id, user_id, location in loaded.get("location", []):
+            location = Location.coerce(location)
+            self.event_locations.setdefault(event_id, {})[user_id] = location
+            # Heartbeats only persist the location; the user's last known position follows from it
+            user = self.event_users.get(event_id, {}).get(user_id)
+            if user is not None:
+                # Both are records here: plain attribute access skips the per-field check
+                user.lat, user.lng, user.last_seen = location.lat, location.lng, location.timestamp
+        for event_id, poi_id, poi in loaded.get("poi", []):
+            self.event_pois.setdefault(event_id, {})[poi_id] = poi
+        
+        alerts = [Alert.coerce(alert) for _, _, alert in loaded.get("alert", [])]
+        alerts.sort(key=lambda alert: alert["created_at"])
+        for alert in alerts:
+            self.event_alerts.setdefault(alert["event_id"], []).append(alert)
+            if feed:
+                self.sos_alerts.appendleft(alert)
+            stats_for(alert["event_id"]).record_restored(alert)
+            note_resolved(alert["event_id"], alert)
+        # Published last, so a reader that finds an event also finds its records
+        self.events.update(events)
+        return sum(len(records) for records in loaded.values())
+    
+    # ----- persistence -----
+    
+    def persist(self, kind: str, event_id: str, record_id: str, record: Dict[str, Any]):
+        """Write a changed record through to the backend"""
+        self.backend.put(kind, event_id, record_id, record)
+    
+    def persist_many(self, kind: str, event_id: str, records: Iterable[Dict[str, Any]]):
+        """Write a batch of records (keyed by their "id") in one transaction"""
+        self.backend.put_many(kind, event_id, [(record["id"], record) for record in records])
+    
+    def persist_later(self, kind: str, event_id: str, record_id: str, record: Dict[str, Any]):
+        """Queue a hot record for the write-behind flusher; never blocks on disk"""
+        self.backend.put_deferred(kind, event_id, record_id, record)
+    
+    def persist_now(self, kind: str, event_id: str, record_id: str, record: Dict[str, Any]):
+        """Write a critical record and wait until it is durable"""
+        self.backend.put_critical(kind, event_id, record_id, record)
+    
+    def forget(self, kind: str, event_id: str, record_id: str):
+        self.backend.delete(kind, event_id, record_id)
+    
+    def forget_many(self, kind: str, event_id: str, record_ids: Iterable[str]):
+        self.backend.delete_many(kind, event_id, record_ids)
+    
+    def forget_event(self, event_id: str):
+        """Drop every stored record of an event"""
+        self.backend.delete_event(event_id)
+    
+    def close(self):
+        """Flush queued writes and close the backend (on shutdown)"""
+        self.backend.close()
 
 # Create a single instance of Storage
 storage = Storage()
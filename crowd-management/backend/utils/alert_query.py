@@ -0,0 +1,115 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from utils.pagination import clamp_limit, decode_cursor, encode_cursor
+
+# Upper bound on alerts inspected per page, so rare filters cannot turn a
+# request into a full scan; the caller just follows next_cursor.
+MAX_SCAN_PER_PAGE = 5000
+
+def _created_at(alert: Dict[str, Any]) -> datetime:
+    return alert.get("created_at") or datetime.min
+
+def _first_at_or_after(alerts: List[Dict[str, Any]], when: datetime) -> int:
+    """First index whose created_at >= when (alerts are stored oldest first)"""
+    lo, hi = 0, len(alerts)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _created_at(alerts[mid]) < when:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def _first_after(alerts: List[Dict[str, Any]], when: datetime) -> int:
+    """First index whose created_at > when"""
+    lo, hi = 0, len(alerts)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _created_at(alerts[mid]) <= when:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def _parse_time(value: Optional[str], name: str) -> Optional[datetime]:
+    if value is None:
+        return None
+    try:
+        when = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO 8601 timestamp")
+    # created_at is naive local time; compare an offset timestamp in the same terms
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+    return when
+
+def page_alerts(alerts: List[Dict[str, Any]], cursor: Optional[str] = None, limit: Optional[int] = None,
+                status: Optional[str] = None, alert_type: Optional[str] = None,
+                assignee: Optional[str] = None, since: Optional[str] = None,
+                until: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Return one page of alerts, newest first, ordered by (created_at, id)
+
+    `alerts` must be stored oldest first. The cursor and the time range are
+    resolved by binary search, so the cost of a page does not grow with the
+    length of the event's history.
+    """
+    limit = clamp_limit(limit)
+    since_at = _parse_time(since, "since")
+    until_at = _parse_time(until, "until")
+
+    start = _first_at_or_after(alerts, since_at) if since_at else 0
+    end = _first_after(alerts, until_at) if until_at else len(alerts)
+
+    tie_at, tie_id = None, None
+    if cursor:
+        cursor_value, tie_id = decode_cursor(cursor)
+        tie_at = _parse_time(cursor_value, "cursor")
+        end = min(end, _first_after(alerts, tie_at))
+
+    page: List[Dict[str, Any]] = []
+    scanned = 0
+    full = False
+    i = end
+    while i > start and not full and scanned < MAX_SCAN_PER_PAGE:
+        # Take the group of alerts sharing one timestamp; within it, order by id
+        created = _created_at(alerts[i - 1])
+        j = i - 1
+        while j > start and _created_at(alerts[j - 1]) == created:
+            j -= 1
+        group = alerts[j:i]
+        if len(group) > 1:
+            group = sorted(group, key=lambda a: a["id"], reverse=True)
+
+        for alert in group:
+            if created == tie_at and alert["id"] >= tie_id:
+                continue
+            if _matches(alert, status, alert_type, assignee):
+                page.append(alert)
+                if len(page) == limit:
+                    full = True
+                    break
+        scanned += len(group)
+        i = j
+
+    next_cursor = None
+    if full:
+        last = page[-1]
+        next_cursor = encode_cursor(_created_at(last).isoformat(), last["id"])
+    elif i > start:
+        # Scan budget ran out; resume below the last group inspected
+        next_cursor = encode_cursor(_created_at(alerts[i]).isoformat(), "")
+
+    return {"alerts": page, "next_cursor": next_cursor, "limit": limit}
+
+def _matches(alert: Dict[str, Any], status: Optional[str], alert_type: Optional[str], assignee: Optional[str]) -> bool:
+    if status is not None and alert.get("status") != status:
+        return False
+    if alert_type is not None and alert.get("alert_type") != alert_type:
+        return False
+    if assignee is not None and alert.get("assigned_to") != assignee:
+        return False
+    return True
@@ -0,0 +1,156 @@
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import storage
+
+# Length of the rolling window used for rates, in seconds (one bucket per second)
+RATE_WINDOW_SECONDS = 60
+
+class AlertStats:
+    """
+    Incrementally maintained alert counters for a single event
+
+    Counters are updated on trigger, status change, assignment and delete so
+    reading them never touches the alert list. Rolling rates are kept in a ring
+    of per-second buckets, which makes a snapshot O(window) = O(1).
+    """
+
+    def __init__(self, window_seconds: int = RATE_WINDOW_SECONDS):
+        self.lock = threading.RLock()
+        self.total = 0
+        self.by_status: Dict[str, int] = {}
+        self.by_type: Dict[str, int] = {}
+        self.by_assignee: Dict[str, int] = {}
+        self.resolved_count = 0
+        self.resolve_seconds_total = 0.0
+
+        self._window = window_seconds
+        self._stamps = [0] * window_seconds
+        self._triggered = [0] * window_seconds
+        self._resolved = [0] * window_seconds
+        self._resolve_seconds = [0.0] * window_seconds
+
+    def _bucket(self, now: int) -> int:
+        """Return the ring index for second `now`, clearing it if it is stale"""
+        index = now % self._window
+        if self._stamps[index] != now:
+            self._stamps[index] = now
+            self._triggered[index] = 0
+            self._resolved[index] = 0
+            self._resolve_seconds[index] = 0.0
+        return index
+
+    @staticmethod
+    def _bump(counter: Dict[str, int], key: Optional[str], delta: int):
+        if key is None:
+            return
+        value = counter.get(key, 0) + delta
+        if value > 0:
+            counter[key] = value
+        else:
+            counter.pop(key, None)
+
+    def record_trigger(self, alert: Dict[str, Any]):
+        """Count a newly stored alert"""
+        with self.lock:
+            self.total += 1
+            self._bump(self.by_status, alert.get("status", "active"), 1)
+            self._bump(self.by_type, alert.get("alert_type", "unknown"), 1)
+            self._bump(self.by_assignee, alert.get("assigned_to"), 1)
+            self._triggered[self._bucket(int(time.time()))] += 1
+
+    def record_restored(self, alert: Dict[str, Any]):
+        """Count an alert loaded from storage: totals and time to resolve, but not the rolling rates"""
+        with self.lock:
+            self.total += 1
+            status = alert.get("status", "active")
+            self._bump(self.by_status, status, 1)
+            self._bump(self.by_type, alert.get("alert_type", "unknown"), 1)
+            self._bump(self.by_assignee, alert.get("assigned_to"), 1)
+            created_at, resolved_at = alert.get("created_at"), alert.get("resolved_at")
+            if status != "active" and isinstance(created_at, datetime) and isinstance(resolved_at, datetime):
+                self.resolved_count += 1
+                self.resolve_seconds_total += max(0.0, (resolved_at - created_at).total_seconds())
+
+    def record_status(self, alert: Dict[str, Any], previous_status: str):
+        """Move an alert between status counters and track time to resolve"""
+        with self.lock:
+            status = alert.get("status", "active")
+            if status == previous_status:
+                return
+            self._bump(self.by_status, previous_status, -1)
+            self._bump(self.by_status, status, 1)
+
+            if previous_status == "active" and status != "active":
+                created_at = alert.get("created_at")
+                resolved_at = alert.get("resolved_at") or datetime.now()
+                duration = 0.0
+                if isinstance(created_at, datetime):
+                    duration = max(0.0, (resolved_at - created_at).total_seconds())
+                self.resolved_count += 1
+                self.resolve_seconds_total += duration
+                index = self._bucket(int(time.time()))
+                self._resolved[index] += 1
+                self._resolve_seconds[index] += duration
+
+    def record_assign(self, previous_assignee: Optional[str], assignee: Optional[str]):
+        """Move an alert between assignee counters"""
+        with self.lock:
+            if previous_assignee == assignee:
+                return
+            self._bump(self.by_assignee, previous_assignee, -1)
+            self._bump(self.by_assignee, assignee, 1)
+
+    def record_delete(self, alert: Dict[str, Any]):
+        """Remove a deleted alert from every counter"""
+        with self.lock:
+            self.total = max(0, self.total - 1)
+            self._bump(self.by_status, alert.get("status", "active"), -1)
+            self._bump(self.by_type, alert.get("alert_type", "unknown"), -1)
+            self._bump(self.by_assignee, alert.get("assigned_to"), -1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a consistent copy of all counters and rolling rates"""
+        with self.lock:
+            now = int(time.time())
+            oldest = now - self._window
+            triggered = resolved = 0
+            resolve_seconds = 0.0
+            for index in range(self._window):
+                if self._stamps[index] > oldest:
+                    triggered += self._triggered[index]
+                    resolved += self._resolved[index]
+                    resolve_seconds += self._resolve_seconds[index]
+
+            active = self.by_status.get("active", 0)
+            minutes = self._window / 60
+            return {
+                "total_alerts": self.total,
+                "active_alerts": active,
+                "resolved_alerts": self.total - active,
+                "by_status": dict(self.by_status),
+                "by_type": dict(self.by_type),
+                "by_assignee": dict(self.by_assignee),
+                "rates": {
+                    "window_seconds": self._window,
+                    "alerts_per_minute": round(triggered / minutes, 2),
+                    "resolved_per_minute": round(resolved / minutes, 2),
+                    "mean_time_to_resolve_seconds": round(resolve_seconds / resolved, 1) if resolved else None
+                },
+                "mean_time_to_resolve_seconds": round(self.resolve_seconds_total / self.resolved_count, 1) if self.resolved_count else None
+            }
+
+_registry_lock = threading.Lock()
+
+def stats_for(event_id: str) -> AlertStats:
+    """Get (or lazily create) the stats tracker for an event"""
+    stats = storage.storage.alert_stats.get(event_id)
+    if stats is None:
+        with _registry_lock:
+            stats = storage.storage.alert_stats.get(event_id)
+            if stats is None:
+                stats = AlertStats()
+                storage.storage.alert_stats[event_id] = stats
+    return stats
@@ -0,0 +1,254 @@
+import heapq
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import storage
+from utils import event_locks
+from utils.alert_query import _parse_time
+
+# Resolved alerts older than this are moved out of memory into the archive
+ALERT_RETENTION_SECONDS = int(os.getenv("ALERT_RETENTION_SECONDS", "3600"))
+ALERT_ARCHIVE_DIR = os.getenv("ALERT_ARCHIVE_DIR", os.path.join("data", "alert_archive"))
+# Segments are rotated once they reach this size
+SEGMENT_MAX_BYTES = int(os.getenv("ALERT_ARCHIVE_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "to_dict"):
+        return value.to_dict()  # records.Record
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+class AlertArchive:
+    """
+    Append-only JSONL archive of alerts, split into size-bounded segments
+
+    Each segment keeps a small summary (event ids and created_at range) in
+    memory and in a sidecar file, so queries only open segments that can
+    contain matches.
+    """
+
+    def __init__(self, directory: str = ALERT_ARCHIVE_DIR, segment_max_bytes: int = SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.lock = threading.Lock()
+        self._segments: List[Dict[str, Any]] = []
+        self._loaded = False
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"alerts-{number:06d}.jsonl")
+
+    def _load(self):
+        """Discover existing segments and their summaries (once, lazily)"""
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("alerts-") and name.endswith(".jsonl")):
+                continue
+            path = os.path.join(self.directory, name)
+            summary = None
+            try:
+                with open(path + ".idx", "r") as f:
+                    summary = json.load(f)
+            except (OSError, ValueError):
+                summary = self._scan_summary(path)
+            summary["number"] = int(name[len("alerts-"):-len(".jsonl")])
+            summary["path"] = path
+            summary["event_ids"] = set(summary["event_ids"])
+            self._segments.append(summary)
+        self._loaded = True
+
+    @staticmethod
+    def _scan_summary(path: str) -> Dict[str, Any]:
+        summary = {"event_ids": set(), "min_created": None, "max_created": None, "count": 0}
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn write at the tail of a crashed segment
+                AlertArchive._extend_summary(summary, record)
+        summary["event_ids"] = list(summary["event_ids"])
+        return summary
+
+    @staticmethod
+    def _extend_summary(summary: Dict[str, Any], record: Dict[str, Any]):
+        summary["event_ids"].add(record.get("event_id"))
+        created = record.get("created_at")
+        if created:
+            if summary["min_created"] is None or created < summary["min_created"]:
+                summary["min_created"] = created
+            if summary["max_created"] is None or created > summary["max_created"]:
+                summary["max_created"] = created
+        summary["count"] += 1
+
+    def _write_sidecar(self, segment: Dict[str, Any]):
+        sidecar = {
+            "event_ids": sorted(e for e in segment["event_ids"] if e is not None),
+            "min_created": segment["min_created"],
+            "max_created": segment["max_created"],
+            "count": segment["count"]
+        }
+        with open(segment["path"] + ".idx", "w") as f:
+            json.dump(sidecar, f)
+
+    def _current_segment(self) -> Dict[str, Any]:
+        if self._segments:
+            current = self._segments[-1]
+            if os.path.getsize(current["path"]) < self.segment_max_bytes:
+                return current
+            self._write_sidecar(current)
+        number = self._segments[-1]["number"] + 1 if self._segments else 1
+        segment = {
+            "number": number,
+            "path": self._segment_path(number),
+            "event_ids": set(),
+            "min_created": None,
+            "max_created": None,
+            "count": 0
+        }
+        open(segment["path"], "a").close()
+        self._segments.append(segment)
+        return segment
+
+    def append(self, alerts: Iterable[Dict[str, Any]]) -> int:
+        """Append alerts to the current segment; returns the number written"""
+        with self.lock:
+            self._load()
+            segment = self._current_segment()
+            lines = []
+            for alert in alerts:
+                lines.append(json.dumps(alert, default=_json_default, separators=(",", ":")))
+                created = alert.get("created_at")
+                self._extend_summary(segment, {
+                    "event_id": alert.get("event_id"),
+                    "created_at": created.isoformat() if isinstance(created, datetime) else created
+                })
+            if not lines:
+                return 0
+            with open(segment["path"], "a") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._write_sidecar(segment)
+            return len(lines)
+
+    def query(self, event_id: str, since: Optional[str] = None, until: Optional[str] = None,
+              status: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Read archived alerts for an event in archive order
+
+        The cursor is "<segment>:<byte offset>" and resumes exactly where the
+        previous page stopped. since/until are parsed like the live alert
+        query's (400 if malformed).
+        """
+        # Archived created_at values are naive local isoformat strings, which order like the datetimes
+        since_at = _parse_time(since, "since")
+        until_at = _parse_time(until, "until")
+        since = since_at.isoformat() if since_at else None
+        until = until_at.isoformat() if until_at else None
+
+        with self.lock:
+            self._load()
+            segments = list(self._segments)
+
+        start_number, start_offset = 0, 0
+        if cursor:
+            try:
+                number, offset = cursor.split(":", 1)
+                start_number, start_offset = int(number), int(offset)
+            except ValueError:
+                raise ValueError("Invalid archive cursor")
+
+        results: List[Dict[str, Any]] = []
+        for segment in segments:
+            if segment["number"] < start_number or event_id not in segment["event_ids"]:
+                continue
+            if since and segment["max_created"] and segment["max_created"] < since:
+                continue
+            if until and segment["min_created"] and segment["min_created"] > until:
+                continue
+
+            with open(segment["path"], "rb") as f:
+                if segment["number"] == start_number:
+                    f.seek(start_offset)
+                while True:
+                    line = f.readline()
+                    if not line:
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("event_id") != event_id:
+                        continue
+                    created = record.get("created_at") or ""
+                    if (since and created < since) or (until and created > until):
+                        continue
+                    if status and record.get("status") != status:
+                        continue
+                    results.append(record)
+                    if len(results) >= limit:
+                        return {"alerts": results, "next_cursor": f"{segment['number']}:{f.tell()}"}
+        return {"alerts": results, "next_cursor": None}
+
+archive = AlertArchive()
+
+def note_resolved(event_id: str, alert: Dict[str, Any]):
+    """Queue a resolved alert for the retention sweep; caller holds the event lock"""
+    resolved_at = alert.get("resolved_at")
+    if alert.get("status") == "active" or not isinstance(resolved_at, datetime):
+        return
+    heapq.heappush(storage.storage.resolved_alerts.setdefault(event_id, []), (resolved_at, alert["id"]))
+
+def sweep_resolved_alerts(now: Optional[datetime] = None, retention_seconds: int = ALERT_RETENTION_SECONDS) -> int:
+    """
+    Move resolved alerts older than the retention threshold to the archive
+
+    Trims both the per-event lists and the global sos_alerts list so the
+    in-memory working set holds only active and recently resolved alerts.
+    Only events whose oldest queued resolution (see note_resolved) is past
+    the threshold are visited. Returns the number of alerts archived.
+    """
+    cutoff = (now or datetime.now()) - timedelta(seconds=retention_seconds)
+    archived_ids = set()
+
+    for event_id, queue in list(storage.storage.resolved_alerts.items()):
+        if not queue or queue[0][0] >= cutoff:
+            continue
+        with event_locks.lock_for(event_id):
+            queue = storage.storage.resolved_alerts.get(event_id)
+            due = {}
+            while queue and queue[0][0] < cutoff:
+                resolved_at, alert_id = heapq.heappop(queue)
+                due[alert_id] = resolved_at
+            # Entries go stale when an alert is reopened, resolved again or deleted
+            expired = [
+                alert for alert in storage.storage.event_alerts.get(event_id, [])
+                if alert["id"] in due and alert.get("status") != "active" and alert.get("resolved_at") == due[alert["id"]]
+            ]
+            if not expired:
+                continue
+            archive.append(expired)
+            expired_ids = {alert["id"] for alert in expired}
+            archived_ids |= expired_ids
+            # The archive now holds them, so the storage backend no longer needs to
+            storage.storage.forget_many("alert", event_id, expired_ids)
+            event_locks.remove_alerts(event_id, expired_ids)
+
+    if archived_ids:
+        forget_global_alerts(archived_ids)
+    return len(archived_ids)
+
+def forget_global_alerts(alert_ids):
+    """Drop alerts from the global sos_alerts list (after delete or archival)"""
+    with event_locks.feed_lock:
+        sos_alerts = storage.storage.sos_alerts
+        kept = [alert for alert in sos_alerts if alert["id"] not in alert_ids]
+        if len(kept) != len(sos_alerts):
+            sos_alerts.clear()
+            sos_alerts.extend(kept)
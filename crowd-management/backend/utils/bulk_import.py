@@ -0,0 +1,142 @@
+import csv
+import io
+import uuid
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Optional
+
+import storage
+from records import User
+from utils import event_counters, event_locks, login_index, participants
+
+# Rows parsed before each batch is applied under the event's lock
+IMPORT_BATCH_SIZE = 1000
+# Only the first errors are described in full; the per-row codes cover the rest
+MAX_REPORTED_ERRORS = 100
+
+NAME_COLUMNS = ("name", "user_name", "full_name")
+PHONE_COLUMNS = ("phone", "mobile", "phone_number")
+EMAIL_COLUMNS = ("email", "email_address")
+
+# One character per data row in the result summary
+ROW_CODES = {
+    "I": "imported",
+    "D": "duplicate (same phone and name already registered)",
+    "F": "rejected: event at full capacity",
+    "E": "invalid row"
+}
+
+def _column(columns: Dict[str, str], candidates) -> Optional[str]:
+    for candidate in candidates:
+        if candidate in columns:
+            return columns[candidate]
+    return None
+
+def import_participants(event_id: str, stream: BinaryIO) -> Dict[str, Any]:
+    """
+    Register participants from a CSV upload, reading it row by row
+
+    Needs a header with a name column (name/user_name/full_name); phone and
+    email columns are optional. Rows are applied in batches, each admitted
+    against capacity under a single acquisition of the event's lock. Raises
+    ValueError if the header is unusable or the event is deleted mid-import.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(text)
+        if not reader.fieldnames:
+            raise ValueError("CSV has no header row")
+        columns = {header.strip().lower(): header for header in reader.fieldnames if header}
+        name_col = _column(columns, NAME_COLUMNS)
+        if name_col is None:
+            raise ValueError(f"CSV needs a name column ({', '.join(NAME_COLUMNS)})")
+        phone_col = _column(columns, PHONE_COLUMNS)
+        email_col = _column(columns, EMAIL_COLUMNS)
+
+        codes: List[str] = []
+        errors: List[Dict[str, Any]] = []
+        seen = set()
+        batch: List[Dict[str, Any]] = []
+        batch_rows: List[int] = []
+        batch_ids = set()
+        event_users = storage.storage.event_users[event_id]
+
+        def flush():
+            with event_locks.lock_for(event_id):
+                if event_id not in storage.storage.events:
+                    raise ValueError("Event was deleted during the import")
+                admitted = event_counters.admit_many(event_id, batch)
+                joined = []
+                for user, row_index, ok in zip(batch, batch_rows, admitted):
+                    if ok:
+                        codes[row_index] = "I"
+                        joined.append(user)
+                    else:
+                        codes[row_index] = "F"
+                login_index.register_many(event_id, joined)
+                storage.storage.persist_many("user", event_id, joined)
+                participants.joined_many(event_id, joined)
+            batch.clear()
+            batch_rows.clear()
+            batch_ids.clear()
+
+        try:
+            for row in reader:
+                row_number = reader.line_num
+                name = (row.get(name_col) or "").strip()
+                phone = (row.get(phone_col) or "").strip() if phone_col else ""
+                email = (row.get(email_col) or "").strip() if email_col else ""
+                if not name:
+                    codes.append("E")
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append({"line": row_number, "error": "missing name"})
+                    continue
+
+                key = (login_index.normalize_phone(phone), login_index.normalize_name(name))
+                if phone and (key in seen or login_index.registered_in(event_id, phone, name)):
+                    codes.append("D")
+                    continue
+                if phone:
+                    seen.add(key)
+
+                # Short ids collide within tens of thousands of rows, so check before use
+                user_id = str(uuid.uuid4())[:8]
+                while user_id in event_users or user_id in batch_ids:
+                    user_id = str(uuid.uuid4())[:8]
+                batch_ids.add(user_id)
+
+                now = datetime.now()
+                codes.append("?")
+                batch.append(User(
+                    id=user_id,
+                    name=name,
+                    phone=phone or None,
+                    email=email or None,
+                    event_id=event_id,
+                    status="active",
+                    check_in_time=now,
+                    check_out_time=None,
+                    lat=None,
+                    lng=None,
+                    last_seen=None
+                ))
+                batch_rows.append(len(codes) - 1)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    flush()
+        except (csv.Error, UnicodeDecodeError) as e:
+            # Keep what was imported so far and report where parsing stopped
+            errors.append({"line": reader.line_num, "error": f"unreadable CSV: {e}"})
+        if batch:
+            flush()
+    finally:
+        text.detach()
+
+    return {
+        "rows": len(codes),
+        "imported": codes.count("I"),
+        "duplicates": codes.count("D"),
+        "rejected_full": codes.count("F"),
+        "invalid": codes.count("E"),
+        "results": "".join(codes),
+        "codes": ROW_CODES,
+        "errors": errors
+    }
@@ -0,0 +1,143 @@
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import storage
+from utils.geo import haversine
+from utils import poi_index
+from utils.spatial import KDTree, Projection
+
+# POI types that count as responders (fixed stations)
+RESPONDER_POI_TYPES = ("security", "medical", "first_aid")
+
+# Staff positions move constantly; rebuild the tree for them at most this often
+STAFF_REBUILD_INTERVAL_SECONDS = 1.0
+
+class ResponderIndex:
+    """
+    Per-event KD-tree over staff positions, merged with the POI index
+
+    Responder POIs come from the event's POIIndex (utils/poi_index.py). The
+    staff tree is rebuilt lazily on the next query after a change, so bursts
+    of staff pings cost a single rebuild.
+    """
+
+    def __init__(self, event_id: str):
+        self.event_id = event_id
+        self.lock = threading.Lock()
+        self._tree: Optional[KDTree] = None
+        self._projection: Optional[Projection] = None
+        self._dirty = True
+        self._staff_dirty = False
+        self._built_at = 0.0
+
+    def invalidate(self, staff_only: bool = False):
+        if staff_only:
+            self._staff_dirty = True
+        else:
+            self._dirty = True
+
+    def _responders(self) -> List[Dict[str, Any]]:
+        responders = []
+        for staff in list(storage.storage.event_staff.get(self.event_id, {}).values()):
+            if staff.get("lat") is not None and staff.get("lng") is not None:
+                responders.append({"kind": "staff", "id": staff["id"], "type": staff.get("role", "security"), "ref": staff})
+        return responders
+
+    def _tree_for_query(self) -> Optional[KDTree]:
+        with self.lock:
+            now = time.monotonic()
+            stale_staff = self._staff_dirty and now - self._built_at >= STAFF_REBUILD_INTERVAL_SECONDS
+            if self._tree is None or self._dirty or stale_staff:
+                responders = self._responders()
+                if responders:
+                    event = storage.storage.events.get(self.event_id, {})
+                    first = responders[0]["ref"]
+                    self._projection = Projection(
+                        event.get("lat") if event.get("lat") is not None else first["lat"],
+                        event.get("lng") if event.get("lng") is not None else first["lng"]
+                    )
+                    points = [(*self._projection.to_xy(r["ref"]["lat"], r["ref"]["lng"]), r) for r in responders]
+                    self._tree = KDTree(points)
+                else:
+                    self._tree = None
+                self._dirty = False
+                self._staff_dirty = False
+                self._built_at = now
+            return self._tree
+
+    def nearest(self, lat: float, lng: float, k: int = 5,
+                types: Optional[Iterable[str]] = None, include_busy: bool = False) -> List[Dict[str, Any]]:
+        """Return the k nearest available responders to a location"""
+        tree = self._tree_for_query()
+        wanted = set(types) if types else None
+
+        def usable(responder):
+            if wanted is not None and responder["type"] not in wanted:
+                return False
+            return include_busy or responder["ref"].get("available", True)
+
+        results = []
+        if tree is not None:
+            # Over-fetch a little: staff may have moved since the tree was built
+            x, y = self._projection.to_xy(lat, lng)
+            results = [_describe(responder, lat, lng) for _, responder in tree.nearest(x, y, k + 2, usable)]
+
+        poi_types = [t for t in RESPONDER_POI_TYPES if wanted is None or t in wanted]
+        if poi_types:
+            for match in poi_index.index_for(self.event_id).nearest(lat, lng, poi_types, k):
+                poi = match["poi"]
+                results.append(_describe({"kind": "poi", "id": poi["id"], "type": poi["type"], "ref": poi}, lat, lng))
+
+        results.sort(key=lambda r: r["distance"])
+        return results[:k]
+
+def _describe(responder: Dict[str, Any], lat: float, lng: float) -> Dict[str, Any]:
+    ref = responder["ref"]
+    return {
+        "kind": responder["kind"],
+        "id": responder["id"],
+        "type": responder["type"],
+        "name": ref.get("name"),
+        "lat": ref["lat"],
+        "lng": ref["lng"],
+        "available": ref.get("available", True),
+        "distance": round(haversine(lat, lng, ref["lat"], ref["lng"]), 2)
+    }
+
+def find_responder(event_id: str, responder_id: str, lat: float, lng: float) -> Optional[Dict[str, Any]]:
+    """Look up a specific staff member or responder POI by id"""
+    staff = storage.storage.event_staff.get(event_id, {}).get(responder_id)
+    if staff is not None and staff.get("lat") is not None:
+        return _describe({"kind": "staff", "id": staff["id"], "type": staff.get("role", "security"), "ref": staff}, lat, lng)
+    poi = storage.storage.event_pois.get(event_id, {}).get(responder_id)
+    if poi is not None and poi.get("type") in RESPONDER_POI_TYPES:
+        return _describe({"kind": "poi", "id": poi["id"], "type": poi["type"], "ref": poi}, lat, lng)
+    return None
+
+_registry_lock = threading.Lock()
+
+def index_for(event_id: str) -> ResponderIndex:
+    """Get (or lazily create) the responder index for an event"""
+    index = storage.storage.responder_indexes.get(event_id)
+    if index is None:
+        with _registry_lock:
+            index = storage.storage.responder_indexes.get(event_id)
+            if index is None:
+                index = ResponderIndex(event_id)
+                storage.storage.responder_indexes[event_id] = index
+    return index
+
+def staff_changed(event_id: str, removed: bool = False):
+    """Hook for staff position updates (removals rebuild immediately)"""
+    index = storage.storage.responder_indexes.get(event_id)
+    if index is not None:
+        index.invalidate(staff_only=not removed)
+
+def release_staff(event_id: str, alert_id: str):
+    """Make staff assigned to a finished alert available again"""
+    # Availability is read live by the query predicate, so no rebuild is needed
+    for staff in list(storage.storage.event_staff.get(event_id, {}).values()):
+        if staff.get("current_alert") == alert_id:
+            staff["available"] = True
+            staff["current_alert"] = None
@@ -0,0 +1,157 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import storage
+from utils.geo import haversine_matrix
+
+# Positions older than this are not considered live
+LIVE_LOCATION_SECONDS = 30
+
+# Cap on the size of one users x exits distance block (float64 cells, ~8 MB)
+MAX_BLOCK_CELLS = 1_000_000
+
+# While an evacuation is active, heartbeats refresh stale assignments at most this often
+REFRESH_INTERVAL_SECONDS = 2.0
+
+# One compute per event at a time; different events never wait on each other
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+# Events with a background refresh in flight (guarded by _registry_lock)
+_refreshing = set()
+
+def _lock_for(event_id: str) -> threading.Lock:
+    with _registry_lock:
+        return _locks.setdefault(event_id, threading.Lock())
+
+def exit_pois(event_id: str) -> List[Dict[str, Any]]:
+    return [poi for poi in list(storage.storage.event_pois.get(event_id, {}).values()) if poi.get("type") == "exit"]
+
+def live_positions(event_id: str, now: Optional[datetime] = None):
+    """Return (user_ids, lats, lngs) for positions reported within the live window"""
+    cutoff = (now or datetime.now()) - timedelta(seconds=LIVE_LOCATION_SECONDS)
+    user_ids, lats, lngs = [], [], []
+    for user_id, loc in list(storage.storage.event_locations.get(event_id, {}).items()):
+        if loc.get("timestamp", datetime.min) > cutoff:
+            user_ids.append(user_id)
+            lats.append(loc["lat"])
+            lngs.append(loc["lng"])
+    return user_ids, np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64)
+
+def assign_nearest_exits(lats, lngs, exit_lats, exit_lngs):
+    """
+    Index of the nearest exit and its distance for every user
+
+    Works in row blocks so memory stays bounded at MAX_BLOCK_CELLS however
+    large the crowd is.
+    """
+    n_users = len(lats)
+    n_exits = len(exit_lats)
+    nearest = np.empty(n_users, dtype=np.int64)
+    distances = np.empty(n_users, dtype=np.float64)
+    block = max(1, MAX_BLOCK_CELLS // max(n_exits, 1))
+    for start in range(0, n_users, block):
+        stop = min(start + block, n_users)
+        matrix = haversine_matrix(lats[start:stop], lngs[start:stop], exit_lats, exit_lngs)
+        idx = np.argmin(matrix, axis=1)
+        nearest[start:stop] = idx
+        distances[start:stop] = matrix[np.arange(stop - start), idx]
+    return nearest, distances
+
+def compute(event_id: str, force: bool = False) -> Dict[str, Any]:
+    """
+    Compute (or reuse) nearest-exit assignments for every live attendee
+
+    Results are cached against the event's location version and the current
+    exit set, so repeated calls without new heartbeats are free.
+    """
+    exits = exit_pois(event_id)
+    exit_key = tuple((poi["id"], poi["lat"], poi["lng"]) for poi in exits)
+    version = storage.storage.location_versions.get(event_id, 0)
+
+    def fresh():
+        cached = storage.storage.exit_assignments.get(event_id)
+        if cached and cached["version"] >= version and cached["exit_key"] == exit_key:
+            return cached
+        return None
+
+    cached = None if force else fresh()
+    if cached is not None:
+        return cached
+
+    with _lock_for(event_id):
+        # Whoever held the lock may already have computed this version
+        cached = None if force else fresh()
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        user_ids, lats, lngs = live_positions(event_id)
+        assignments: Dict[str, Dict[str, Any]] = {}
+        per_exit = {poi["id"]: 0 for poi in exits}
+
+        if exits and user_ids:
+            exit_lats = np.asarray([poi["lat"] for poi in exits], dtype=np.float64)
+            exit_lngs = np.asarray([poi["lng"] for poi in exits], dtype=np.float64)
+            nearest, distances = assign_nearest_exits(lats, lngs, exit_lats, exit_lngs)
+            for user_id, exit_index, distance in zip(user_ids, nearest.tolist(), distances.tolist()):
+                poi = exits[exit_index]
+                assignments[user_id] = {
+                    "exit_id": poi["id"],
+                    "name": poi.get("name"),
+                    "lat": poi["lat"],
+                    "lng": poi["lng"],
+                    "distance": round(distance, 2)
+                }
+                per_exit[poi["id"]] += 1
+
+        result = {
+            "event_id": event_id,
+            "version": version,
+            "exit_key": exit_key,
+            "computed_at": datetime.now(),
+            "compute_ms": round((time.perf_counter() - started) * 1000, 2),
+            "users": len(assignments),
+            "per_exit": per_exit,
+            "assignments": assignments
+        }
+        storage.storage.exit_assignments[event_id] = result
+        return result
+
+def summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a computation without the per-user table"""
+    return {k: v for k, v in result.items() if k not in ("assignments", "exit_key")}
+
+def _refresh_in_background(event_id: str):
+    try:
+        compute(event_id)
+    except Exception as e:
+        print(f"Evacuation refresh error: {e}")
+    finally:
+        with _registry_lock:
+            _refreshing.discard(event_id)
+
+def assignment_for(event_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Cached nearest exit for a user, refreshed in the background while an evacuation is active
+
+    Called on the heartbeat path, so it only ever reads the cache: once the
+    cached result is stale and older than the refresh interval, one
+    heartbeat starts a background recompute and carries on.
+    """
+    if event_id not in storage.storage.evacuations:
+        return None
+    cached = storage.storage.exit_assignments.get(event_id)
+    version = storage.storage.location_versions.get(event_id, 0)
+    if cached is None or (cached["version"] != version
+                          and (datetime.now() - cached["computed_at"]).total_seconds() >= REFRESH_INTERVAL_SECONDS):
+        with _registry_lock:
+            start = event_id not in _refreshing
+            _refreshing.add(event_id)
+        if start:
+            threading.Thread(target=_refresh_in_background, args=(event_id,), daemon=True).start()
+    if cached is None:
+        return None
+    return cached["assignments"].get(user_id)
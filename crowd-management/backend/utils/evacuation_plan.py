@@ -0,0 +1,272 @@
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+import storage
+from utils.evacuation import exit_pois, live_positions
+from utils.geo import haversine_matrix
+
+# Defaults used when an exit POI has no "capacity" (people per minute)
+DEFAULT_EXIT_CAPACITY_PER_MIN = 60.0
+DEFAULT_WALKING_SPEED_MPS = 1.2
+
+# Horizons tried when scanning for the best capacity limit (cold / warm start)
+HORIZON_STEPS = 6
+WARM_HORIZON_STEPS = 3
+MAX_AUCTION_ROUNDS = 8
+PRICE_EPSILON = 1e-3
+
+# Background re-plans triggered by heartbeats run at most this often
+REPLAN_INTERVAL_SECONDS = 5.0
+
+OBJECTIVES = ("makespan", "total")
+
+_lock = threading.Lock()
+# Events with a background re-plan in flight (guarded by _replanning_lock)
+_replanning = set()
+_replanning_lock = threading.Lock()
+
+def _evaluate(walk, choice, capacity_per_s, n_exits):
+    """Per-exit loads and egress times for an assignment"""
+    loads = np.bincount(choice, minlength=n_exits).astype(np.float64)
+    walk_chosen = walk[np.arange(len(choice)), choice].astype(np.float64)
+    # A person's egress = walk to the exit + time for the queue ahead of them to clear;
+    # approximated by the exit's full clearance time for the worst case and half of it on average
+    clearance = loads / capacity_per_s
+    max_walk = np.zeros(n_exits)
+    np.maximum.at(max_walk, choice, walk_chosen)
+    finish = np.where(loads > 0, max_walk + clearance, 0.0)
+    total = float(walk_chosen.sum() + (loads * clearance / 2).sum())
+    return loads, finish, total
+
+def _auction(walk, limits, prices, max_rounds: int = MAX_AUCTION_ROUNDS):
+    """
+    Move exit prices towards a capacity-respecting assignment
+
+    Everyone bids for the exit minimising walk time + price. Each overloaded
+    exit then raises its price by just enough to push out its excess: the
+    people with the smallest margin over their second-best exit leave first.
+    Neighbouring exits can trade the same people back and forth, so this runs
+    for a bounded number of rounds and `_fill` settles whatever is left.
+    """
+    n_exits = walk.shape[1]
+    for _ in range(max_rounds):
+        choice = np.argmin(walk + prices.astype(walk.dtype)[None, :], axis=1)
+        loads = np.bincount(choice, minlength=n_exits)
+        over = np.nonzero(loads > limits)[0]
+        if len(over) == 0 or n_exits < 2:
+            break
+
+        rows = np.nonzero(np.isin(choice, over))[0]
+        costs = walk[rows] + prices.astype(walk.dtype)[None, :]
+        best_two = np.partition(costs, 1, axis=1)[:, :2]
+        margins = (best_two[:, 1] - best_two[:, 0]).astype(np.float64)
+        row_choice = choice[rows]
+        for exit_index in over:
+            member_margins = margins[row_choice == exit_index]
+            excess = int(loads[exit_index] - limits[exit_index])
+            prices[exit_index] += np.partition(member_margins, excess - 1)[excess - 1] + PRICE_EPSILON
+    return prices
+
+def _fill(cost, limits):
+    """
+    Capacity-respecting assignment from a cost matrix
+
+    Unassigned people propose to their cheapest open exit; each exit accepts
+    the cheapest proposers up to its remaining capacity and closes when full.
+    Every round closes an exit or places everyone, so it takes at most
+    n_exits rounds.
+    """
+    n_people, n_exits = cost.shape
+    choice = np.full(n_people, -1, dtype=np.int64)
+    remaining = limits.astype(np.int64).copy()
+    pending = np.arange(n_people)
+    while len(pending):
+        open_exits = remaining > 0
+        if not open_exits.any():
+            # Limits too tight for everyone; the rest go to their cheapest exit
+            choice[pending] = np.argmin(cost[pending], axis=1)
+            break
+        rows = cost[pending]
+        rows[:, ~open_exits] = np.inf
+        pick = np.argmin(rows, axis=1)
+        picked_cost = rows[np.arange(len(pending)), pick]
+
+        order = np.lexsort((picked_cost, pick))
+        sorted_pick = pick[order]
+        group_start = np.searchsorted(sorted_pick, sorted_pick, side="left")
+        rank = np.arange(len(order)) - group_start
+        accepted = order[rank < remaining[sorted_pick]]
+
+        choice[pending[accepted]] = pick[accepted]
+        remaining -= np.bincount(pick[accepted], minlength=n_exits)
+        keep = np.ones(len(pending), dtype=bool)
+        keep[accepted] = False
+        pending = pending[keep]
+    return choice
+
+def solve(walk, capacity_per_s, objective: str = "makespan", prices=None, horizon: Optional[float] = None,
+          steps: int = HORIZON_STEPS) -> Dict[str, Any]:
+    """
+    Assign people to exits respecting per-exit throughput
+
+    walk is an (people x exits) matrix of walking times in seconds. For a
+    horizon H each exit may take at most capacity * H people, which turns the
+    problem into a capacitated assignment solved by `_auction`. H is scanned
+    downwards on a geometric grid from the nearest-exit clearance time to the
+    theoretical minimum (everyone / total throughput); prices carry over
+    between steps because tighter limits only ever raise them. The assignment
+    with the best objective (worst-case or total egress time) wins.
+
+    Passing the previous plan's prices and horizon warm-starts a re-plan,
+    which then only probes a few horizons around the old optimum.
+    """
+    n_people, n_exits = walk.shape
+    prices = np.zeros(n_exits) if prices is None else np.asarray(prices, dtype=np.float64).copy()
+
+    nearest = np.argmin(walk, axis=1)
+    _, nearest_finish, _ = _evaluate(walk, nearest, capacity_per_s, n_exits)
+    h_min = n_people / capacity_per_s.sum()
+    h_max = max(float((np.bincount(nearest, minlength=n_exits) / capacity_per_s).max()), h_min)
+    if horizon is not None:
+        h_max = min(h_max, horizon * 1.25)
+        h_min = max(h_min, horizon * 0.8)
+    horizons = np.geomspace(h_max, h_min, num=max(steps, 2))
+
+    best = None
+    rounds_total = 0
+    for h in horizons:
+        limits = np.ceil(capacity_per_s * h).astype(np.int64)
+        prices = _auction(walk, limits, prices)
+        choice = _fill(walk + prices.astype(walk.dtype)[None, :], limits)
+        rounds_total += 1
+        loads, finish, total = _evaluate(walk, choice, capacity_per_s, n_exits)
+        score = float(finish.max()) if objective == "makespan" else total
+        if best is None or score < best["score"]:
+            best = {"score": score, "choice": choice, "loads": loads, "finish": finish,
+                    "total": total, "prices": prices.copy(), "horizon": float(h)}
+
+    best["horizons_tried"] = rounds_total
+    best["nearest_worst_case"] = float(nearest_finish.max())
+    return best
+
+def plan(event_id: str, objective: str = "makespan", capacities: Optional[Dict[str, float]] = None,
+         walking_speed: float = DEFAULT_WALKING_SPEED_MPS, warm_start: bool = True) -> Dict[str, Any]:
+    """Plan exit assignments for every live attendee and cache the result"""
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of: {', '.join(OBJECTIVES)}")
+
+    with _lock:
+        started = time.perf_counter()
+        exits = exit_pois(event_id)
+        user_ids, lats, lngs = live_positions(event_id)
+        version = storage.storage.location_versions.get(event_id, 0)
+        previous = storage.storage.evacuation_plans.get(event_id)
+        overrides = capacities if capacities is not None else (previous or {}).get("capacities", {})
+
+        result = {
+            "event_id": event_id,
+            "objective": objective,
+            "version": version,
+            "computed_at": datetime.now(),
+            "walking_speed": walking_speed,
+            "capacities": dict(overrides),
+            "users": len(user_ids),
+            "exits": [],
+            "assignments": {},
+            "worst_case_seconds": None,
+            "total_seconds": None,
+            "horizons_tried": 0,
+            "horizon": None,
+            "prices": {}
+        }
+
+        if exits and user_ids:
+            capacity_per_min = np.asarray([
+                float(overrides.get(poi["id"]) or poi.get("capacity") or DEFAULT_EXIT_CAPACITY_PER_MIN)
+                for poi in exits
+            ])
+            capacity_per_s = capacity_per_min / 60.0
+            exit_lats = np.asarray([poi["lat"] for poi in exits], dtype=np.float64)
+            exit_lngs = np.asarray([poi["lng"] for poi in exits], dtype=np.float64)
+            # float32 keeps 50k x 50 walking times around 10 MB
+            walk = (haversine_matrix(lats, lngs, exit_lats, exit_lngs) / walking_speed).astype(np.float32)
+
+            warm = (warm_start and previous is not None and previous.get("objective") == objective
+                    and previous.get("horizon") is not None)
+            if warm:
+                # Prices only rise inside the auction, so start slightly below the old ones
+                prices = [0.9 * previous["prices"].get(poi["id"], 0.0) for poi in exits]
+                best = solve(walk, capacity_per_s, objective, prices, previous["horizon"], WARM_HORIZON_STEPS)
+            else:
+                best = solve(walk, capacity_per_s, objective)
+
+            choice = best["choice"].tolist()
+            walk_chosen = walk[np.arange(len(choice)), best["choice"]].tolist()
+            for user_id, exit_index, walk_seconds in zip(user_ids, choice, walk_chosen):
+                poi = exits[exit_index]
+                result["assignments"][user_id] = {
+                    "exit_id": poi["id"],
+                    "name": poi.get("name"),
+                    "lat": poi["lat"],
+                    "lng": poi["lng"],
+                    "walk_seconds": round(walk_seconds, 1)
+                }
+            for index, poi in enumerate(exits):
+                result["exits"].append({
+                    "exit_id": poi["id"],
+                    "name": poi.get("name"),
+                    "capacity_per_min": capacity_per_min[index],
+                    "assigned": int(best["loads"][index]),
+                    "clearance_seconds": round(float(best["finish"][index]), 1)
+                })
+            result["worst_case_seconds"] = round(float(best["finish"].max()), 1)
+            result["total_seconds"] = round(best["total"], 1)
+            result["horizons_tried"] = best["horizons_tried"]
+            result["horizon"] = best["horizon"]
+            result["nearest_exit_worst_case_seconds"] = round(best["nearest_worst_case"], 1)
+            result["warm_start"] = warm
+            result["prices"] = {poi["id"]: float(best["prices"][i]) for i, poi in enumerate(exits)}
+
+        result["compute_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        storage.storage.evacuation_plans[event_id] = result
+        return result
+
+def summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a plan without the per-user table and solver state"""
+    return {k: v for k, v in result.items() if k not in ("assignments", "prices")}
+
+def _replan_in_background(event_id: str):
+    try:
+        previous = storage.storage.evacuation_plans.get(event_id) or {}
+        plan(event_id, previous.get("objective", "makespan"),
+             walking_speed=previous.get("walking_speed", DEFAULT_WALKING_SPEED_MPS))
+    except Exception as e:
+        print(f"Evacuation re-plan error: {e}")
+    finally:
+        with _replanning_lock:
+            _replanning.discard(event_id)
+
+def assignment_for(event_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Planned exit for a user, from the cached plan
+
+    If positions have moved on since the plan was computed, a warm-started
+    re-plan is kicked off in a background thread; callers never wait for it.
+    """
+    current = storage.storage.evacuation_plans.get(event_id)
+    if current is None:
+        return None
+    version = storage.storage.location_versions.get(event_id, 0)
+    stale = current["version"] != version
+    age = (datetime.now() - current["computed_at"]).total_seconds()
+    if stale and age >= REPLAN_INTERVAL_SECONDS:
+        with _replanning_lock:
+            start = event_id not in _replanning
+            _replanning.add(event_id)
+        if start:
+            threading.Thread(target=_replan_in_background, args=(event_id,), daemon=True).start()
+    return current["assignments"].get(user_id)
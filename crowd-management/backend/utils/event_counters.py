@@ -0,0 +1,139 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import storage
+
+class EventCounters:
+    """
+    Head counts for one event, changed only under the event's lock
+
+    registered: everyone who joined
+    checked_in: participants currently with status checked_in
+    on_site: participants not checked out (active or checked in); this is
+             what max_capacity limits
+
+    Listings read these instead of recounting, and admission decisions are
+    made under the same lock as the counter update, so concurrent joins from
+    the threadpool cannot overshoot the capacity.
+    """
+
+    __slots__ = ("lock", "registered", "checked_in", "on_site")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.registered = 0
+        self.checked_in = 0
+        self.on_site = 0
+
+    def _apply(self, status: Optional[str], sign: int):
+        if status == "checked_in":
+            self.checked_in += sign
+        if status != "checked_out":
+            self.on_site += sign
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"registered": self.registered, "checked_in": self.checked_in, "on_site": self.on_site}
+
+def _capacity(event_id: str) -> Optional[int]:
+    return storage.storage.events.get(event_id, {}).get("max_capacity")
+
+_registry_lock = threading.Lock()
+
+def counters_for(event_id: str) -> EventCounters:
+    """Get (or lazily build from the stored participants) an event's counters"""
+    counters = storage.storage.event_counters.get(event_id)
+    if counters is None:
+        with _registry_lock:
+            counters = storage.storage.event_counters.get(event_id)
+            if counters is None:
+                counters = EventCounters()
+                for user in list(storage.storage.event_users.get(event_id, {}).values()):
+                    counters.registered += 1
+                    counters._apply(user.get("status"), 1)
+                storage.storage.event_counters[event_id] = counters
+    return counters
+
+def admit(event_id: str, user: Dict[str, Any]) -> bool:
+    """
+    Store a new participant if the event has room
+
+    The capacity check and the insert happen under the event's lock, so the
+    decision is atomic. Returns False (and stores nothing) when full.
+    """
+    counters = counters_for(event_id)
+    capacity = _capacity(event_id)
+    with counters.lock:
+        if capacity is not None and user.get("status") != "checked_out" and counters.on_site >= capacity:
+            return False
+        storage.storage.event_users[event_id][user["id"]] = user
+        counters.registered += 1
+        counters._apply(user.get("status"), 1)
+        return True
+
+def admit_many(event_id: str, users: Iterable[Dict[str, Any]]) -> List[bool]:
+    """Batch version of admit: one lock acquisition for the whole batch, admitted in order"""
+    counters = counters_for(event_id)
+    capacity = _capacity(event_id)
+    event_users = storage.storage.event_users[event_id]
+    admitted = []
+    with counters.lock:
+        for user in users:
+            if capacity is not None and user.get("status") != "checked_out" and counters.on_site >= capacity:
+                admitted.append(False)
+                continue
+            event_users[user["id"]] = user
+            counters.registered += 1
+            counters._apply(user.get("status"), 1)
+            admitted.append(True)
+    return admitted
+
+def set_status(event_id: str, user: Dict[str, Any], status: str) -> bool:
+    """
+    Change a participant's status and the counters together
+
+    Re-admitting a checked-out participant needs a free place; returns False
+    (leaving the status unchanged) if the event is full.
+    """
+    counters = counters_for(event_id)
+    capacity = _capacity(event_id)
+    with counters.lock:
+        previous = user.get("status")
+        if previous == status:
+            return True
+        if (previous == "checked_out" and status != "checked_out"
+                and capacity is not None and counters.on_site >= capacity):
+            return False
+        counters._apply(previous, -1)
+        user["status"] = status
+        counters._apply(status, 1)
+        return True
+
+def set_status_many(event_id: str, users: Iterable[Dict[str, Any]], status: str) -> List[str]:
+    """
+    Batch version of set_status under one lock acquisition
+
+    Returns one outcome per user: "updated", "unchanged" or "full".
+    """
+    counters = counters_for(event_id)
+    capacity = _capacity(event_id)
+    outcomes = []
+    with counters.lock:
+        for user in users:
+            previous = user.get("status")
+            if previous == status:
+                outcomes.append("unchanged")
+                continue
+            if (previous == "checked_out" and status != "checked_out"
+                    and capacity is not None and counters.on_site >= capacity):
+                outcomes.append("full")
+                continue
+            counters._apply(previous, -1)
+            user["status"] = status
+            counters._apply(status, 1)
+            outcomes.append("updated")
+    return outcomes
+
+def snapshot(event_id: str) -> Dict[str, Any]:
+    counts = counters_for(event_id).snapshot()
+    counts["max_capacity"] = _capacity(event_id)
+    return counts
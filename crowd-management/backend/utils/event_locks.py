@@ -0,0 +1,78 @@
+"""
+Concurrency model for the per-event state in storage
+
+Sync handlers run in the threadpool and async ones on the event loop, so:
+
+- Writers: a change to one event's state that is more than a single
+  assignment (check-then-insert, remove, multi-field update, deleting the
+  event) runs under that event's lock from lock_for(). Locks are sharded by
+  event id, so different events never contend; there is no global lock.
+- Readers take no lock and work on snapshots. Alert lists are copy-on-write:
+  writers publish a new list and never change one in place, so a list
+  fetched from storage can be iterated safely. Dicts that writers insert
+  into are iterated through a list(...) copy, which CPython takes in one
+  step without running Python code.
+- Single assignments need no lock (e.g. a heartbeat storing a Location).
+- Lock order: the event lock first, then the finer locks of per-event
+  structures (EventCounters, ParticipantIndex, ZoneIndex, ...), never the
+  reverse. The global SOS feed has its own small lock.
+"""
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+
+import storage
+
+_registry_lock = threading.Lock()
+# Guards the global sos_alerts feed (shared by every event)
+feed_lock = threading.Lock()
+
+def lock_for(event_id: str) -> threading.RLock:
+    """Get (or lazily create) the write lock for an event"""
+    lock = storage.storage.event_locks.get(event_id)
+    if lock is None:
+        with _registry_lock:
+            lock = storage.storage.event_locks.get(event_id)
+            if lock is None:
+                lock = threading.RLock()
+                storage.storage.event_locks[event_id] = lock
+    return lock
+
+def drop(event_id: str):
+    """Forget an event's lock after the event is deleted"""
+    storage.storage.event_locks.pop(event_id, None)
+
+def append_alert(event_id: str, alert: Any, feed: bool = False):
+    """Publish an alert (optionally also on the global SOS feed); caller holds the event lock"""
+    alerts = storage.storage.event_alerts.get(event_id, [])
+    storage.storage.event_alerts[event_id] = alerts + [alert]
+    if feed:
+        with feed_lock:
+            storage.storage.sos_alerts.appendleft(alert)
+
+def remove_alerts(event_id: str, alert_ids: Iterable[str]) -> List[Any]:
+    """Unpublish alerts by id and return them; caller holds the event lock"""
+    alert_ids = set(alert_ids)
+    alerts = storage.storage.event_alerts.get(event_id)
+    if not alerts or not alert_ids:
+        return []
+    removed = [alert for alert in alerts if alert["id"] in alert_ids]
+    if removed:
+        storage.storage.event_alerts[event_id] = [alert for alert in alerts if alert["id"] not in alert_ids]
+    return removed
+
+def find_alert(alert_id: str, event_id: Optional[str] = None) -> Tuple[Optional[str], Any]:
+    """
+    Locate a published alert, returning (event_id, alert) or (None, None)
+
+    Lock-free; a writer that found the alert this way re-checks it under the
+    event lock by passing the event_id, which only scans that event's list.
+    """
+    if event_id is not None:
+        candidates = [(event_id, storage.storage.event_alerts.get(event_id, []))]
+    else:
+        candidates = list(storage.storage.event_alerts.items())
+    for candidate_event, alerts in candidates:
+        for alert in alerts:
+            if alert["id"] == alert_id:
+                return candidate_event, alert
+    return None, None
@@ -0,0 +1,272 @@
+"""
+Offline gazetteer for location search autocomplete
+
+An optional list of places (venues, gates, landmarks, towns) imported from
+a CSV file and searched locally before falling back to Nominatim, so
+autocomplete answers in well under a millisecond and keeps working on a
+venue network without internet.
+
+The index is a sorted array of normalised keys: every place contributes its
+full name, each word-suffix of it ("nehru stadium", "stadium") and its
+alternate names. A query is a prefix range found by bisection; prefixes so
+broad that their range is large get their top results precomputed at build
+time, so short queries never scan. An import builds a new index and swaps
+it in; searches never wait on it.
+"""
+import csv
+import heapq
+import io
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+# Place file restored on start and rewritten by each import
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join("data", "gazetteer.csv"))
+# Prefix ranges larger than this get their top results precomputed
+SCAN_LIMIT = 256
+# Results kept per precomputed prefix (the search limit is capped to this)
+MAX_RESULTS = 10
+
+NAME_COLUMNS = ("name", "place", "title")
+LAT_COLUMNS = ("lat", "latitude")
+LNG_COLUMNS = ("lng", "lon", "long", "longitude")
+IMPORTANCE_COLUMNS = ("importance", "population", "rank")
+# Columns written by save(), in order
+SAVED_COLUMNS = ("id", "name", "lat", "lng", "importance", "type", "class", "display_name", "alt_names")
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+def normalize(text: str) -> str:
+    """Lowercase, accents and punctuation removed, single spaces"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", stripped.lower()).split())
+
+def _column(columns: Dict[str, str], candidates) -> Optional[str]:
+    for candidate in candidates:
+        if candidate in columns:
+            return columns[candidate]
+    return None
+
+class GazetteerIndex:
+    """Immutable search index over a list of places"""
+
+    # Match kinds, best first: the whole name, then a later word of it
+    FULL, WORD = 0, 1
+
+    def __init__(self, places: List[Dict[str, Any]]):
+        self.places = places
+        entries = []
+        for place_index, place in enumerate(places):
+            names = [place["name"]] + place.get("alt_names", [])
+            for name in names:
+                words = normalize(name).split()
+                for start in range(len(words)):
+                    kind = self.FULL if start == 0 else self.WORD
+                    entries.append((" ".join(words[start:]), place_index * 2 + kind))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        # Place index and match kind packed into one int per key
+        self.codes = array("I", (code for _, code in entries))
+        # Best places for prefixes (and exact keys) whose range is too large to scan per query
+        self.top: Dict[str, List[int]] = {}
+        self.exact_top: Dict[str, List[int]] = {}
+        self._precompute_top()
+
+    def _rank(self, code: int) -> Tuple[int, float, int]:
+        place = self.places[code >> 1]
+        return (code & 1, -place["importance"], len(place["name"]))
+
+    def _best(self, lo: int, hi: int, limit: int) -> List[int]:
+        """Best distinct places among keys[lo:hi]"""
+        candidates = heapq.nsmallest(limit * 2, self.codes[lo:hi], key=self._rank)
+        return self._distinct(candidates, limit)
+
+    @staticmethod
+    def _distinct(codes: List[int], limit: int) -> List[int]:
+        seen, result = set(), []
+        for code in codes:
+            place_index = code >> 1
+            if place_index not in seen:
+                seen.add(place_index)
+                result.append(place_index)
+                if len(result) == limit:
+                    break
+        return result
+
+    def _precompute_top(self):
+        # Walk down from the empty prefix, only into ranges that are still too large to scan
+        keys = self.keys
+        stack = [("", 0, len(keys))]
+        while stack:
+            prefix, lo, hi = stack.pop()
+            length = len(prefix) + 1
+            i = lo
+            while i < hi:
+                if len(keys[i]) < length:
+                    i += 1
+                    continue
+                child = keys[i][:length]
+                j = bisect_left(keys, child + "\uffff", i, hi)
+                if j - i > SCAN_LIMIT:
+                    self.top[child] = self._best(i, j, MAX_RESULTS)
+                    exact_end = bisect_right(keys, child, i, j)
+                    if exact_end - i > SCAN_LIMIT:
+                        self.exact_top[child] = self._best(i, exact_end, MAX_RESULTS)
+                    stack.append((child, i, j))
+                i = j
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Places whose name (or a word of it) starts with the query, best first"""
+        key = normalize(query)
+        if not key:
+            return []
+        limit = max(1, min(limit, MAX_RESULTS))
+        lo = bisect_left(self.keys, key)
+        exact_end = bisect_right(self.keys, key, lo)
+        # Names equal to the query come first, then the best of the prefix range
+        exact = self.exact_top.get(key)
+        if exact is None:
+            exact = self._best(lo, exact_end, limit)
+        top = self.top.get(key)
+        if top is None:
+            hi = bisect_left(self.keys, key + "\uffff", exact_end)
+            top = self._best(exact_end, hi, limit)
+        ranked = list(dict.fromkeys(exact + top))[:limit]
+        return [self._result(self.places[place_index]) for place_index in ranked]
+
+    @staticmethod
+    def _result(place: Dict[str, Any]) -> Dict[str, Any]:
+        # Same shape as utils.geo.search_locations results
+        return {
+            "id": place["id"],
+            "lat": place["lat"],
+            "lng": place["lng"],
+            "display_name": place["display_name"] or place["name"],
+            "address": {},
+            "type": place["type"],
+            "class": place["class"],
+            "source": "gazetteer"
+        }
+
+def parse_places(stream: BinaryIO) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Read places from a CSV file; returns (places, rows skipped)
+
+    Needs a header with name and lat/lng columns (see *_COLUMNS); id,
+    importance (or population), type, class, display_name and alt_names
+    (";"-separated) are optional. Raises ValueError if the header is unusable.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(text)
+        if not reader.fieldnames:
+            raise ValueError("Place file has no header row")
+        columns = {header.strip().lower(): header for header in reader.fieldnames if header}
+        name_col = _column(columns, NAME_COLUMNS)
+        lat_col = _column(columns, LAT_COLUMNS)
+        lng_col = _column(columns, LNG_COLUMNS)
+        if not (name_col and lat_col and lng_col):
+            raise ValueError("Place file needs name, lat and lng columns")
+        importance_col = _column(columns, IMPORTANCE_COLUMNS)
+        places, skipped = [], 0
+        for row in reader:
+            name = (row.get(name_col) or "").strip()
+            try:
+                lat = float(row.get(lat_col))
+                lng = float(row.get(lng_col))
+                importance = float(row.get(importance_col) or 0) if importance_col else 0.0
+            except (TypeError, ValueError):
+                skipped += 1
+                continue
+            if not normalize(name) or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                skipped += 1
+                continue
+            alt_names = [alt.strip() for alt in (row.get(columns.get("alt_names", "")) or "").split(";") if normalize(alt)]
+            places.append({
+                "id": (row.get(columns.get("id", "")) or "").strip() or f"gz{len(places)}",
+                "name": name,
+                "lat": lat,
+                "lng": lng,
+                "importance": importance,
+                "type": (row.get(columns.get("type", "")) or "").strip(),
+                "class": (row.get(columns.get("class", "")) or "").strip(),
+                "display_name": (row.get(columns.get("display_name", "")) or "").strip(),
+                "alt_names": alt_names
+            })
+        return places, skipped
+    finally:
+        text.detach()
+
+class Gazetteer:
+    """The current index (None until places are loaded or imported) and its place file"""
+
+    def __init__(self, path: str = GAZETTEER_PATH):
+        self.path = path
+        self.index: Optional[GazetteerIndex] = None
+        self.loaded_at: Optional[float] = None
+        self.lock = threading.Lock()  # serialises imports
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        index = self.index
+        return index.search(query, limit) if index is not None else []
+
+    def load(self):
+        """Build the index from the place file, if there is one (called from the app lifespan)"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                places, _ = parse_places(f)
+        except (OSError, ValueError) as e:
+            print(f"Gazetteer load error: {e}")
+            return
+        started = time.perf_counter()
+        self._swap(GazetteerIndex(places))
+        print(f"Gazetteer: {len(places)} places indexed in {time.perf_counter() - started:.2f}s")
+
+    def import_places(self, stream: BinaryIO) -> Dict[str, Any]:
+        """Replace the gazetteer with the places in a CSV upload and save it as the place file"""
+        places, skipped = parse_places(stream)
+        if not places:
+            raise ValueError("Place file has no usable rows")
+        with self.lock:
+            index = GazetteerIndex(places)
+            self._save(places)
+            self._swap(index)
+        return {"places": len(places), "skipped": skipped, "keys": len(index.keys)}
+
+    def _swap(self, index: GazetteerIndex):
+        self.index = index
+        self.loaded_at = time.time()
+
+    def _save(self, places: List[Dict[str, Any]]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Per-process temp name: shards may share one place file
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(SAVED_COLUMNS)
+            for place in places:
+                writer.writerow([place["id"], place["name"], place["lat"], place["lng"], place["importance"],
+                                 place["type"], place["class"], place["display_name"], ";".join(place["alt_names"])])
+        os.replace(temp_path, self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        index = self.index
+        return {
+            "enabled": index is not None,
+            "places": len(index.places) if index is not None else 0,
+            "keys": len(index.keys) if index is not None else 0,
+            "precomputed_prefixes": len(index.top) if index is not None else 0,
+            "loaded_at": self.loaded_at
+        }
+
+gazetteer = Gazetteer()
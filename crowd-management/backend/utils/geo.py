@@ -1,11 +1,22 @@
+import asyncio
 import math
-import httpx
+import os
+import numpy as np
 from typing import Optional, Dict, Any, List, Tuple
 from fastapi import HTTPException
+from utils.gazetteer import gazetteer
+from utils.geocoder import geocoder
 
 # Earth radius in meters and kilometers
 EARTH_RADIUS_METERS = 6371000
 EARTH_RADIUS_KM = 6371
+METERS_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_METERS / 180
+
+# Reverse geocoding snaps points to a grid of cells about this wide, so nearby
+# points share one (cached) lookup; 0 looks up the exact point
+REVERSE_GEOCODE_PRECISION_METERS = float(os.getenv("REVERSE_GEOCODE_PRECISION_METERS", "25"))
+# Upstream lookups in flight at once for a batch (public Nominatim allows very few)
+REVERSE_GEOCODE_CONCURRENCY = int(os.getenv("REVERSE_GEOCODE_CONCURRENCY", "4"))
 
 def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
     """Calculate distance between two points in meters using Haversine formula"""
@@ -81,6 +92,10 @@ def format_coordinates(lat: float, lng: float, precision: int = 6) -> str:
     lng_dir = "E" if lng >= 0 else "W"
     return f"{abs(lat):.{precision}f}°{lat_dir}, {abs(lng):.{precision}f}°{lng_dir}"
 
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a search, so repeats share a cache entry"""
+    return " ".join(query.split()).lower()
+
 async def geocode_address(address: str) -> Optional[Dict[str, float]]:
     """
     Convert an address to coordinates using Nominatim (free geocoding service)
@@ -92,74 +107,117 @@ async def geocode_address(address: str) -> Optional[Dict[str, float]]:
         Dictionary with lat and lng, or None if not found
     """
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                "https://nominatim.openstreetmap.org/search",
-                params={
-                    "q": address,
-                    "format": "json",
-                    "limit": 1,
-                    "addressdetails": 1
-                },
-                headers={"User-Agent": "CrowdManagementApp/1.0"}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data:
-                    return {
-                        "lat": float(data[0]["lat"]),
-                        "lng": float(data[0]["lon"]),
-                        "display_name": data[0].get("display_name", ""),
-                        "address": data[0].get("address", {})
-                    }
-            return None
+        data = await geocoder.get("/search", {
+            "q": normalize_query(address),
+            "format": "json",
+            "limit": 1,
+            "addressdetails": 1
+        })
+        if data:
+            return {
+                "lat": float(data[0]["lat"]),
+                "lng": float(data[0]["lon"]),
+                "display_name": data[0].get("display_name", ""),
+                "address": data[0].get("address", {})
+            }
+        return None
     except Exception as e:
         print(f"Geocoding error: {e}")
         return None
 
-async def reverse_geocode(lat: float, lng: float) -> Optional[Dict[str, Any]]:
+def reverse_bucket(lat: float, lng: float, precision_m: Optional[float] = None) -> Tuple[float, float]:
+    """
+    Centre of the grid cell (about precision_m on each side) a point falls in
+    
+    Rows are precision_m of latitude; each row is cut into columns of
+    precision_m along its own parallel, so cells stay roughly square away
+    from the equator.
+    """
+    if precision_m is None:
+        precision_m = REVERSE_GEOCODE_PRECISION_METERS
+    if precision_m <= 0:
+        return lat, lng
+    lat_step = precision_m / METERS_PER_DEGREE_LAT
+    row = math.floor((lat + 90) / lat_step)
+    center_lat = min(-90 + (row + 0.5) * lat_step, 90.0)
+    lng_step = min(lat_step / max(math.cos(math.radians(center_lat)), 1e-9), 360.0)
+    column = math.floor((lng + 180) / lng_step)
+    center_lng = min(-180 + (column + 0.5) * lng_step, 180.0)
+    # Rounded so every point of a cell yields the same geocoder cache key
+    return round(center_lat, 7), round(center_lng, 7)
+
+async def _reverse_lookup(lat: float, lng: float) -> Optional[Dict[str, Any]]:
+    """Nominatim's answer for a point, or None if it has none or the lookup failed"""
+    try:
+        data = await geocoder.get("/reverse", {
+            "lat": lat,
+            "lon": lng,
+            "format": "json",
+            "addressdetails": 1
+        })
+    except Exception as e:
+        print(f"Reverse geocoding error: {e}")
+        return None
+    return data or None
+
+def _address_of(data: Optional[Dict[str, Any]], lat: float, lng: float) -> Optional[Dict[str, Any]]:
+    if not data:
+        return None
+    return {
+        "display_name": data.get("display_name", ""),
+        "address": data.get("address", {}),
+        "lat": lat,
+        "lng": lng
+    }
+
+async def reverse_geocode(lat: float, lng: float, precision_m: Optional[float] = None) -> Optional[Dict[str, Any]]:
     """
     Convert coordinates to an address using Nominatim (reverse geocoding)
     
+    The lookup is made for the centre of the point's grid cell (see
+    reverse_bucket), so points in the same cell share a cached answer.
+    
     Args:
         lat: Latitude
         lng: Longitude
+        precision_m: Grid cell size (default REVERSE_GEOCODE_PRECISION_METERS)
         
     Returns:
         Dictionary with address details, or None if not found
     """
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                "https://nominatim.openstreetmap.org/reverse",
-                params={
-                    "lat": lat,
-                    "lon": lng,
-                    "format": "json",
-                    "addressdetails": 1
-                },
-                headers={"User-Agent": "CrowdManagementApp/1.0"}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data:
-                    return {
-                        "display_name": data.get("display_name", ""),
-                        "address": data.get("address", {}),
-                        "lat": lat,
-                        "lng": lng
-                    }
-            return None
-    except Exception as e:
-        print(f"Reverse geocoding error: {e}")
-        return None
+    data = await _reverse_lookup(*reverse_bucket(lat, lng, precision_m))
+    return _address_of(data, lat, lng)
+
+async def reverse_geocode_many(points: List[Tuple[float, float]],
+                               precision_m: Optional[float] = None) -> Tuple[List[Optional[Dict[str, Any]]], int]:
+    """
+    Reverse geocode many points, one lookup per distinct grid cell
+    
+    The cells are looked up concurrently, at most REVERSE_GEOCODE_CONCURRENCY
+    at a time.
+    
+    Returns:
+        (one address or None per point, in order; number of distinct cells)
+    """
+    cells = [reverse_bucket(lat, lng, precision_m) for lat, lng in points]
+    unique = list(dict.fromkeys(cells))
+    semaphore = asyncio.Semaphore(REVERSE_GEOCODE_CONCURRENCY)
+    
+    async def lookup(cell: Tuple[float, float]) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            return await _reverse_lookup(*cell)
+    
+    answers = dict(zip(unique, await asyncio.gather(*(lookup(cell) for cell in unique))))
+    results = [_address_of(answers[cell], lat, lng) for (lat, lng), cell in zip(points, cells)]
+    return results, len(unique)
 
 async def search_locations(query: str, limit: int = 5) -> List[Dict[str, Any]]:
     """
     Search for locations matching a query (like Google Maps autocomplete)
     
+    The offline gazetteer (utils/gazetteer.py) is consulted first; Nominatim
+    is only asked when it has no match.
+    
     Args:
         query: Search query
         limit: Maximum number of results
@@ -167,33 +225,28 @@ async def search_locations(query: str, limit: int = 5) -> List[Dict[str, Any]]:
     Returns:
         List of location matches with coordinates
     """
+    local = gazetteer.search(query, limit)
+    if local:
+        return local
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                "https://nominatim.openstreetmap.org/search",
-                params={
-                    "q": query,
-                    "format": "json",
-                    "limit": min(limit, 10),
-                    "addressdetails": 1
-                },
-                headers={"User-Agent": "CrowdManagementApp/1.0"}
-            )
-            
-            if response.status_code == 200:
-                results = []
-                for item in response.json():
-                    results.append({
-                        "id": item.get("osm_id"),
-                        "lat": float(item["lat"]),
-                        "lng": float(item["lon"]),
-                        "display_name": item.get("display_name", ""),
-                        "address": item.get("address", {}),
-                        "type": item.get("type", ""),
-                        "class": item.get("class", "")
-                    })
-                return results
-            return []
+        data = await geocoder.get("/search", {
+            "q": normalize_query(query),
+            "format": "json",
+            "limit": min(limit, 10),
+            "addressdetails": 1
+        })
+        results = []
+        for item in data:
+            results.append({
+                "id": item.get("osm_id"),
+                "lat": float(item["lat"]),
+                "lng": float(item["lon"]),
+                "display_name": item.get("display_name", ""),
+                "address": item.get("address", {}),
+                "type": item.get("type", ""),
+                "class": item.get("class", "")
+            })
+        return results
     except Exception as e:
         print(f"Location search error: {e}")
         return []
@@ -301,3 +354,130 @@ def is_point_in_polygon(lat: float, lng: float, polygon: List[Dict[str, float]])
         j = i
     
     return inside
+
+# ============= ARRAY API =============
+# Broadcasting versions of the scalar helpers above, for bulk work over many
+# points. Inputs may be scalars or NumPy arrays (any shapes that broadcast);
+# each performs the same arithmetic as its scalar counterpart, element-wise.
+
+def haversine_array(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Element-wise haversine distance in meters"""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_phi = np.radians(np.subtract(lat2, lat1))
+    delta_lambda = np.radians(np.subtract(lng2, lng1))
+    
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    
+    return EARTH_RADIUS_METERS * c
+
+def haversine_matrix(lats, lngs, other_lats, other_lngs) -> np.ndarray:
+    """Distances in meters between every pair, as a len(lats) x len(other_lats) matrix"""
+    return haversine_array(
+        np.asarray(lats, dtype=np.float64)[:, None], np.asarray(lngs, dtype=np.float64)[:, None],
+        np.asarray(other_lats, dtype=np.float64)[None, :], np.asarray(other_lngs, dtype=np.float64)[None, :]
+    )
+
+def calculate_bearing_array(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Element-wise bearing from point 1 to point 2 (in degrees)"""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_lambda = np.radians(np.subtract(lng2, lng1))
+    
+    x = np.sin(delta_lambda) * np.cos(phi2)
+    y = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(delta_lambda)
+    
+    theta = np.arctan2(x, y)
+    return (np.degrees(theta) + 360) % 360
+
+def get_destination_point_array(lat, lng, distance_meters, bearing) -> Tuple[np.ndarray, np.ndarray]:
+    """Element-wise destination points; returns (lats, lngs)"""
+    delta = np.divide(distance_meters, EARTH_RADIUS_METERS)
+    theta = np.radians(bearing)
+    
+    phi1 = np.radians(lat)
+    lambda1 = np.radians(lng)
+    
+    sin_phi1 = np.sin(phi1)
+    cos_phi1 = np.cos(phi1)
+    sin_delta = np.sin(delta)
+    cos_delta = np.cos(delta)
+    
+    sin_phi2 = sin_phi1 * cos_delta + cos_phi1 * sin_delta * np.cos(theta)
+    phi2 = np.arcsin(sin_phi2)
+    
+    y = np.sin(theta) * sin_delta * cos_phi1
+    x = cos_delta - sin_phi1 * sin_phi2
+    lambda2 = lambda1 + np.arctan2(y, x)
+    
+    return np.degrees(phi2), (np.degrees(lambda2) + 540) % 360 - 180
+
+def is_within_bounds_array(lat, lng, center_lat, center_lng, radius_meters) -> np.ndarray:
+    """Element-wise check that points lie within a radius of their center"""
+    return haversine_array(lat, lng, center_lat, center_lng) <= radius_meters
+
+def calculate_bounding_box_array(lat, lng, radius_meters) -> Dict[str, np.ndarray]:
+    """Element-wise bounding boxes; same keys as calculate_bounding_box"""
+    lat_delta = np.divide(radius_meters, 111320)
+    lng_delta = np.divide(radius_meters, 111320 * np.cos(np.radians(lat)))
+    
+    return {
+        "min_lat": np.subtract(lat, lat_delta),
+        "max_lat": np.add(lat, lat_delta),
+        "min_lng": np.subtract(lng, lng_delta),
+        "max_lng": np.add(lng, lng_delta)
+    }
+
+def points_in_polygon(lats, lngs, polygon: List[Dict[str, float]]) -> np.ndarray:
+    """
+    Ray casting for many points against one polygon
+    
+    Loops over the polygon's edges (not the points), so the cost is
+    O(vertices) vectorised operations over the point arrays.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    inside = np.zeros(np.broadcast(lats, lngs).shape, dtype=bool)
+    if not polygon or len(polygon) < 3:
+        return inside
+    
+    n = len(polygon)
+    j = n - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i in range(n):
+            pi = polygon[i]
+            pj = polygon[j]
+            
+            crosses = (pi["lat"] > lats) != (pj["lat"] > lats)
+            if pj["lat"] != pi["lat"]:
+                crosses &= lngs < (pj["lng"] - pi["lng"]) * (lats - pi["lat"]) / (pj["lat"] - pi["lat"]) + pi["lng"]
+            inside ^= crosses
+            
+            j = i
+    
+    return inside
+
+def points_in_polygons(lats, lngs, polygons: List[List[Dict[str, float]]]) -> np.ndarray:
+    """
+    Membership of many points in many polygons, as a points x polygons bool matrix
+    
+    Each polygon only ray-casts the points inside its bounding box.
+    """
+    lats = np.asarray(lats, dtype=np.float64).ravel()
+    lngs = np.asarray(lngs, dtype=np.float64).ravel()
+    result = np.zeros((len(lats), len(polygons)), dtype=bool)
+    
+    for k, polygon in enumerate(polygons):
+        if not polygon or len(polygon) < 3:
+            continue
+        poly_lats = [p["lat"] for p in polygon]
+        poly_lngs = [p["lng"] for p in polygon]
+        candidates = np.nonzero(
+            (lats >= min(poly_lats)) & (lats <= max(poly_lats)) &
+            (lngs >= min(poly_lngs)) & (lngs <= max(poly_lngs))
+        )[0]
+        if len(candidates):
+            result[candidates, k] = points_in_polygon(lats[candidates], lngs[candidates], polygon)
+    
+    return result
@@ -0,0 +1,145 @@
+"""
+Shared client for the Nominatim geocoding API (used by utils/geo.py)
+
+One pooled connection for all lookups, a TTL+LRU cache of responses
+(optionally saved to disk across restarts) and single-flight coalescing:
+identical lookups that arrive while one is in flight share its upstream
+request. Point NOMINATIM_BASE_URL at a local stub to test without network.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+
+NOMINATIM_BASE_URL = os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org")
+GEOCODE_TIMEOUT_SECONDS = float(os.getenv("GEOCODE_TIMEOUT_SECONDS", "10"))
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+GEOCODE_CACHE_TTL_SECONDS = float(os.getenv("GEOCODE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# JSON file the cache is restored from on start and saved to on shutdown (empty: memory only)
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "")
+USER_AGENT = "CrowdManagementApp/1.0"
+
+class TTLCache:
+    """LRU cache whose entries also expire after a fixed time (wall clock, so it survives a restart)"""
+
+    def __init__(self, max_entries: int = GEOCODE_CACHE_SIZE, ttl_seconds: float = GEOCODE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """(True, value) on a hit; a cached value may itself be empty"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def put(self, key: str, value: Any):
+        self._entries[key] = (time.time() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, path: str) -> int:
+        """Restore unexpired entries saved by save(); returns how many"""
+        try:
+            with open(path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        now = time.time()
+        for key, expires_at, value in saved:
+            if expires_at > now:
+                self._entries[key] = (expires_at, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return len(self._entries)
+
+    def save(self, path: str):
+        """Write the entries (oldest first) atomically"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump([[key, expires_at, value] for key, (expires_at, value) in self._entries.items()], f)
+        os.replace(temp_path, path)
+
+class Geocoder:
+    """Cached, coalescing GET requests against the Nominatim API (one instance per process)"""
+
+    def __init__(self, base_url: str = NOMINATIM_BASE_URL, cache: Optional[TTLCache] = None,
+                 cache_path: str = GEOCODE_CACHE_PATH):
+        self.base_url = base_url
+        self.cache = cache or TTLCache()
+        self.cache_path = cache_path
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def start(self):
+        """Restore the on-disk cache, if configured (called from the app lifespan)"""
+        if self.cache_path:
+            restored = self.cache.load(self.cache_path)
+            print(f"Geocode cache: {restored} entries restored")
+
+    async def close(self):
+        """Close the connection pool and save the cache, if configured"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.cache_path:
+            try:
+                self.cache.save(self.cache_path)
+            except OSError as e:
+                print(f"Geocode cache save error: {e}")
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created on first use, so it belongs to the event loop that serves requests
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=GEOCODE_TIMEOUT_SECONDS,
+                headers={"User-Agent": USER_AGENT},
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+            )
+        return self._client
+
+    async def get(self, path: str, params: Dict[str, Any]) -> Any:
+        """
+        JSON response of GET base_url + path, from the cache when possible
+
+        Raises on transport errors and non-2xx responses; those are not cached.
+        """
+        key = f"{path}?{urlencode(sorted(params.items()))}"
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, path, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded: a caller that goes away does not cancel the lookup for the others
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, path: str, params: Dict[str, Any]) -> Any:
+        response = await self._get_client().get(path, params=params)
+        response.raise_for_status()
+        value = response.json()
+        self.cache.put(key, value)
+        return value
+
+geocoder = Geocoder()
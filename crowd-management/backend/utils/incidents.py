@@ -0,0 +1,198 @@
+import math
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import storage
+
+# Repeated SOS calls from the same user within this window and cell are merged
+DEDUP_WINDOW_SECONDS = 120
+DEDUP_CELL_METERS = 50
+
+# Distinct SOS reports from the same area within this window form one incident
+INCIDENT_WINDOW_SECONDS = 600
+INCIDENT_CELL_METERS = 100
+
+# Only the first N alert ids are listed on an incident; counts keep going
+INCIDENT_MAX_ALERT_IDS = 50
+
+METERS_PER_DEGREE = 111320
+
+_lock = threading.Lock()
+_last_prune = 0.0
+
+def _cell(lat: float, lng: float, cell_meters: float) -> Tuple[int, int]:
+    """Quantize a coordinate to a roughly square grid cell of `cell_meters`"""
+    lat_step = cell_meters / METERS_PER_DEGREE
+    row = math.floor(lat / lat_step)
+    # Use the row's latitude so every point in a row shares the same lng step
+    lng_step = cell_meters / (METERS_PER_DEGREE * max(math.cos(math.radians(row * lat_step)), 0.01))
+    return row, math.floor(lng / lng_step)
+
+def _neighbours(cell: Tuple[int, int]):
+    row, col = cell
+    for d_row in (-1, 0, 1):
+        for d_col in (-1, 0, 1):
+            yield row + d_row, col + d_col
+
+def _prune_dedup(now: float):
+    """Drop dedup entries older than the window (oldest first, so amortized O(1))"""
+    dedup = storage.storage.sos_dedup
+    while dedup:
+        entry = next(iter(dedup.values()))
+        if now - entry["last_seen"] <= DEDUP_WINDOW_SECONDS:
+            break
+        dedup.popitem(last=False)
+
+def _prune_incidents(now: float):
+    """Evict resolved incidents and cell pointers once they are out of the window"""
+    global _last_prune
+    if now - _last_prune < 60:
+        return
+    _last_prune = now
+    for event_id, incidents in storage.storage.event_incidents.items():
+        stale = [
+            incident_id for incident_id, incident in incidents.items()
+            if now - incident["_last_seen_ts"] > INCIDENT_WINDOW_SECONDS and incident["status"] != "active"
+        ]
+        for incident_id in stale:
+            del incidents[incident_id]
+        cells = storage.storage.incident_cells.get(event_id, {})
+        for cell in [c for c, incident_id in cells.items() if incident_id not in incidents]:
+            del cells[cell]
+
+def _find_duplicate(event_id: str, user_id: Optional[str], cell) -> Optional[Dict[str, Any]]:
+    if not user_id:
+        return None
+    dedup = storage.storage.sos_dedup
+    for neighbour in _neighbours(cell):
+        entry = dedup.get((event_id, user_id, neighbour))
+        if entry and entry["alert"].get("status") == "active":
+            return entry
+    return None
+
+def _attach_to_incident(event_id: str, alert: Dict[str, Any], now: float):
+    """Add a new alert to the nearest live incident, or open a new one"""
+    incidents = storage.storage.event_incidents.setdefault(event_id, {})
+    cells = storage.storage.incident_cells.setdefault(event_id, {})
+    cell = _cell(alert["lat"], alert["lng"], INCIDENT_CELL_METERS)
+
+    incident = None
+    for neighbour in _neighbours(cell):
+        incident_id = cells.get(neighbour)
+        candidate = incidents.get(incident_id) if incident_id else None
+        if candidate is None:
+            cells.pop(neighbour, None)
+            continue
+        if candidate["status"] == "active" and now - candidate["_last_seen_ts"] <= INCIDENT_WINDOW_SECONDS:
+            incident = candidate
+            break
+
+    if incident is None:
+        incident = {
+            "id": str(uuid.uuid4())[:8],
+            "event_id": event_id,
+            "lat": alert["lat"],
+            "lng": alert["lng"],
+            "status": "active",
+            "alert_count": 0,
+            "active_alerts": 0,
+            "report_count": 0,
+            "alert_ids": [],
+            "user_ids": [],
+            "first_seen": alert["created_at"],
+            "last_seen": alert["created_at"],
+            "_last_seen_ts": now
+        }
+        incidents[incident["id"]] = incident
+
+    # Running centroid of all alerts in the incident
+    count = incident["alert_count"]
+    incident["lat"] = (incident["lat"] * count + alert["lat"]) / (count + 1)
+    incident["lng"] = (incident["lng"] * count + alert["lng"]) / (count + 1)
+    incident["alert_count"] = count + 1
+    incident["active_alerts"] += 1
+    incident["report_count"] += 1
+    incident["last_seen"] = alert["created_at"]
+    incident["_last_seen_ts"] = now
+    if len(incident["alert_ids"]) < INCIDENT_MAX_ALERT_IDS:
+        incident["alert_ids"].append(alert["id"])
+    user_id = alert.get("user_id")
+    if user_id and user_id not in incident["user_ids"] and len(incident["user_ids"]) < INCIDENT_MAX_ALERT_IDS:
+        incident["user_ids"].append(user_id)
+
+    cells[cell] = incident["id"]
+    alert["incident_id"] = incident["id"]
+
+def register_sos(event_id: str, alert: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+    """
+    Deduplicate and cluster an incoming SOS alert
+
+    Returns (alert, merged). When `merged` is True the returned alert is the
+    existing active alert the repeat was folded into and nothing new should be
+    stored; otherwise the given alert has been tagged with its incident id.
+    """
+    now = time.time()
+    cell = _cell(alert["lat"], alert["lng"], DEDUP_CELL_METERS)
+    user_id = alert.get("user_id")
+
+    with _lock:
+        _prune_dedup(now)
+        _prune_incidents(now)
+        entry = _find_duplicate(event_id, user_id, cell)
+        if entry is not None:
+            existing = entry["alert"]
+            existing["repeat_count"] = existing.get("repeat_count", 1) + 1
+            existing["last_seen_at"] = datetime.now()
+            entry["last_seen"] = now
+            storage.storage.sos_dedup.move_to_end(entry["key"])
+
+            incident = storage.storage.event_incidents.get(event_id, {}).get(existing.get("incident_id"))
+            if incident is not None:
+                incident["report_count"] += 1
+                incident["last_seen"] = existing["last_seen_at"]
+                incident["_last_seen_ts"] = now
+            return existing, True
+
+        alert.setdefault("repeat_count", 1)
+        alert.setdefault("last_seen_at", alert["created_at"])
+        _attach_to_incident(event_id, alert, now)
+        if user_id:
+            key = (event_id, user_id, cell)
+            storage.storage.sos_dedup[key] = {"key": key, "alert": alert, "last_seen": now}
+        return alert, False
+
+def release_alert(event_id: str, alert: Dict[str, Any]):
+    """Called when an active alert is resolved or deleted so its incident can close"""
+    with _lock:
+        if alert.get("user_id"):
+            cell = _cell(alert["lat"], alert["lng"], DEDUP_CELL_METERS)
+            storage.storage.sos_dedup.pop((event_id, alert["user_id"], cell), None)
+
+        incident = storage.storage.event_incidents.get(event_id, {}).get(alert.get("incident_id"))
+        if incident is None or incident["active_alerts"] == 0:
+            return
+        incident["active_alerts"] -= 1
+        if incident["active_alerts"] == 0:
+            incident["status"] = "resolved"
+
+def list_incidents(event_id: str, include_resolved: bool = False):
+    """Return incidents for an event, newest activity first"""
+    with _lock:
+        incidents = [
+            {k: v for k, v in incident.items() if not k.startswith("_")}
+            for incident in storage.storage.event_incidents.get(event_id, {}).values()
+            if include_resolved or incident["status"] == "active"
+        ]
+    incidents.sort(key=lambda x: x["last_seen"], reverse=True)
+    return incidents
+
+def drop_event(event_id: str):
+    """Forget all incident and dedup state for a deleted event"""
+    with _lock:
+        storage.storage.event_incidents.pop(event_id, None)
+        storage.storage.incident_cells.pop(event_id, None)
+        for key in [k for k in storage.storage.sos_dedup if k[0] == event_id]:
+            del storage.storage.sos_dedup[key]
@@ -0,0 +1,301 @@
+"""
+Event lifecycle: live -> read-only -> archived
+
+An event is live until its end_date, then read-only: participants can no
+longer join, check in/out, send heartbeats or raise SOS, while admins can
+still review and resolve. Once it has been over for EVENT_ARCHIVE_AFTER_SECONDS
+and nobody has touched it for EVENT_IDLE_SECONDS, the maintenance sweep
+compacts it into one gzipped file (participants, POIs, alerts, staff, zone
+definitions, the walkway graph and a summary; last locations, zone occupancy
+and evacuation plans are dropped, each participant keeps its last position)
+and evicts it from memory and from the storage backend.
+
+A request that names an archived event (RehydrateMiddleware) loads it back
+and writes it through to the backend again, so it behaves like any other
+ended event until the sweep archives it anew. Listing archived events only
+reads the small summary files.
+"""
+import gzip
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+import storage
+from utils import event_counters, event_locks, incidents, login_index, venue_graph, zones
+from utils.alert_stats import stats_for
+from utils.archive import forget_global_alerts
+from utils.persistence import dumps, loads
+
+EVENT_ARCHIVE_DIR = os.getenv("EVENT_ARCHIVE_DIR", os.path.join("data", "event_archive"))
+# How long after its end_date an event stays resident (read-only) before archival
+EVENT_ARCHIVE_AFTER_SECONDS = int(os.getenv("EVENT_ARCHIVE_AFTER_SECONDS", str(24 * 3600)))
+# An ended event accessed within this window is not archived (nor evicted right after a rehydrate)
+EVENT_IDLE_SECONDS = int(os.getenv("EVENT_IDLE_SECONDS", "3600"))
+
+# Requests scoped to one event (path prefix of routes/events.py)
+EVENT_PATH = re.compile(r"^/api/(?:admin/)?events/([^/]+)")
+
+@lru_cache(maxsize=4096)
+def _parse_end(end_date: Optional[str]) -> Optional[datetime]:
+    """end_date as a local naive datetime; a bare date means the end of that day"""
+    if not end_date:
+        return None
+    try:
+        end = datetime.fromisoformat(end_date)
+    except ValueError:
+        return None  # unparseable: treated as open-ended
+    if end.tzinfo is not None:
+        end = end.astimezone().replace(tzinfo=None)
+    if len(end_date) == 10:
+        end += timedelta(days=1)
+    return end
+
+def state_of(event: Dict[str, Any], now: Optional[datetime] = None) -> str:
+    """"live" or "read_only" for a resident event"""
+    end = _parse_end(event.get("end_date"))
+    if end is not None and (now or datetime.now()) >= end:
+        return "read_only"
+    return "live"
+
+def require_open(event_id: str) -> Dict[str, Any]:
+    """The event, or 404 if it does not exist and 409 once it has ended"""
+    event = storage.storage.events.get(event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if state_of(event) != "live":
+        raise HTTPException(status_code=409, detail="Event has ended and is read-only")
+    return event
+
+def touch(event_id: str):
+    storage.storage.event_access[event_id] = time.monotonic()
+
+class EventArchive:
+    """
+    One compacted file per archived event, plus a small summary sidecar
+
+    The summaries are loaded once (lazily) and kept in memory as the index
+    of archived events; the data files are only read to rehydrate.
+    """
+
+    def __init__(self, directory: str = EVENT_ARCHIVE_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._loaded = False
+
+    def _data_path(self, event_id: str) -> str:
+        return os.path.join(self.directory, f"{event_id}.json.gz")
+
+    def _summary_path(self, event_id: str) -> str:
+        return os.path.join(self.directory, f"{event_id}.summary.json")
+
+    def _load(self):
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if not name.endswith(".summary.json"):
+                continue
+            event_id = name[:-len(".summary.json")]
+            # A summary without its data file is left over from an interrupted archival
+            if not os.path.exists(self._data_path(event_id)):
+                continue
+            try:
+                with open(self._summary_path(event_id), "r") as f:
+                    self._summaries[event_id] = loads(f.read())
+            except (OSError, ValueError):
+                continue
+        self._loaded = True
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        """Atomically replace a file, durably"""
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def contains(self, event_id: str) -> bool:
+        if not self._loaded:
+            with self.lock:
+                self._load()
+        return event_id in self._summaries
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            self._load()
+            return list(self._summaries.values())
+
+    def save(self, event_id: str, bundle: Dict[str, Any]):
+        """Write an event's compacted data, then its summary"""
+        with self.lock:
+            self._load()
+            self._write(self._data_path(event_id), gzip.compress(dumps(bundle).encode(), compresslevel=6))
+            self._write(self._summary_path(event_id), dumps(bundle["summary"]).encode())
+            self._summaries[event_id] = bundle["summary"]
+
+    def read(self, event_id: str) -> Dict[str, Any]:
+        with open(self._data_path(event_id), "rb") as f:
+            return loads(gzip.decompress(f.read()).decode())
+
+    def remove(self, event_id: str):
+        """Drop an event's archive files (after it is deleted)"""
+        with self.lock:
+            self._load()
+            if self._summaries.pop(event_id, None) is None:
+                return
+            for path in (self._summary_path(event_id), self._data_path(event_id)):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+event_archive = EventArchive()
+
+def evict(event_id: str):
+    """Drop all of an event's in-memory state and derived indexes; caller holds the event lock"""
+    storage.storage.events.pop(event_id, None)
+    if event_id in storage.storage.event_users:
+        login_index.drop_event(event_id)
+        del storage.storage.event_users[event_id]
+    storage.storage.participant_indexes.pop(event_id, None)
+    storage.storage.event_counters.pop(event_id, None)
+    storage.storage.event_locations.pop(event_id, None)
+    storage.storage.event_pois.pop(event_id, None)
+    storage.storage.event_alerts.pop(event_id, None)
+    storage.storage.alert_stats.pop(event_id, None)
+    storage.storage.resolved_alerts.pop(event_id, None)
+    incidents.drop_event(event_id)
+    storage.storage.event_staff.pop(event_id, None)
+    storage.storage.responder_indexes.pop(event_id, None)
+    storage.storage.poi_indexes.pop(event_id, None)
+    storage.storage.location_versions.pop(event_id, None)
+    storage.storage.evacuations.pop(event_id, None)
+    storage.storage.exit_assignments.pop(event_id, None)
+    storage.storage.evacuation_plans.pop(event_id, None)
+    storage.storage.venue_graphs.pop(event_id, None)
+    storage.storage.poi_rasters.pop(event_id, None)
+    storage.storage.zone_indexes.pop(event_id, None)
+    storage.storage.event_access.pop(event_id, None)
+
+def _summary(event: Dict[str, Any], users: List[Any], pois: List[Any], alerts: List[Any]) -> Dict[str, Any]:
+    stats = stats_for(event["id"]).snapshot()
+    return {
+        "id": event["id"],
+        "name": event.get("name"),
+        "city": event.get("city"),
+        "start_date": event.get("start_date"),
+        "end_date": event.get("end_date"),
+        "lifecycle": "archived",
+        "archived_at": datetime.now(),
+        "participants": event_counters.snapshot(event["id"]),
+        "pois": len(pois),
+        "alerts": {key: stats[key] for key in ("total_alerts", "active_alerts", "by_status", "by_type")},
+        "alerts_in_archive": len(alerts),
+        "users_in_archive": len(users)
+    }
+
+def archive_event(event_id: str) -> bool:
+    """Compact an ended event to disk and evict it; False if it is gone or live again"""
+    with event_locks.lock_for(event_id):
+        event = storage.storage.events.get(event_id)
+        if event is None or state_of(event) == "live":
+            return False
+        users = list(storage.storage.event_users.get(event_id, {}).values())
+        pois = list(storage.storage.event_pois.get(event_id, {}).values())
+        alerts = storage.storage.event_alerts.get(event_id, [])
+        # Staff, zones and the graph live only in memory, so the archive is their only copy
+        zone_index = storage.storage.zone_indexes.get(event_id)
+        graph = venue_graph.graph_for(event_id)
+        event_archive.save(event_id, {
+            "summary": _summary(event, users, pois, alerts),
+            "event": event,
+            "users": users,
+            "pois": pois,
+            "alerts": alerts,
+            "staff": list(storage.storage.event_staff.get(event_id, {}).values()),
+            "zones": zone_index.export() if zone_index is not None else [],
+            "graph": graph.export() if graph is not None else None
+        })
+        # The archive file is durable now, so the resident and backend copies can go
+        evict(event_id)
+        forget_global_alerts({alert["id"] for alert in alerts})
+        storage.storage.forget_event(event_id)
+    event_locks.drop(event_id)
+    return True
+
+def ensure_resident(event_id: str) -> bool:
+    """Rehydrate an archived event into memory (and the backend); False if it is not archived"""
+    if event_id in storage.storage.events:
+        return True
+    if not event_archive.contains(event_id):
+        return False
+    with event_locks.lock_for(event_id):
+        if event_id in storage.storage.events:
+            return True
+        bundle = event_archive.read(event_id)
+        users, pois, alerts = bundle["users"], bundle["pois"], bundle["alerts"]
+        storage.storage.persist("event", event_id, event_id, bundle["event"])
+        storage.storage.persist_many("user", event_id, users)
+        storage.storage.persist_many("poi", event_id, pois)
+        storage.storage.persist_many("alert", event_id, alerts)
+        touch(event_id)
+        # Counters are rebuilt from the archived alerts (restored, so they stay out of the rolling rates)
+        storage.storage.alert_stats.pop(event_id, None)
+        storage.storage.rehydrate({
+            "event": [(event_id, event_id, bundle["event"])],
+            "user": [(event_id, user["id"], user) for user in users],
+            "poi": [(event_id, poi["id"], poi) for poi in pois],
+            "alert": [(event_id, alert["id"], alert) for alert in alerts]
+        })
+        # Archives written before staff, zones and graphs were kept have none of these keys
+        if bundle.get("staff"):
+            storage.storage.event_staff[event_id] = {staff["id"]: staff for staff in bundle["staff"]}
+        if bundle.get("zones"):
+            zones.index_for(event_id).restore(bundle["zones"])
+        if bundle.get("graph"):
+            venue_graph.load_graph(event_id, bundle["graph"]["nodes"], bundle["graph"]["edges"])
+    print(f"Rehydrated archived event {event_id}")
+    return True
+
+def sweep(now: Optional[datetime] = None) -> int:
+    """Archive ended events that are past the retention window and idle; returns how many"""
+    now = now or datetime.now()
+    idle_before = time.monotonic() - EVENT_IDLE_SECONDS
+    archived = 0
+    for event in list(storage.storage.events.values()):
+        end = _parse_end(event.get("end_date"))
+        if end is None or now < end + timedelta(seconds=EVENT_ARCHIVE_AFTER_SECONDS):
+            continue
+        accessed = storage.storage.event_access.get(event["id"])
+        if accessed is not None and accessed > idle_before:
+            continue
+        if archive_event(event["id"]):
+            archived += 1
+    return archived
+
+class RehydrateMiddleware:
+    """ASGI middleware: rehydrate an archived event when a request names it, and note the access"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            match = EVENT_PATH.match(scope["path"])
+            if match:
+                event_id = match.group(1)
+                if event_id not in storage.storage.events and event_archive.contains(event_id):
+                    await run_in_threadpool(ensure_resident, event_id)
+                if event_id in storage.storage.events:
+                    touch(event_id)
+        await self.app(scope, receive, send)
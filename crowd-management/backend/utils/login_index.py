@@ -0,0 +1,85 @@
+import re
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import storage
+
+_lock = threading.Lock()
+_NON_DIGITS = re.compile(r"\D")
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """Digits only, keeping a leading + (so "+91 98765-43210" == "+919876543210")"""
+    if not phone:
+        return ""
+    phone = phone.strip()
+    digits = _NON_DIGITS.sub("", phone)
+    return "+" + digits if phone.startswith("+") else digits
+
+def normalize_name(name: Optional[str]) -> str:
+    """Case-insensitive, with runs of whitespace collapsed"""
+    return " ".join((name or "").split()).casefold()
+
+def _key(phone: Optional[str], name: Optional[str]) -> Optional[Tuple[str, str]]:
+    phone, name = normalize_phone(phone), normalize_name(name)
+    if not phone or not name:
+        return None
+    return phone, name
+
+def register(event_id: str, user: Dict[str, Any]):
+    """Index a participant on join (or after their phone/name changed)"""
+    key = _key(user.get("phone"), user.get("name"))
+    if key is None:
+        return
+    with _lock:
+        # Insertion-ordered, so the most recent registration is last
+        entries = storage.storage.login_index.setdefault(key, {})
+        entries.pop((event_id, user["id"]), None)
+        entries[(event_id, user["id"])] = None
+
+def register_many(event_id: str, users: Iterable[Dict[str, Any]]):
+    """Batch version of register under one lock acquisition (bulk import, restore)"""
+    keyed = [(key, user["id"]) for key, user in ((_key(u.get("phone"), u.get("name")), u) for u in users)
+             if key is not None]
+    with _lock:
+        login_index = storage.storage.login_index
+        for key, user_id in keyed:
+            entries = login_index.setdefault(key, {})
+            entries.pop((event_id, user_id), None)
+            entries[(event_id, user_id)] = None
+
+def unregister(event_id: str, user: Dict[str, Any], phone: Optional[str] = None, name: Optional[str] = None):
+    """Remove a participant; pass the old phone/name when calling before an update"""
+    key = _key(phone if phone is not None else user.get("phone"), name if name is not None else user.get("name"))
+    if key is None:
+        return
+    with _lock:
+        entries = storage.storage.login_index.get(key)
+        if entries is not None:
+            entries.pop((event_id, user["id"]), None)
+            if not entries:
+                del storage.storage.login_index[key]
+
+def drop_event(event_id: str):
+    """Forget every participant of an event (call before its users are deleted)"""
+    for user in list(storage.storage.event_users.get(event_id, {}).values()):
+        unregister(event_id, user)
+
+def registered_in(event_id: str, phone: str, name: str) -> bool:
+    """Whether this phone and name are already registered for an event"""
+    key = _key(phone, name)
+    if key is None:
+        return False
+    with _lock:
+        entries = storage.storage.login_index.get(key)
+        return bool(entries) and any(entry_event == event_id for entry_event, _ in entries)
+
+def lookup(phone: str, name: str) -> Optional[Tuple[str, str]]:
+    """(event_id, user_id) of the most recent registration matching phone and name"""
+    key = _key(phone, name)
+    if key is None:
+        return None
+    with _lock:
+        entries = storage.storage.login_index.get(key)
+        if not entries:
+            return None
+        return next(reversed(entries))
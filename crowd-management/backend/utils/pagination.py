@@ -0,0 +1,28 @@
+import base64
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+# Hard upper bound on any page size, whatever the client asks for
+MAX_PAGE_SIZE = 200
+DEFAULT_PAGE_SIZE = 50
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Clamp a requested page size to [1, MAX_PAGE_SIZE]"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+def encode_cursor(sort_value: str, item_id: str) -> str:
+    """Encode an opaque cursor from a sort key and a tie-breaking id"""
+    raw = f"{sort_value}|{item_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor produced by encode_cursor, returning (sort_value, item_id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, item_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return sort_value, item_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,218 @@
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+import storage
+from utils.login_index import normalize_name
+from utils.pagination import clamp_limit, decode_cursor, encode_cursor
+
+STATUSES = ("active", "checked_in", "checked_out")
+SEARCH_FIELDS = ("name", "phone", "email")
+
+def _phone_key(phone: Optional[str]) -> str:
+    # Digits only, so "98765" finds "+91 98765 43210" as well as "9876543210"
+    return "".join(ch for ch in (phone or "") if ch.isdigit())
+
+def _keys(user: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "name": normalize_name(user.get("name")),
+        "phone": _phone_key(user.get("phone")),
+        "email": (user.get("email") or "").strip().casefold()
+    }
+
+def _listed(field: str, key: str) -> bool:
+    # The name list doubles as the unfiltered listing, so it holds everyone (even a blank name)
+    return bool(key) or field == "name"
+
+class ParticipantIndex:
+    """
+    Sorted (key, user_id) lists over one event's participants
+
+    One list per searchable field gives prefix search by bisection, and one
+    name-ordered list per status gives filtered listings without a scan.
+    Listings are ordered by (name, id) and paged with a keyset cursor, so a
+    page costs O(log n + page size) however large the event is.
+    """
+
+    def __init__(self, event_id: str):
+        self.event_id = event_id
+        self.lock = threading.Lock()
+        self.by_field: Dict[str, List[Tuple[str, str]]] = {field: [] for field in SEARCH_FIELDS}
+        self.by_status: Dict[str, List[Tuple[str, str]]] = {}
+        self.keys: Dict[str, Dict[str, str]] = {}  # user_id -> indexed keys
+        self.statuses: Dict[str, str] = {}  # user_id -> indexed status
+
+    @staticmethod
+    def _remove(entries: List[Tuple[str, str]], entry: Tuple[str, str]):
+        i = bisect.bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+
+    def add(self, user: Dict[str, Any]):
+        with self.lock:
+            self._discard(user["id"])
+            keys = _keys(user)
+            status = user.get("status") or "active"
+            for field, key in keys.items():
+                if _listed(field, key):
+                    bisect.insort(self.by_field[field], (key, user["id"]))
+            bisect.insort(self.by_status.setdefault(status, []), (keys["name"], user["id"]))
+            self.keys[user["id"]] = keys
+            self.statuses[user["id"]] = status
+
+    def add_many(self, users: List[Dict[str, Any]]):
+        """Index a batch of new participants with one sort per list instead of an insort per row"""
+        with self.lock:
+            touched = set()
+            for user in users:
+                if user["id"] in self.keys:
+                    self._discard(user["id"])
+                keys = _keys(user)
+                status = user.get("status") or "active"
+                for field, key in keys.items():
+                    if _listed(field, key):
+                        self.by_field[field].append((key, user["id"]))
+                self.by_status.setdefault(status, []).append((keys["name"], user["id"]))
+                touched.add(status)
+                self.keys[user["id"]] = keys
+                self.statuses[user["id"]] = status
+            # Timsort merges the appended run with the sorted prefix in near-linear time
+            for entries in self.by_field.values():
+                entries.sort()
+            for status in touched:
+                self.by_status[status].sort()
+
+    def _discard(self, user_id: str):
+        keys = self.keys.pop(user_id, None)
+        if keys is None:
+            return
+        for field, key in keys.items():
+            if _listed(field, key):
+                self._remove(self.by_field[field], (key, user_id))
+        status = self.statuses.pop(user_id)
+        self._remove(self.by_status.get(status, []), (keys["name"], user_id))
+
+    def remove(self, user_id: str):
+        with self.lock:
+            self._discard(user_id)
+
+    def status_changed(self, user: Dict[str, Any]):
+        """Move a participant between status lists after check-in/out"""
+        with self.lock:
+            keys = self.keys.get(user["id"])
+            old = self.statuses.get(user["id"])
+            new = user.get("status") or "active"
+            if keys is None or old == new:
+                return
+            self._remove(self.by_status.get(old, []), (keys["name"], user["id"]))
+            bisect.insort(self.by_status.setdefault(new, []), (keys["name"], user["id"]))
+            self.statuses[user["id"]] = new
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            counts = {status: len(self.by_status.get(status, [])) for status in STATUSES}
+            for status, entries in self.by_status.items():
+                counts.setdefault(status, len(entries))
+            counts["total"] = len(self.keys)
+            return counts
+
+    def page(self, cursor: Optional[str] = None, limit: Optional[int] = None, status: Optional[str] = None,
+             q: Optional[str] = None, field: Optional[str] = None) -> Dict[str, Any]:
+        """
+        One page of participants
+
+        Without q the listing is ordered by name. With q it is a prefix search
+        on `field` (guessed from q when omitted: digits -> phone, "@" -> email,
+        otherwise name) ordered by that field.
+        """
+        limit = clamp_limit(limit)
+        if status is not None and status not in STATUSES:
+            raise HTTPException(status_code=400, detail=f"status must be one of: {', '.join(STATUSES)}")
+        if field is not None and field not in SEARCH_FIELDS:
+            raise HTTPException(status_code=400, detail=f"field must be one of: {', '.join(SEARCH_FIELDS)}")
+
+        prefix = None
+        if q and q.strip():
+            if field is None:
+                stripped = q.strip()
+                if "@" in stripped:
+                    field = "email"
+                elif stripped.lstrip("+").replace(" ", "").replace("-", "").isdigit():
+                    field = "phone"
+                else:
+                    field = "name"
+            prefix = _phone_key(q) if field == "phone" else (
+                q.strip().casefold() if field == "email" else normalize_name(q))
+            if not prefix:
+                return {"participants": [], "next_cursor": None, "limit": limit}
+
+        users = storage.storage.event_users.get(self.event_id, {})
+        results: List[Dict[str, Any]] = []
+        next_cursor = None
+        with self.lock:
+            if prefix is not None:
+                entries = self.by_field[field]
+                filter_status = status
+            else:
+                entries = self.by_status.get(status, []) if status else self.by_field["name"]
+                filter_status = None
+
+            lo = 0
+            if prefix is not None:
+                lo = bisect.bisect_left(entries, (prefix, ""))
+            if cursor:
+                key, user_id = decode_cursor(cursor)
+                lo = max(lo, bisect.bisect_right(entries, (key, user_id)))
+
+            i = lo
+            while i < len(entries) and len(results) < limit:
+                key, user_id = entries[i]
+                if prefix is not None and not key.startswith(prefix):
+                    break
+                i += 1
+                if filter_status is not None and self.statuses.get(user_id) != filter_status:
+                    continue
+                user = users.get(user_id)
+                if user is not None:
+                    results.append(user)
+            if len(results) == limit and i < len(entries) and (prefix is None or entries[i][0].startswith(prefix)):
+                next_cursor = encode_cursor(*entries[i - 1])
+
+        return {"participants": results, "next_cursor": next_cursor, "limit": limit}
+
+    def rebuild(self):
+        """Index every participant already stored for the event"""
+        self.add_many(list(storage.storage.event_users.get(self.event_id, {}).values()))
+
+_registry_lock = threading.Lock()
+
+def index_for(event_id: str) -> ParticipantIndex:
+    """Get (or lazily build) the participant index for an event"""
+    index = storage.storage.participant_indexes.get(event_id)
+    if index is None:
+        with _registry_lock:
+            index = storage.storage.participant_indexes.get(event_id)
+            if index is None:
+                index = ParticipantIndex(event_id)
+                index.rebuild()
+                storage.storage.participant_indexes[event_id] = index
+    return index
+
+def joined(event_id: str, user: Dict[str, Any]):
+    """Hook for join; a not-yet-built index will pick the user up when it is built"""
+    index = storage.storage.participant_indexes.get(event_id)
+    if index is not None:
+        index.add(user)
+
+def joined_many(event_id: str, users: List[Dict[str, Any]]):
+    index = storage.storage.participant_indexes.get(event_id)
+    if index is not None:
+        index.add_many(users)
+
+def status_changed(event_id: str, user: Dict[str, Any]):
+    """Hook for check-in/out"""
+    index = storage.storage.participant_indexes.get(event_id)
+    if index is not None:
+        index.status_changed(user)
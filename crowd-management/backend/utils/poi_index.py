@@ -0,0 +1,149 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import storage
+from utils.geo import haversine
+from utils.spatial import KDTree, Projection
+
+class POIIndex:
+    """
+    Per-event spatial index over POIs, partitioned by POI type
+
+    Each type has its own KD-tree. A POI change only marks the affected
+    partitions dirty, and a dirty partition is rebuilt on its next query, so
+    editing food stalls never touches the exit or medical trees.
+    """
+
+    def __init__(self, event_id: str):
+        self.event_id = event_id
+        self.lock = threading.Lock()
+        self._projection: Optional[Projection] = None
+        self._trees: Dict[str, Optional[KDTree]] = {}
+        self._dirty: set = set()
+        self._all_dirty = True
+
+    def invalidate(self, types: Iterable[str] = ()):
+        with self.lock:
+            types = [t for t in types if t]
+            if types:
+                self._dirty.update(types)
+            else:
+                self._all_dirty = True
+
+    def _projection_for(self, pois: List[Dict[str, Any]]) -> Optional[Projection]:
+        if self._projection is None:
+            event = storage.storage.events.get(self.event_id, {})
+            if event.get("lat") is not None and event.get("lng") is not None:
+                self._projection = Projection(event["lat"], event["lng"])
+            elif pois:
+                self._projection = Projection(pois[0]["lat"], pois[0]["lng"])
+        return self._projection
+
+    def _refresh(self):
+        """Rebuild dirty partitions (caller holds the lock)"""
+        if not self._all_dirty and not self._dirty:
+            return
+        pois = list(storage.storage.event_pois.get(self.event_id, {}).values())
+        projection = self._projection_for(pois)
+
+        if self._all_dirty:
+            rebuild = {poi["type"] for poi in pois} | set(self._trees)
+        else:
+            rebuild = set(self._dirty)
+
+        by_type: Dict[str, List] = {poi_type: [] for poi_type in rebuild}
+        for poi in pois:
+            if poi["type"] in by_type:
+                by_type[poi["type"]].append((*projection.to_xy(poi["lat"], poi["lng"]), poi))
+
+        for poi_type, points in by_type.items():
+            if points:
+                self._trees[poi_type] = KDTree(points)
+            else:
+                self._trees.pop(poi_type, None)
+
+        self._dirty.clear()
+        self._all_dirty = False
+
+    def nearest(self, lat: float, lng: float, types: Optional[Iterable[str]] = None,
+                k: int = 1, predicate=None) -> List[Dict[str, Any]]:
+        """
+        Return the k nearest POIs (optionally restricted to some types)
+
+        Each result is {"poi": <POI dict>, "distance": metres}, nearest first.
+        """
+        with self.lock:
+            self._refresh()
+            if self._projection is None:
+                return []
+            trees = [tree for poi_type, tree in self._trees.items()
+                     if tree is not None and (types is None or poi_type in types)]
+            x, y = self._projection.to_xy(lat, lng)
+
+        candidates = []
+        for tree in trees:
+            candidates.extend(tree.nearest(x, y, k, predicate))
+        candidates.sort(key=lambda c: c[0])
+
+        results = []
+        for _, poi in candidates[:k]:
+            results.append({"poi": poi, "distance": round(haversine(lat, lng, poi["lat"], poi["lng"]), 2)})
+        return results
+
+_registry_lock = threading.Lock()
+
+def index_for(event_id: str) -> POIIndex:
+    """Get (or lazily create) the POI index for an event"""
+    index = storage.storage.poi_indexes.get(event_id)
+    if index is None:
+        with _registry_lock:
+            index = storage.storage.poi_indexes.get(event_id)
+            if index is None:
+                index = POIIndex(event_id)
+                storage.storage.poi_indexes[event_id] = index
+    return index
+
+def pois_changed(event_id: str, *types: str):
+    """Hook for POI create/update/delete; pass the old and new types touched (none = all)"""
+    index = storage.storage.poi_indexes.get(event_id)
+    if index is not None:
+        index.invalidate(types)
+    # The nearest-POI raster (utils/poi_raster.py) rebuilds every type in the background
+    raster = storage.storage.poi_rasters.get(event_id)
+    if raster is not None:
+        raster.invalidate()
+
+# ============= LEGACY EXIT POINTS =============
+
+class ExitPointIndex:
+    """KD-tree over the legacy global storage.exit_points list"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._tree: Optional[KDTree] = None
+        self._projection: Optional[Projection] = None
+        self._source = None
+        self._dirty = True
+
+    def invalidate(self):
+        self._dirty = True
+
+    def nearest(self, lat: float, lng: float) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            # The bulk endpoint and init_storage replace the list object outright
+            if self._dirty or self._source is not storage.storage.exit_points:
+                self._source = storage.storage.exit_points
+                exits = list(self._source)
+                if exits:
+                    self._projection = Projection(exits[0]["lat"], exits[0]["lng"])
+                    self._tree = KDTree([(*self._projection.to_xy(e["lat"], e["lng"]), e) for e in exits])
+                else:
+                    self._tree = None
+                self._dirty = False
+            tree, projection = self._tree, self._projection
+        if tree is None:
+            return None
+        _, exit_point = tree.nearest(*projection.to_xy(lat, lng), k=1)[0]
+        return {"poi": exit_point, "distance": round(haversine(lat, lng, exit_point["lat"], exit_point["lng"]), 2)}
+
+exit_point_index = ExitPointIndex()
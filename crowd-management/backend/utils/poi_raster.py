@@ -0,0 +1,159 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import storage
+from utils import poi_index
+from utils.geo import haversine
+from utils.spatial import Projection
+
+# Grid resolution; coarsened automatically if the area would exceed RASTER_MAX_CELLS
+RASTER_CELL_METERS = float(os.getenv("POI_RASTER_CELL_METERS", "5"))
+# Padding around the POIs so attendees near the edge still hit the grid
+RASTER_MARGIN_METERS = 300.0
+# Cells per type (int16 ids: ~2 MB per type at the cap)
+RASTER_MAX_CELLS = 1_000_000
+# Cap on one (cells x POIs) distance block during a rebuild
+MAX_BLOCK_CELLS = 2_000_000
+
+ALL_TYPES = "*"
+
+class POIRaster:
+    """
+    Discrete Voronoi diagram of an event's POIs
+
+    The area around the POIs is split into square cells and, per POI type (and
+    for all POIs together), each cell stores the index of its nearest POI, so
+    a lookup is a projection plus an array read (exact up to half a cell near
+    the Voronoi boundaries). Rebuilds run in a background thread after POI
+    changes; until the new grids are swapped in, lookups fall back to the
+    KD-tree index so answers are never stale.
+    """
+
+    def __init__(self, event_id: str):
+        self.event_id = event_id
+        self.lock = threading.Lock()
+        self._projection: Optional[Projection] = None
+        self._origin = (0.0, 0.0)
+        self._cell = RASTER_CELL_METERS
+        self._shape = (0, 0)
+        self._grids: Dict[str, np.ndarray] = {}
+        self._pois: Dict[str, List[Dict[str, Any]]] = {}
+        self._dirty = True
+        self._building = False
+
+    def invalidate(self):
+        """Mark the grids stale and make sure a background rebuild is scheduled"""
+        with self.lock:
+            self._dirty = True
+            if self._building:
+                return  # the running builder will loop once more
+            self._building = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self._dirty:
+                    self._building = False
+                    return
+                self._dirty = False
+            try:
+                built = self._build()
+            except Exception as e:
+                print(f"POI raster build error: {e}")
+                built = None
+            with self.lock:
+                # A change that arrived mid-build sets _dirty again and the loop rebuilds before serving
+                if built is not None:
+                    (self._projection, self._origin, self._cell, self._shape,
+                     self._grids, self._pois) = built
+
+    def _build(self):
+        pois = list(storage.storage.event_pois.get(self.event_id, {}).values())
+        if not pois:
+            return None, (0.0, 0.0), RASTER_CELL_METERS, (0, 0), {}, {}
+
+        event = storage.storage.events.get(self.event_id, {})
+        if event.get("lat") is not None and event.get("lng") is not None:
+            projection = Projection(event["lat"], event["lng"])
+        else:
+            projection = Projection(pois[0]["lat"], pois[0]["lng"])
+
+        points = np.asarray([projection.to_xy(poi["lat"], poi["lng"]) for poi in pois], dtype=np.float64)
+        x0, y0 = points.min(axis=0) - RASTER_MARGIN_METERS
+        x1, y1 = points.max(axis=0) + RASTER_MARGIN_METERS
+        cell = RASTER_CELL_METERS
+        while ((x1 - x0) / cell) * ((y1 - y0) / cell) > RASTER_MAX_CELLS:
+            cell *= 1.5
+        width = int(np.ceil((x1 - x0) / cell))
+        height = int(np.ceil((y1 - y0) / cell))
+        centres_x = (x0 + (np.arange(width) + 0.5) * cell).astype(np.float32)
+        centres_y = (y0 + (np.arange(height) + 0.5) * cell).astype(np.float32)
+
+        groups: Dict[str, List[int]] = {ALL_TYPES: list(range(len(pois)))}
+        for i, poi in enumerate(pois):
+            groups.setdefault(poi.get("type"), []).append(i)
+
+        grids, by_type = {}, {}
+        for poi_type, members in groups.items():
+            px = points[members, 0].astype(np.float32)
+            py = points[members, 1].astype(np.float32)
+            dtype = np.int16 if len(members) < np.iinfo(np.int16).max else np.int32
+            grid = np.empty((height, width), dtype=dtype)
+            rows = max(1, MAX_BLOCK_CELLS // max(width * len(members), 1))
+            for start in range(0, height, rows):
+                stop = min(start + rows, height)
+                dx = centres_x[None, :, None] - px[None, None, :]
+                dy = centres_y[start:stop, None, None] - py[None, None, :]
+                grid[start:stop] = np.argmin(dx * dx + dy * dy, axis=2)
+            grids[poi_type] = grid
+            by_type[poi_type] = [pois[i] for i in members]
+        return projection, (float(x0), float(y0)), cell, (height, width), grids, by_type
+
+    def lookup(self, lat: float, lng: float, poi_type: Optional[str] = None):
+        """
+        Nearest POI from the grid, [] if there is none of that type, or None
+        when the grid cannot answer (stale, building, or point outside it)
+        """
+        with self.lock:
+            if self._dirty or self._building:
+                return None
+            if self._projection is None:
+                return []
+            grid = self._grids.get(poi_type or ALL_TYPES)
+            if grid is None:
+                return []
+            x, y = self._projection.to_xy(lat, lng)
+            col = int((x - self._origin[0]) // self._cell)
+            row = int((y - self._origin[1]) // self._cell)
+            if not (0 <= row < self._shape[0] and 0 <= col < self._shape[1]):
+                return None
+            poi = self._pois[poi_type or ALL_TYPES][grid[row, col]]
+        return [{"poi": poi, "distance": round(haversine(lat, lng, poi["lat"], poi["lng"]), 2)}]
+
+_registry_lock = threading.Lock()
+
+def raster_for(event_id: str) -> POIRaster:
+    """Get (or lazily create and start building) the raster for an event"""
+    raster = storage.storage.poi_rasters.get(event_id)
+    if raster is None:
+        created = False
+        with _registry_lock:
+            raster = storage.storage.poi_rasters.get(event_id)
+            if raster is None:
+                raster = POIRaster(event_id)
+                storage.storage.poi_rasters[event_id] = raster
+                created = True
+        if created:
+            raster.invalidate()
+    return raster
+
+def nearest(event_id: str, lat: float, lng: float, poi_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Nearest POI (optionally of one type) as [{"poi", "distance"}], grid first, KD-tree as fallback"""
+    result = raster_for(event_id).lookup(lat, lng, poi_type)
+    if result is None:
+        result = poi_index.index_for(event_id).nearest(lat, lng, [poi_type] if poi_type else None, 1)
+    return result
@@ -0,0 +1,100 @@
+import heapq
+import math
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+METERS_PER_DEGREE = 111320
+
+class Projection:
+    """
+    Local equirectangular projection from lat/lng to metres around a reference point
+
+    Accurate to well under a metre over a festival-sized area, and cheap enough
+    to apply per query.
+    """
+
+    def __init__(self, ref_lat: float, ref_lng: float):
+        self.ref_lat = ref_lat
+        self.ref_lng = ref_lng
+        self.lng_scale = METERS_PER_DEGREE * math.cos(math.radians(ref_lat))
+
+    def to_xy(self, lat: float, lng: float) -> Tuple[float, float]:
+        return (lng - self.ref_lng) * self.lng_scale, (lat - self.ref_lat) * METERS_PER_DEGREE
+
+class KDTree:
+    """
+    Static 2-d tree over projected points for k-nearest-neighbour queries
+
+    Built once in O(n log n); queries visit O(log n) nodes on average. Items are
+    arbitrary payloads returned alongside their planar distance.
+    """
+
+    __slots__ = ("_xs", "_ys", "_items", "_left", "_right", "_axis", "_root")
+
+    def __init__(self, points: Sequence[Tuple[float, float, Any]]):
+        self._xs: List[float] = []
+        self._ys: List[float] = []
+        self._items: List[Any] = []
+        self._left: List[int] = []
+        self._right: List[int] = []
+        self._axis: List[int] = []
+        self._root = self._build(list(points), 0)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _build(self, points, depth: int) -> int:
+        if not points:
+            return -1
+        axis = depth % 2
+        points.sort(key=lambda p: p[axis])
+        mid = len(points) // 2
+        x, y, item = points[mid]
+
+        node = len(self._items)
+        self._xs.append(x)
+        self._ys.append(y)
+        self._items.append(item)
+        self._axis.append(axis)
+        self._left.append(-1)
+        self._right.append(-1)
+
+        self._left[node] = self._build(points[:mid], depth + 1)
+        self._right[node] = self._build(points[mid + 1:], depth + 1)
+        return node
+
+    def nearest(self, x: float, y: float, k: int = 1,
+                predicate: Optional[Callable[[Any], bool]] = None,
+                max_distance: float = math.inf) -> List[Tuple[float, Any]]:
+        """Return up to k (distance, item) pairs closest to (x, y), nearest first"""
+        if k <= 0 or self._root < 0:
+            return []
+
+        heap: List[Tuple[float, int]] = []  # max-heap of (-dist_sq, node)
+        bound = max_distance * max_distance
+        xs, ys, axes, lefts, rights, items = self._xs, self._ys, self._axis, self._left, self._right, self._items
+
+        # Stack of (node, squared distance from query to the node's region)
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, region_sq = stack.pop()
+            if node < 0 or region_sq > bound:
+                continue
+
+            dx = x - xs[node]
+            dy = y - ys[node]
+            dist_sq = dx * dx + dy * dy
+            if dist_sq <= bound and (predicate is None or predicate(items[node])):
+                if len(heap) < k:
+                    heapq.heappush(heap, (-dist_sq, node))
+                elif dist_sq < -heap[0][0]:
+                    heapq.heapreplace(heap, (-dist_sq, node))
+                if len(heap) == k:
+                    bound = min(bound, -heap[0][0])
+
+            diff = dx if axes[node] == 0 else dy
+            near, far = (lefts[node], rights[node]) if diff < 0 else (rights[node], lefts[node])
+            # Push the far side first so the near side is explored first
+            stack.append((far, max(region_sq, diff * diff)))
+            stack.append((near, region_sq))
+
+        return [(math.sqrt(-d), items[n]) for d, n in sorted(heap, reverse=True)]
@@ -0,0 +1,323 @@
+import heapq
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import storage
+from utils.geo import haversine
+from utils.spatial import KDTree, Projection
+
+INF = math.inf
+
+def _edge_key(a: str, b: str) -> Tuple[str, str]:
+    return (a, b) if a <= b else (b, a)
+
+class DistanceField:
+    """
+    Multi-source shortest-path tree towards every POI of one type
+
+    dist[node] is the walking distance to the closest such POI and next[node]
+    the neighbour one step closer to it, so routing is a dict lookup followed
+    by a walk along next pointers.
+    """
+
+    __slots__ = ("poi_type", "signature", "dist", "next", "target", "children")
+
+    def __init__(self, poi_type: str, signature: Tuple):
+        self.poi_type = poi_type
+        self.signature = signature
+        self.dist: Dict[str, float] = {}
+        self.next: Dict[str, Optional[str]] = {}
+        self.target: Dict[str, str] = {}  # node -> POI id it leads to
+        self.children: Dict[str, set] = {}
+
+    def _set_parent(self, node: str, parent: Optional[str]):
+        old = self.next.get(node)
+        if old is not None:
+            self.children.get(old, set()).discard(node)
+        self.next[node] = parent
+        if parent is not None:
+            self.children.setdefault(parent, set()).add(node)
+
+class VenueGraph:
+    """
+    Walkway graph for one event: nodes, weighted edges and closed segments
+
+    Distance fields per POI type are built lazily with multi-source Dijkstra
+    and kept up to date incrementally when an edge is closed or reopened:
+    closing only re-solves the subtree that routed through the edge, and
+    reopening only propagates the improvements it creates.
+    """
+
+    def __init__(self, event_id: str, nodes: Iterable[Dict[str, Any]], edges: Iterable[Dict[str, Any]]):
+        self.event_id = event_id
+        self.lock = threading.RLock()
+        self.nodes: Dict[str, Tuple[float, float]] = {}
+        self.lengths: Dict[Tuple[str, str], float] = {}
+        self.blocked: set = set()
+        self.adjacency: Dict[str, Dict[str, float]] = {}
+        self.fields: Dict[str, DistanceField] = {}
+
+        for node in nodes:
+            self.nodes[str(node["id"])] = (float(node["lat"]), float(node["lng"]))
+        if not self.nodes:
+            raise ValueError("Graph needs at least one node")
+
+        for edge in edges:
+            a, b = str(edge["from"]), str(edge["to"])
+            if a not in self.nodes or b not in self.nodes:
+                raise ValueError(f"Edge {a}-{b} references an unknown node")
+            if a == b:
+                continue
+            length = edge.get("length")
+            if length is None:
+                length = haversine(*self.nodes[a], *self.nodes[b])
+            elif length < 0:
+                raise ValueError(f"Edge {a}-{b} has a negative length")
+            key = _edge_key(a, b)
+            self.lengths[key] = float(length)
+            if edge.get("blocked"):
+                self.blocked.add(key)
+
+        for node_id in self.nodes:
+            self.adjacency[node_id] = {}
+        for (a, b), length in self.lengths.items():
+            if (a, b) not in self.blocked:
+                self.adjacency[a][b] = length
+                self.adjacency[b][a] = length
+
+        # A* stays admissible even if some custom lengths are shorter than the straight line
+        scale = 1.0
+        for (a, b), length in self.lengths.items():
+            straight = haversine(*self.nodes[a], *self.nodes[b])
+            if straight > 0:
+                scale = min(scale, length / straight)
+        self.heuristic_scale = scale
+
+        first = next(iter(self.nodes.values()))
+        self.projection = Projection(*first)
+        self.tree = KDTree([(*self.projection.to_xy(lat, lng), node_id) for node_id, (lat, lng) in self.nodes.items()])
+
+    # ----- snapping -----
+
+    def snap(self, lat: float, lng: float) -> Tuple[str, float]:
+        """Nearest graph node to a position and the straight-line distance to it"""
+        _, node_id = self.tree.nearest(*self.projection.to_xy(lat, lng), k=1)[0]
+        return node_id, haversine(lat, lng, *self.nodes[node_id])
+
+    # ----- distance fields -----
+
+    def _pois_of_type(self, poi_type: str) -> List[Dict[str, Any]]:
+        return [poi for poi in list(storage.storage.event_pois.get(self.event_id, {}).values())
+                if poi.get("type") == poi_type]
+
+    def _field(self, poi_type: str) -> DistanceField:
+        """Cached field for a POI type, rebuilt when that type's POIs have changed (caller holds the lock)"""
+        pois = self._pois_of_type(poi_type)
+        signature = tuple(sorted((poi["id"], poi["lat"], poi["lng"]) for poi in pois))
+        field = self.fields.get(poi_type)
+        if field is None or field.signature != signature:
+            field = DistanceField(poi_type, signature)
+            heap = []
+            for poi in pois:
+                node_id, offset = self.snap(poi["lat"], poi["lng"])
+                if offset < field.dist.get(node_id, INF):
+                    field.dist[node_id] = offset
+                    field._set_parent(node_id, None)
+                    field.target[node_id] = poi["id"]
+                    heapq.heappush(heap, (offset, node_id))
+            self._propagate(field, heap)
+            self.fields[poi_type] = field
+        return field
+
+    def _propagate(self, field: DistanceField, heap: List[Tuple[float, str]]):
+        """Dijkstra from the nodes on the heap, relaxing only strict improvements"""
+        dist = field.dist
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > dist.get(node, INF):
+                continue
+            target = field.target[node]
+            for neighbour, length in self.adjacency[node].items():
+                nd = d + length
+                if nd < dist.get(neighbour, INF):
+                    dist[neighbour] = nd
+                    field._set_parent(neighbour, node)
+                    field.target[neighbour] = target
+                    heapq.heappush(heap, (nd, neighbour))
+
+    def _repair_after_removal(self, field: DistanceField, a: str, b: str):
+        """Re-solve only the part of the tree that routed through edge a-b"""
+        if field.next.get(a) == b:
+            root = a
+        elif field.next.get(b) == a:
+            root = b
+        else:
+            return  # not a tree edge: no shortest distance changes
+
+        affected = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            affected.add(node)
+            stack.extend(field.children.get(node, ()))
+
+        for node in affected:
+            field._set_parent(node, None)
+            field.next.pop(node, None)
+            field.dist.pop(node, None)
+            field.target.pop(node, None)
+
+        # Seed from the surviving boundary and let Dijkstra refill the hole
+        heap = []
+        for node in affected:
+            best, via = INF, None
+            for neighbour, length in self.adjacency[node].items():
+                if neighbour not in affected and neighbour in field.dist:
+                    candidate = field.dist[neighbour] + length
+                    if candidate < best:
+                        best, via = candidate, neighbour
+            if via is not None:
+                field.dist[node] = best
+                field._set_parent(node, via)
+                field.target[node] = field.target[via]
+                heapq.heappush(heap, (best, node))
+        self._propagate(field, heap)
+
+    def _relax_after_addition(self, field: DistanceField, a: str, b: str, length: float):
+        heap = []
+        for u, v in ((a, b), (b, a)):
+            if u in field.dist and field.dist[u] + length < field.dist.get(v, INF):
+                field.dist[v] = field.dist[u] + length
+                field._set_parent(v, u)
+                field.target[v] = field.target[u]
+                heapq.heappush(heap, (field.dist[v], v))
+        self._propagate(field, heap)
+
+    def set_blocked(self, a: str, b: str, blocked: bool) -> bool:
+        """Close or reopen a walkway; returns False if nothing changed"""
+        key = _edge_key(a, b)
+        with self.lock:
+            if key not in self.lengths:
+                raise KeyError(f"No edge {a}-{b}")
+            if blocked == (key in self.blocked):
+                return False
+            length = self.lengths[key]
+            if blocked:
+                self.blocked.add(key)
+                self.adjacency[a].pop(b, None)
+                self.adjacency[b].pop(a, None)
+                for field in self.fields.values():
+                    self._repair_after_removal(field, a, b)
+            else:
+                self.blocked.discard(key)
+                self.adjacency[a][b] = length
+                self.adjacency[b][a] = length
+                for field in self.fields.values():
+                    self._relax_after_addition(field, a, b, length)
+            return True
+
+    def route_to_nearest(self, lat: float, lng: float, poi_type: str) -> Optional[Dict[str, Any]]:
+        """Walking route from a position to the closest reachable POI of a type"""
+        with self.lock:
+            field = self._field(poi_type)
+            start, offset = self.snap(lat, lng)
+            if start not in field.dist:
+                return None
+            path = [start]
+            node = start
+            while field.next.get(node) is not None:
+                node = field.next[node]
+                path.append(node)
+            poi = storage.storage.event_pois.get(self.event_id, {}).get(field.target[start])
+            distance = offset + field.dist[start]
+        return self._describe(path, distance, poi)
+
+    # ----- ad-hoc routes -----
+
+    def astar(self, from_lat: float, from_lng: float, to_lat: float, to_lng: float) -> Optional[Dict[str, Any]]:
+        """A* between two arbitrary positions over open walkways"""
+        with self.lock:
+            start, start_offset = self.snap(from_lat, from_lng)
+            goal, goal_offset = self.snap(to_lat, to_lng)
+            goal_lat, goal_lng = self.nodes[goal]
+            scale = self.heuristic_scale
+
+            def h(node: str) -> float:
+                return scale * haversine(*self.nodes[node], goal_lat, goal_lng)
+
+            g = {start: 0.0}
+            came_from: Dict[str, str] = {}
+            heap = [(h(start), start)]
+            closed = set()
+            while heap:
+                _, node = heapq.heappop(heap)
+                if node == goal:
+                    break
+                if node in closed:
+                    continue
+                closed.add(node)
+                for neighbour, length in self.adjacency[node].items():
+                    candidate = g[node] + length
+                    if candidate < g.get(neighbour, INF):
+                        g[neighbour] = candidate
+                        came_from[neighbour] = node
+                        heapq.heappush(heap, (candidate + h(neighbour), neighbour))
+            if goal not in g:
+                return None
+
+            path = [goal]
+            while path[-1] != start:
+                path.append(came_from[path[-1]])
+            path.reverse()
+            distance = start_offset + g[goal] + goal_offset
+            nodes_expanded = len(closed)
+        result = self._describe(path, distance, None)
+        result["nodes_expanded"] = nodes_expanded
+        return result
+
+    def _describe(self, path: List[str], distance: float, poi: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        result = {
+            "distance": round(distance, 2),
+            "path": [{"id": node, "lat": self.nodes[node][0], "lng": self.nodes[node][1]} for node in path]
+        }
+        if poi is not None:
+            result["poi"] = poi
+        return result
+
+    def precompute(self, poi_types: Optional[Iterable[str]] = None):
+        """Build (or refresh) the fields for the given POI types, default every type present"""
+        if poi_types is None:
+            poi_types = {poi.get("type") for poi in list(storage.storage.event_pois.get(self.event_id, {}).values())}
+        with self.lock:
+            for poi_type in poi_types:
+                if poi_type:
+                    self._field(poi_type)
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "event_id": self.event_id,
+                "nodes": len(self.nodes),
+                "edges": len(self.lengths),
+                "blocked": [list(key) for key in sorted(self.blocked)],
+                "fields": sorted(self.fields)
+            }
+
+    def export(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Nodes and edges (with closures) in the shape load_graph() accepts"""
+        with self.lock:
+            return {
+                "nodes": [{"id": node_id, "lat": lat, "lng": lng} for node_id, (lat, lng) in self.nodes.items()],
+                "edges": [{"from": a, "to": b, "length": length, "blocked": (a, b) in self.blocked}
+                          for (a, b), length in self.lengths.items()]
+            }
+
+def graph_for(event_id: str) -> Optional[VenueGraph]:
+    return storage.storage.venue_graphs.get(event_id)
+
+def load_graph(event_id: str, nodes: Iterable[Dict[str, Any]], edges: Iterable[Dict[str, Any]]) -> VenueGraph:
+    """Replace an event's walkway graph (raises ValueError on malformed input)"""
+    graph = VenueGraph(event_id, nodes, edges)
+    storage.storage.venue_graphs[event_id] = graph
+    return graph
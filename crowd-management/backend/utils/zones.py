@@ -0,0 +1,264 @@
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import storage
+import numpy as np
+
+from utils.geo import is_point_in_polygon, points_in_polygon
+
+ZONE_KINDS = ("pit", "vip", "stage_front", "restricted", "general")
+
+# Grid prefilter cell, in degrees (~50 m); a point only ray-casts the zones overlapping its cell
+GRID_CELL_DEGREES = 0.0005
+# Upper bound on cells one zone may register in; larger zones get a coarser grid
+MAX_CELLS_PER_ZONE = 10_000
+
+# Attendees with no heartbeat for this long are counted out of their zones
+PRESENCE_TIMEOUT_SECONDS = 60
+TRANSITIONS_MAX = 1000
+
+def _bbox(polygon: List[Dict[str, float]]) -> Tuple[float, float, float, float]:
+    lats = [p["lat"] for p in polygon]
+    lngs = [p["lng"] for p in polygon]
+    return min(lats), min(lngs), max(lats), max(lngs)
+
+class ZoneIndex:
+    """
+    Geofence zones for one event with live occupancy
+
+    Zones are registered in a uniform lat/lng grid by bounding box, so a
+    heartbeat looks up one cell, checks the few candidate bounding boxes and
+    ray-casts only those. Each attendee's current zone set is kept, so a
+    heartbeat only emits enter/exit transitions and adjusts the counters it
+    changes; reading occupancy is a dict lookup.
+    """
+
+    def __init__(self, event_id: str):
+        self.event_id = event_id
+        self.lock = threading.Lock()
+        self.zones: Dict[str, Dict[str, Any]] = {}
+        self.counts: Dict[str, int] = {}
+        self.members: Dict[str, set] = {}  # user_id -> zone ids
+        self.positions: Dict[str, Tuple[float, float, datetime]] = {}
+        self.transitions = deque(maxlen=TRANSITIONS_MAX)
+        self._cell = GRID_CELL_DEGREES
+        self._grid: Dict[Tuple[int, int], List[str]] = {}
+
+    # ----- grid -----
+
+    def _cells(self, bbox) -> List[Tuple[int, int]]:
+        min_lat, min_lng, max_lat, max_lng = bbox
+        rows = range(int(min_lat // self._cell), int(max_lat // self._cell) + 1)
+        cols = range(int(min_lng // self._cell), int(max_lng // self._cell) + 1)
+        return [(r, c) for r in rows for c in cols]
+
+    def _rebuild_grid(self):
+        """Re-register every zone (caller holds the lock)"""
+        cell = GRID_CELL_DEGREES
+        for zone in self.zones.values():
+            min_lat, min_lng, max_lat, max_lng = zone["bbox"]
+            while ((max_lat - min_lat) / cell + 1) * ((max_lng - min_lng) / cell + 1) > MAX_CELLS_PER_ZONE:
+                cell *= 2
+        self._cell = cell
+        self._grid = {}
+        for zone_id, zone in self.zones.items():
+            for key in self._cells(zone["bbox"]):
+                self._grid.setdefault(key, []).append(zone_id)
+
+    def zones_at(self, lat: float, lng: float) -> set:
+        """Ids of the zones containing a point"""
+        key = (int(lat // self._cell), int(lng // self._cell))
+        found = set()
+        for zone_id in self._grid.get(key, ()):
+            zone = self.zones[zone_id]
+            min_lat, min_lng, max_lat, max_lng = zone["bbox"]
+            if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng and is_point_in_polygon(lat, lng, zone["polygon"]):
+                found.add(zone_id)
+        return found
+
+    # ----- membership -----
+
+    def _transition(self, user_id: str, zone_id: str, kind: str, at: datetime):
+        zone = self.zones.get(zone_id)
+        if kind == "enter":
+            self.counts[zone_id] = self.counts.get(zone_id, 0) + 1
+        else:
+            self.counts[zone_id] = max(0, self.counts.get(zone_id, 0) - 1)
+        capacity = zone.get("capacity") if zone else None
+        self.transitions.append({
+            "user_id": user_id,
+            "zone_id": zone_id,
+            "zone_name": zone["name"] if zone else None,
+            "type": kind,
+            "occupancy": self.counts[zone_id],
+            "over_capacity": capacity is not None and self.counts[zone_id] > capacity,
+            "at": at
+        })
+
+    def update(self, user_id: str, lat: float, lng: float, now: Optional[datetime] = None) -> set:
+        """Apply a heartbeat; returns the user's current zone ids"""
+        now = now or datetime.now()
+        with self.lock:
+            self.positions[user_id] = (lat, lng, now)
+            current = self.zones_at(lat, lng) if self.zones else set()
+            previous = self.members.get(user_id, set())
+            if current != previous:
+                for zone_id in previous - current:
+                    self._transition(user_id, zone_id, "exit", now)
+                for zone_id in current - previous:
+                    self._transition(user_id, zone_id, "enter", now)
+                if current:
+                    self.members[user_id] = current
+                else:
+                    self.members.pop(user_id, None)
+            return current
+
+    def _remove(self, user_id: str, now: datetime):
+        self.positions.pop(user_id, None)
+        for zone_id in self.members.pop(user_id, set()):
+            self._transition(user_id, zone_id, "exit", now)
+
+    def remove_user(self, user_id: str, now: Optional[datetime] = None):
+        """Count a user out of every zone (e.g. on checkout)"""
+        with self.lock:
+            self._remove(user_id, now or datetime.now())
+
+    def expire(self, now: Optional[datetime] = None) -> int:
+        """Count out users whose last heartbeat is older than the presence timeout"""
+        now = now or datetime.now()
+        cutoff = now - timedelta(seconds=PRESENCE_TIMEOUT_SECONDS)
+        with self.lock:
+            stale = [user_id for user_id, (_, _, seen) in self.positions.items() if seen < cutoff]
+            for user_id in stale:
+                self._remove(user_id, now)
+        return len(stale)
+
+    # ----- zone changes -----
+
+    def add_zone(self, zone: Dict[str, Any]):
+        """Register a zone and count in everyone already standing inside it"""
+        with self.lock:
+            self.zones[zone["id"]] = zone
+            self.counts[zone["id"]] = 0
+            self._rebuild_grid()
+            now = datetime.now()
+            # Attendees seen before the event had any zone are only in the location store
+            cutoff = now - timedelta(seconds=PRESENCE_TIMEOUT_SECONDS)
+            for user_id, loc in list(storage.storage.event_locations.get(self.event_id, {}).items()):
+                if user_id not in self.positions and loc.get("timestamp", datetime.min) > cutoff:
+                    self.positions[user_id] = (loc["lat"], loc["lng"], loc["timestamp"])
+            if not self.positions:
+                return
+            user_ids = list(self.positions)
+            lats = np.fromiter((self.positions[u][0] for u in user_ids), dtype=np.float64, count=len(user_ids))
+            lngs = np.fromiter((self.positions[u][1] for u in user_ids), dtype=np.float64, count=len(user_ids))
+            for i in np.nonzero(points_in_polygon(lats, lngs, zone["polygon"]))[0]:
+                self.members.setdefault(user_ids[i], set()).add(zone["id"])
+                self._transition(user_ids[i], zone["id"], "enter", now)
+
+    def remove_zone(self, zone_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            zone = self.zones.pop(zone_id, None)
+            if zone is None:
+                return None
+            self.counts.pop(zone_id, None)
+            for user_id in [u for u, zone_ids in self.members.items() if zone_id in zone_ids]:
+                self.members[user_id].discard(zone_id)
+                if not self.members[user_id]:
+                    del self.members[user_id]
+            self._rebuild_grid()
+            return zone
+
+    def export(self) -> List[Dict[str, Any]]:
+        """Zone definitions, without occupancy"""
+        with self.lock:
+            return list(self.zones.values())
+
+    def restore(self, zones: List[Dict[str, Any]]):
+        """Re-register saved zone definitions (nobody is counted in until they send a heartbeat)"""
+        with self.lock:
+            for zone in zones:
+                zone["bbox"] = tuple(zone["bbox"])
+                self.zones[zone["id"]] = zone
+                self.counts[zone["id"]] = 0
+            self._rebuild_grid()
+
+    def occupancy(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {
+                zone_id: {
+                    "name": zone["name"],
+                    "kind": zone["kind"],
+                    "count": self.counts.get(zone_id, 0),
+                    "capacity": zone.get("capacity"),
+                    "over_capacity": zone.get("capacity") is not None and self.counts.get(zone_id, 0) > zone["capacity"]
+                }
+                for zone_id, zone in self.zones.items()
+            }
+
+    def recent_transitions(self, limit: int = 100, zone_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Most recent transitions first"""
+        with self.lock:
+            items = list(self.transitions)
+        results = []
+        for item in reversed(items):
+            if zone_id is None or item["zone_id"] == zone_id:
+                results.append(item)
+                if len(results) >= limit:
+                    break
+        return results
+
+_registry_lock = threading.Lock()
+
+def index_for(event_id: str) -> ZoneIndex:
+    """Get (or lazily create) the zone index for an event"""
+    index = storage.storage.zone_indexes.get(event_id)
+    if index is None:
+        with _registry_lock:
+            index = storage.storage.zone_indexes.get(event_id)
+            if index is None:
+                index = ZoneIndex(event_id)
+                storage.storage.zone_indexes[event_id] = index
+    return index
+
+def create_zone(event_id: str, name: str, kind: str, polygon: List[Dict[str, float]],
+                capacity: Optional[int] = None) -> Dict[str, Any]:
+    """Validate and register a zone (raises ValueError on bad input)"""
+    if kind not in ZONE_KINDS:
+        raise ValueError(f"Invalid zone kind. Must be one of: {', '.join(ZONE_KINDS)}")
+    if len(polygon) < 3:
+        raise ValueError("A zone polygon needs at least 3 points")
+    if capacity is not None and capacity < 0:
+        raise ValueError("capacity must be non-negative")
+    zone = {
+        "id": str(uuid.uuid4())[:8],
+        "event_id": event_id,
+        "name": name,
+        "kind": kind,
+        "polygon": polygon,
+        "bbox": _bbox(polygon),
+        "capacity": capacity,
+        "created_at": datetime.now()
+    }
+    index_for(event_id).add_zone(zone)
+    return zone
+
+def heartbeat(event_id: str, user_id: str, lat: float, lng: float, now: Optional[datetime] = None) -> Optional[List[str]]:
+    """Heartbeat hook; returns the user's zone ids, or None when the event has no zones"""
+    index = storage.storage.zone_indexes.get(event_id)
+    if index is None:
+        return None
+    zone_ids = index.update(user_id, lat, lng, now)
+    return sorted(zone_ids) if index.zones else None
+
+def user_left(event_id: str, user_id: str):
+    index = storage.storage.zone_indexes.get(event_id)
+    if index is not None:
+        index.remove_user(user_id)
+
+def expire_stale(now: Optional[datetime] = None) -> int:
+    """Count out silent attendees across all events (called from the maintenance loop)"""
+    return sum(index.expire(now) for index in list(storage.storage.zone_indexes.values()))
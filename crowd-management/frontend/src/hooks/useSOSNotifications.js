@@ -16,8 +16,8 @@ function useSOSNotifications(eventId, enabled = true) {
     if (!eventId || !enabled) return
 
     try {
-      const res = await axios.get(`${API}/admin/events/${eventId}/alerts`)
-      const newAlerts = res.data || []
+      const res = await axios.get(`${API}/admin/events/${eventId}/alerts`, { params: { limit: 50 } })
+      const newAlerts = res.data.alerts || []
       
       // Check for new SOS alerts
       const previousAlerts = previousAlertsRef.current
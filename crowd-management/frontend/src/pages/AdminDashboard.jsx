@@ -91,6 +91,7 @@ function AdminDashboard() {
   const [events, setEvents] = useState([])
   const [selectedEvent, setSelectedEvent] = useState(null)
   const [eventUsers, setEventUsers] = useState([])
+  const [eventUserTotal, setEventUserTotal] = useState(0)
   const [userLocations, setUserLocations] = useState([])
   const [showCreateModal, setShowCreateModal] = useState(false)
   const [sidebarCollapsed, setSidebarCollapsed] = useState(false)
@@ -157,8 +158,9 @@ function AdminDashboard() {
   
   const loadEventUsers = async (eventId) => {
     try {
-      const res = await axios.get(`${API}/events/${eventId}/users`)
-      setEventUsers(res.data)
+      const res = await axios.get(`${API}/events/${eventId}/users`, { params: { limit: 200 } })
+      setEventUsers(res.data.users)
+      setEventUserTotal(res.data.total)
     } catch (e) {
       console.log('Error loading users:', e)
     }
@@ -319,7 +321,7 @@ function AdminDashboard() {
                     {selectedEvent.description && <p>{selectedEvent.description}</p>}
                     <div className="event-stats">
                       <div className="stat">
-                        <span className="stat-value">{eventUsers.length}</span>
+                        <span className="stat-value">{eventUserTotal}</span>
                         <span className="stat-label">Users</span>
                       </div>
                       <div className="stat">
@@ -94,6 +94,7 @@ function UserDashboard() {
   const [userLocation, setUserLocation] = useState(null)
   const [mapCenter, setMapCenter] = useState([40.7128, -74.0060])
   const [eventUsers, setEventUsers] = useState([])
+  const [eventUserTotal, setEventUserTotal] = useState(0)
   const [userLocations, setUserLocations] = useState([])
   const [showHeatmap, setShowHeatmap] = useState(true)
   const [locationStatus, setLocationStatus] = useState('detecting')
@@ -192,11 +193,12 @@ function UserDashboard() {
   
   const loadEventUsers = async (eventId) => {
     try {
-      const res = await axios.get(`${API}/events/${eventId}/users`)
-      setEventUsers(res.data)
+      const res = await axios.get(`${API}/events/${eventId}/users`, { params: { limit: 200 } })
+      setEventUsers(res.data.users)
+      setEventUserTotal(res.data.total)
       
       // Find and set user name if not set
-      const me = res.data.find(u => u.id === userId)
+      const me = res.data.users.find(u => u.id === userId)
       if (me && !userName) {
         setUserName(me.name)
         localStorage.setItem(`user_name_${eventId}_${userId}`, me.name)
@@ -298,7 +300,7 @@ function UserDashboard() {
                 <h3>Crowd Stats</h3>
                 <div className="stats-grid">
                   <div className="stat-card">
-                    <span className="stat-value">{eventUsers.length}</span>
+                    <span className="stat-value">{eventUserTotal}</span>
                     <span className="stat-label">Total</span>
                   </div>
                   <div className="stat-card nearby">
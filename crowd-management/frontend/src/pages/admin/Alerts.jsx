@@ -7,7 +7,9 @@ const API = 'http://localhost:8000/api'
 
 function Alerts() {
   const { eventId } = useParams()
-  const [alerts, setAlerts] = useState([])
+  const [activeAlerts, setActiveAlerts] = useState([])
+  const [resolvedAlerts, setResolvedAlerts] = useState([])
+  const [stats, setStats] = useState(null)
   const [loading, setLoading] = useState(true)
   
   useEffect(() => {
@@ -18,8 +20,15 @@ function Alerts() {
   
   const loadAlerts = async () => {
     try {
-      const res = await axios.get(`${API}/admin/events/${eventId}/alerts`)
-      setAlerts(res.data || [])
+      // Only fetch the newest page of each list; totals come from the stats counters
+      const [activeRes, resolvedRes, statsRes] = await Promise.all([
+        axios.get(`${API}/admin/events/${eventId}/alerts`, { params: { status: 'active', limit: 200 } }),
+        axios.get(`${API}/admin/events/${eventId}/alerts`, { params: { status: 'resolved', limit: 50 } }),
+        axios.get(`${API}/admin/alerts/stats/${eventId}`)
+      ])
+      setActiveAlerts(activeRes.data.alerts || [])
+      setResolvedAlerts(resolvedRes.data.alerts || [])
+      setStats(statsRes.data)
     } catch (e) {
       console.log('Error loading alerts:', e)
     } finally {
@@ -58,8 +67,8 @@ function Alerts() {
     return date.toLocaleDateString()
   }
   
-  const activeAlerts = alerts.filter(a => a.status === 'active')
-  const resolvedAlerts = alerts.filter(a => a.status === 'resolved')
+  const activeCount = stats ? stats.active_alerts : activeAlerts.length
+  const resolvedCount = stats ? (stats.by_status?.resolved || 0) : resolvedAlerts.length
   
   if (loading) return <div className="alerts-page loading">Loading...</div>
   
@@ -68,14 +77,14 @@ function Alerts() {
       <div className="page-header">
         <h2>Alert Management</h2>
         <div className="alert-summary">
-          <span className="active-count">{activeAlerts.length} Active</span>
-          <span className="resolved-count">{resolvedAlerts.length} Resolved</span>
+          <span className="active-count">{activeCount} Active</span>
+          <span className="resolved-count">{resolvedCount} Resolved</span>
         </div>
       </div>
       
       <div className="alerts-sections">
         <section className="alert-section">
-          <h3>🚨 Active Alerts ({activeAlerts.length})</h3>
+          <h3>🚨 Active Alerts ({activeCount})</h3>
           {activeAlerts.length === 0 ? (
             <p className="empty-message">No active alerts</p>
           ) : (
@@ -108,7 +117,7 @@ function Alerts() {
         </section>
         
         <section className="alert-section">
-          <h3>✅ Resolved Alerts ({resolvedAlerts.length})</h3>
+          <h3>✅ Resolved Alerts ({resolvedCount})</h3>
           {resolvedAlerts.length === 0 ? (
             <p className="empty-message">No resolved alerts</p>
           ) : (
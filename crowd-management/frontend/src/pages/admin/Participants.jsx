@@ -1,24 +1,39 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { useParams } from 'react-router-dom'
 import axios from 'axios'
 import './Participants.css'
 
 const API = 'http://localhost:8000/api'
+const PAGE_SIZE = 50
 
 function Participants() {
   const { eventId } = useParams()
   const [participants, setParticipants] = useState([])
+  const [counts, setCounts] = useState({})
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(true)
   const [search, setSearch] = useState('')
+  const [status, setStatus] = useState('')
+  const requestId = useRef(0)
   
+  // Search and filtering happen on the server; wait for typing to pause
   useEffect(() => {
-    loadParticipants()
-  }, [eventId])
+    const timer = setTimeout(() => loadParticipants(), search ? 250 : 0)
+    return () => clearTimeout(timer)
+  }, [eventId, search, status])
   
-  const loadParticipants = async () => {
+  const loadParticipants = async (cursor = null) => {
+    const id = ++requestId.current
     try {
-      const res = await axios.get(`${API}/admin/events/${eventId}/participants`)
-      setParticipants(res.data)
+      const params = { limit: PAGE_SIZE }
+      if (search.trim()) params.q = search.trim()
+      if (status) params.status = status
+      if (cursor) params.cursor = cursor
+      const res = await axios.get(`${API}/admin/events/${eventId}/participants`, { params })
+      if (id !== requestId.current) return  // a newer search superseded this one
+      setParticipants(prev => cursor ? [...prev, ...res.data.participants] : res.data.participants)
+      setNextCursor(res.data.next_cursor)
+      setCounts(res.data.counts || {})
     } catch (e) {
       console.log('Error loading participants:', e)
     } finally {
@@ -26,10 +41,24 @@ function Participants() {
     }
   }
   
+  const updateParticipant = (updated) => {
+    setParticipants(prev => prev.map(p => p.id === updated.id ? updated : p))
+  }
+  
+  const refreshCounts = async () => {
+    try {
+      const res = await axios.get(`${API}/admin/events/${eventId}/participants`, { params: { limit: 1 } })
+      setCounts(res.data.counts || {})
+    } catch (e) {
+      console.log('Error loading participant counts:', e)
+    }
+  }
+  
   const handleCheckIn = async (userId) => {
     try {
-      await axios.put(`${API}/admin/events/${eventId}/participants/${userId}/checkin`)
-      loadParticipants()
+      const res = await axios.put(`${API}/admin/events/${eventId}/participants/${userId}/checkin`)
+      updateParticipant(res.data)
+      refreshCounts()
     } catch (e) {
       console.log('Error checking in:', e)
     }
@@ -37,18 +66,14 @@ function Participants() {
   
   const handleCheckOut = async (userId) => {
     try {
-      await axios.put(`${API}/admin/events/${eventId}/participants/${userId}/checkout`)
-      loadParticipants()
+      const res = await axios.put(`${API}/admin/events/${eventId}/participants/${userId}/checkout`)
+      updateParticipant(res.data)
+      refreshCounts()
     } catch (e) {
       console.log('Error checking out:', e)
     }
   }
   
-  const filteredParticipants = participants.filter(p => 
-    p.name.toLowerCase().includes(search.toLowerCase()) ||
-    (p.phone && p.phone.includes(search))
-  )
-  
   const formatTime = (timeStr) => {
     if (!timeStr) return '-'
     return new Date(timeStr).toLocaleTimeString('en-IN', {
@@ -66,9 +91,15 @@ function Participants() {
       <div className="page-header">
         <h2>Participants</h2>
         <div className="search-box">
+          <select value={status} onChange={(e) => setStatus(e.target.value)}>
+            <option value="">All</option>
+            <option value="active">Active</option>
+            <option value="checked_in">Checked In</option>
+            <option value="checked_out">Checked Out</option>
+          </select>
           <input
             type="text"
-            placeholder="Search by name or phone..."
+            placeholder="Search by name, phone or email..."
             value={search}
             onChange={(e) => setSearch(e.target.value)}
           />
@@ -77,24 +108,24 @@ function Participants() {
       
       <div className="participants-stats">
         <div className="stat">
-          <span className="value">{participants.length}</span>
+          <span className="value">{counts.total ?? 0}</span>
           <span className="label">Total</span>
         </div>
         <div className="stat">
-          <span className="value">{participants.filter(p => p.status === 'checked_in').length}</span>
+          <span className="value">{counts.checked_in ?? 0}</span>
           <span className="label">Checked In</span>
         </div>
         <div className="stat">
-          <span className="value">{participants.filter(p => p.status === 'active').length}</span>
+          <span className="value">{counts.active ?? 0}</span>
           <span className="label">Active</span>
         </div>
       </div>
       
       <div className="participants-list">
-        {filteredParticipants.length === 0 ? (
+        {participants.length === 0 ? (
           <div className="empty">No participants found</div>
         ) : (
-          filteredParticipants.map(p => (
+          participants.map(p => (
             <div key={p.id} className="participant-card">
               <div className="participant-info">
                 <div className="participant-avatar">{p.name[0]}</div>
@@ -122,6 +153,11 @@ function Participants() {
             </div>
           ))
         )}
+        {nextCursor && (
+          <button className="load-more" onClick={() => loadParticipants(nextCursor)}>
+            Load more
+          </button>
+        )}
       </div>
     </div>
   )